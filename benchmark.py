@@ -0,0 +1,283 @@
+"""
+Benchmark for the headless tagging path.
+
+Generate a reproducible corpus of synthetic scans, then time imports of it:
+
+    python benchmark.py generate bench_corpus --sizes 1 6 24 --count 10
+    python benchmark.py run bench_corpus --workers 8 --save-baseline
+    python benchmark.py run bench_corpus --workers 8          # compares with the baseline
+
+The corpus has one folder per (format, size, EXIF shape) group, e.g.
+jpeg_24mp_vendor/. For each group the benchmark reports files/s, MB/s,
+peak RSS and the p50/p99 single-file latency, and flags groups that got
+slower than the stored baseline. Peak RSS is the process high-water mark so
+far, so it only grows from one group to the next.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import piexif
+from PIL import Image
+
+import scanner
+import tagging
+
+FORMATS = ("jpeg", "tiff")
+SHAPES = ("none", "minimal", "vendor", "broken")
+DEFAULT_SIZES = (1, 6, 24, 60)
+DEFAULT_BASELINE = "benchmark_baseline.json"
+# A group is reported as a regression when its files/s drops by more than this.
+DEFAULT_TOLERANCE = 0.10
+LATENCY_SAMPLE = 20
+
+BENCH_DATE = b"1985:07:14 00:00:00"
+BENCH_GPS = (48.8566, 2.3522)
+
+
+## Corpus generation
+def synthetic_image(megapixels, seed):
+    """A deterministic 3:2 RGB image with some texture, so JPEG sizes are realistic."""
+    width = int((megapixels * 1_000_000 * 1.5) ** 0.5)
+    height = int(width / 1.5)
+    rng = random.Random(seed)
+    tile = Image.frombytes("RGB", (64, 48), rng.randbytes(64 * 48 * 3))
+    return tile.resize((width, height), Image.BICUBIC)
+
+
+def synthetic_exif(shape, seed):
+    """Returns EXIF bytes for an EXIF shape, or None for 'none'."""
+    if shape == "none":
+        return None
+    exif = {
+        "0th": {piexif.ImageIFD.Make: b"BenchScan", piexif.ImageIFD.Model: b"Flatbed 9000",
+                piexif.ImageIFD.DateTime: b"2024:01:01 12:00:00"},
+        "Exif": {},
+    }
+    if shape == "vendor":
+        rng = random.Random(seed)
+        exif["0th"].update({
+            piexif.ImageIFD.Software: b"VendorScan Pro 12.4.1",
+            piexif.ImageIFD.Artist: b"Bench",
+            piexif.ImageIFD.ImageDescription: b"x" * 2000,
+            piexif.ImageIFD.XResolution: (600, 1),
+            piexif.ImageIFD.YResolution: (600, 1),
+        })
+        exif["Exif"].update({
+            piexif.ExifIFD.MakerNote: rng.randbytes(30_000),
+            piexif.ExifIFD.UserComment: b"ASCII\x00\x00\x00" + b"c" * 500,
+            piexif.ExifIFD.ExposureTime: (1, 125),
+            piexif.ExifIFD.FNumber: (8, 1),
+            piexif.ExifIFD.ISOSpeedRatings: 100,
+            piexif.ExifIFD.SceneType: b"\x01",
+            piexif.ExifIFD.FileSource: b"\x03",
+        })
+        thumb = io.BytesIO()
+        synthetic_image(0.02, seed).save(thumb, format="JPEG", quality=70)
+        exif["thumbnail"] = thumb.getvalue()
+        exif["1st"] = {piexif.ImageIFD.Compression: 6}
+    if shape == "broken":
+        exif["Exif"].update({piexif.ExifIFD.SceneType: b"\x01", piexif.ExifIFD.FileSource: b"\x03"})
+    data = piexif.dump(exif)
+    if shape == "broken":
+        # Store SceneType/FileSource as BYTE instead of UNDEFINED, like some scanner
+        # software does; piexif then loads them as int (the case tagging fixes up).
+        data = data.replace(b"\xa3\x01\x00\x07", b"\xa3\x01\x00\x01")
+        data = data.replace(b"\xa3\x00\x00\x07", b"\xa3\x00\x00\x01")
+    return data
+
+
+def group_name(fmt, megapixels, shape):
+    return f"{fmt}_{megapixels:g}mp_{shape}"
+
+
+def generate_corpus(directory, sizes=DEFAULT_SIZES, count=5, formats=FORMATS, shapes=SHAPES, seed=1):
+    """Writes the corpus; the same arguments always give the same files."""
+    for fmt in formats:
+        for megapixels in sizes:
+            base = synthetic_image(megapixels, seed + int(megapixels * 1000))
+            for shape in shapes:
+                group_dir = os.path.join(directory, group_name(fmt, megapixels, shape))
+                os.makedirs(group_dir, exist_ok=True)
+                for i in range(count):
+                    exif = synthetic_exif(shape, seed + i)
+                    # Vary the pixels a little per file so duplicates don't look identical.
+                    image = base.rotate(180) if i % 2 else base
+                    options = {"exif": exif} if exif else {}
+                    if fmt == "jpeg":
+                        image.save(os.path.join(group_dir, f"scan_{i:04d}.jpg"), quality=92, **options)
+                    else:
+                        image.save(os.path.join(group_dir, f"scan_{i:04d}.tif"), **options)
+                print(f"  {group_dir}: {count} files")
+
+
+## Measuring
+def peak_rss_mb():
+    """Peak resident memory of this process and its finished children, in MB."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # ru_maxrss is in KB on Linux and in bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return max(own, children) / scale
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    lower = int(k)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (k - lower)
+
+
+def measure_latency(files, out_dir, exif_gps_dict):
+    """Per-file latency of the tagging path (read, build, write) without queueing effects."""
+    latencies = []
+    for item in files[:LATENCY_SAMPLE]:
+        dest = os.path.join(out_dir, "latency_" + os.path.basename(item.path))
+        start = time.perf_counter()
+        tagging.tag_file(item.path, dest, BENCH_DATE, exif_gps_dict)
+        latencies.append((time.perf_counter() - start) * 1000)
+        os.remove(dest)
+    return latencies
+
+
+def run_group(group_dir, workers, pool_kind, repeat=3, verify=True):
+    """Imports a group `repeat` times into a scratch album and keeps the fastest run."""
+    files = list(scanner.scan_images(group_dir))
+    total_bytes = sum(item.size for item in files)
+    work_dir = tempfile.mkdtemp(prefix="phototagger-bench-")
+    try:
+        elapsed = None
+        for attempt in range(repeat):
+            album = os.path.join(work_dir, f"album_{attempt}")
+            os.makedirs(album)
+            start = time.perf_counter()
+            summary = tagging.run_batch(group_dir, album, BENCH_DATE, BENCH_GPS,
+                                        workers=workers, pool_kind=pool_kind, resume=False, verify=verify)
+            run_time = time.perf_counter() - start
+            elapsed = run_time if elapsed is None else min(elapsed, run_time)
+            shutil.rmtree(album, ignore_errors=True)
+        latencies = measure_latency(files, work_dir, tagging.convert_gps_to_exif(*BENCH_GPS))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    rss = peak_rss_mb()
+    return {
+        "files": len(files),
+        "errors": len(summary["errors"]),
+        "seconds": round(elapsed, 4),
+        "files_per_s": round(len(files) / elapsed, 2) if elapsed else None,
+        "mb_per_s": round(total_bytes / (1024 * 1024) / elapsed, 2) if elapsed else None,
+        "p50_ms": round(percentile(latencies, 50), 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 99), 2) if latencies else None,
+        "peak_rss_mb": round(rss, 1) if rss is not None else None,
+    }
+
+
+def run_benchmark(corpus_dir, workers, pool_kind, repeat=3, verify=True):
+    results = {}
+    for name in sorted(os.listdir(corpus_dir)):
+        group_dir = os.path.join(corpus_dir, name)
+        if not os.path.isdir(group_dir):
+            continue
+        results[name] = run_group(group_dir, workers, pool_kind, repeat, verify)
+        r = results[name]
+        print(f"{name:28} {r['files']:5d} files  {r['files_per_s'] or 0:8.1f} files/s  "
+              f"{r['mb_per_s'] or 0:8.1f} MB/s  p50 {r['p50_ms'] or 0:7.1f} ms  "
+              f"p99 {r['p99_ms'] or 0:7.1f} ms  RSS {r['peak_rss_mb'] or 0:7.1f} MB"
+              + (f"  ({r['errors']} errors)" if r["errors"] else ""))
+    return results
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Prints the change against the baseline. Returns the names of regressed groups."""
+    regressions = []
+    print("\nCompared with baseline:")
+    for name, r in results.items():
+        base = baseline.get("results", {}).get(name)
+        if not base or not base.get("files_per_s") or not r.get("files_per_s"):
+            print(f"  {name:28} (no baseline)")
+            continue
+        change = r["files_per_s"] / base["files_per_s"] - 1
+        flag = ""
+        if change < -tolerance:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"  {name:28} {change:+7.1%} files/s{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tagging benchmark with a synthetic scan corpus.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    gen = sub.add_parser("generate", help="Generate a synthetic corpus")
+    gen.add_argument("directory")
+    gen.add_argument("--sizes", nargs="+", type=float, default=list(DEFAULT_SIZES), help="Megapixels")
+    gen.add_argument("--count", type=int, default=5, help="Files per group")
+    gen.add_argument("--formats", nargs="+", choices=FORMATS, default=list(FORMATS))
+    gen.add_argument("--shapes", nargs="+", choices=SHAPES, default=list(SHAPES))
+    gen.add_argument("--seed", type=int, default=1)
+
+    run = sub.add_parser("run", help="Benchmark the tagging path on a corpus")
+    run.add_argument("directory")
+    run.add_argument("--workers", type=int, default=tagging.default_worker_count())
+    run.add_argument("--processes", action="store_true", help="Use a process pool")
+    run.add_argument("--repeat", type=int, default=3, help="Runs per group; the fastest one counts")
+    run.add_argument("--no-verify", action="store_true", help="Don't read the outputs back (to measure its cost)")
+    run.add_argument("--baseline", default=DEFAULT_BASELINE)
+    run.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline")
+    run.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                     help="Allowed files/s drop before a group counts as a regression (0.10 = 10%%)")
+    run.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args(argv)
+
+    if args.command == "generate":
+        print(f"Generating corpus in {args.directory}...")
+        generate_corpus(args.directory, args.sizes, args.count, args.formats, args.shapes, args.seed)
+        return 0
+
+    pool_kind = tagging.POOL_PROCESSES if args.processes else tagging.POOL_THREADS
+    print(f"Benchmarking {args.directory} with {args.workers} {pool_kind}...")
+    results = run_benchmark(args.directory, args.workers, pool_kind, args.repeat, verify=not args.no_verify)
+    report = {
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "machine": {"python": platform.python_version(), "platform": platform.platform(),
+                    "cpus": os.cpu_count()},
+        "workers": args.workers,
+        "pool": pool_kind,
+        "repeat": args.repeat,
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+        return 0
+    if os.path.isfile(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
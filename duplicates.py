@@ -0,0 +1,308 @@
+"""
+Persistent perceptual-hash index of the photos in an Albums directory.
+
+Every photo gets a 64-bit DCT hash (pHash) computed from a small
+grayscale version of the image; JPEGs are decoded in draft mode at 1/2 to
+1/8 scale, so hashing costs a few milliseconds. Re-scans of the same print
+hash to nearly the same value, so an incoming photo is a duplicate when an
+indexed photo is within a few bits (Hamming distance) of it.
+
+Lookups use a multi-index: each hash is split into DISTANCE_CHUNKS chunks
+and indexed by every chunk value. Two hashes within distance d <
+DISTANCE_CHUNKS share at least one chunk exactly, so only the photos in the
+matching buckets are compared (with NumPy), not the whole index.
+
+The index is stored in SQLite next to the albums and updated as imports
+land; `python duplicates.py update ALBUMS_DIR` catches up with photos added
+or removed by other tools.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+import numpy as np
+
+import scanner
+
+INDEX_FILENAME = ".photo-tagger-duplicates.sqlite"
+# Photos whose hashes differ by at most this many bits are duplicates.
+DEFAULT_MAX_DISTANCE = 4
+# Must be above the largest max_distance used, for the lookup to find every match.
+DISTANCE_CHUNKS = 5
+# The in-memory index is rebuilt once it has more slots of removed or
+# replaced photos than live ones (and at least this many).
+COMPACT_MIN_DEAD = 1024
+SAMPLE_SIZE = 32
+HASH_BITS = 8  # per side: an 8x8 block of DCT coefficients, 64 bits
+
+_CHUNK_BITS = [64 // DISTANCE_CHUNKS + (1 if i < 64 % DISTANCE_CHUNKS else 0) for i in range(DISTANCE_CHUNKS)]
+_CHUNK_SHIFTS = [sum(_CHUNK_BITS[i + 1:]) for i in range(DISTANCE_CHUNKS)]
+
+
+def _dct_matrix(n):
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    matrix[0] /= np.sqrt(2)
+    return matrix.astype(np.float32)
+
+
+_DCT = _dct_matrix(SAMPLE_SIZE)
+
+
+def image_hash(path):
+    """64-bit perceptual hash of an image file, as an int."""
+    from PIL import Image
+    with Image.open(path) as img:
+        # JPEG only: decode at the smallest scale that is still at least this big.
+        img.draft("L", (SAMPLE_SIZE * 2, SAMPLE_SIZE * 2))
+        small = img.convert("L").resize((SAMPLE_SIZE, SAMPLE_SIZE), Image.BOX)
+    pixels = np.asarray(small, dtype=np.float32)
+    low = (_DCT @ pixels @ _DCT.T)[:HASH_BITS, :HASH_BITS].ravel()
+    # Compare with the median of the coefficients, leaving out the DC term (overall brightness).
+    bits = low > np.median(low[1:])
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def _popcount(values):
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+    return np.unpackbits(values.view(np.uint8)).reshape(-1, 64).sum(axis=1)
+
+
+def _to_signed(value):
+    """SQLite integers are signed 64-bit."""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _check_max_distance(max_distance):
+    if not 0 <= max_distance < DISTANCE_CHUNKS:
+        raise ValueError(f"max_distance must be between 0 and {DISTANCE_CHUNKS - 1}, not {max_distance}.")
+
+
+def _hash_item(item):
+    try:
+        return image_hash(item.path)
+    except Exception:
+        return None
+
+
+class DuplicateIndex:
+    """
+    In-memory multi-index over the hashes stored in SQLite. Safe to share
+    between the pipeline's coordinator (lookups, adds) and its I/O stage
+    (records once outputs are committed).
+    """
+
+    def __init__(self, root, max_distance=DEFAULT_MAX_DISTANCE):
+        _check_max_distance(max_distance)
+        self.root = os.path.abspath(root)
+        self.max_distance = max_distance
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(os.path.join(self.root, INDEX_FILENAME), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS photos ("
+            " rel_path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, phash INTEGER)")
+        self.paths = []
+        self.hashes = np.zeros(1024, dtype=np.uint64)
+        self.positions = {}
+        self.buckets = [{} for _ in range(DISTANCE_CHUNKS)]
+        self.dead = 0
+        for rel_path, phash in self.conn.execute("SELECT rel_path, phash FROM photos"):
+            self._insert(rel_path, phash & 0xFFFFFFFFFFFFFFFF)
+
+    @classmethod
+    def for_root(cls, albums_dir):
+        return cls(albums_dir)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def _rel(self, path):
+        return os.path.relpath(os.path.abspath(path), self.root)
+
+    ## In-memory index
+    def _insert(self, rel_path, phash):
+        if rel_path in self.positions:
+            self._discard(rel_path)
+        position = len(self.paths)
+        if position == len(self.hashes):
+            self.hashes = np.concatenate([self.hashes, np.zeros(len(self.hashes), dtype=np.uint64)])
+        self.paths.append(rel_path)
+        self.hashes[position] = phash
+        self.positions[rel_path] = position
+        for i, shift in enumerate(_CHUNK_SHIFTS):
+            chunk = (phash >> shift) & ((1 << _CHUNK_BITS[i]) - 1)
+            self.buckets[i].setdefault(chunk, []).append(position)
+
+    def _discard(self, rel_path):
+        # Bucket entries of removed photos are skipped at lookup time, until the next compaction.
+        position = self.positions.pop(rel_path, None)
+        if position is not None:
+            self.paths[position] = None
+            self.dead += 1
+            if self.dead >= COMPACT_MIN_DEAD and self.dead > len(self.positions):
+                self._compact()
+
+    def _compact(self):
+        """Rebuilds the arrays and buckets from the live photos only."""
+        live = [(rel_path, int(self.hashes[position])) for rel_path, position in self.positions.items()]
+        self.paths = []
+        self.hashes = np.zeros(max(1024, len(live) * 2), dtype=np.uint64)
+        self.positions = {}
+        self.buckets = [{} for _ in range(DISTANCE_CHUNKS)]
+        self.dead = 0
+        for rel_path, phash in live:
+            self._insert(rel_path, phash)
+
+    def find(self, phash, max_distance=None, ignore=()):
+        """
+        The indexed photo closest to phash within max_distance bits (default:
+        the index's), as (absolute path, distance), or None. Paths in `ignore`
+        don't count.
+        """
+        if max_distance is None:
+            max_distance = self.max_distance
+        _check_max_distance(max_distance)
+        ignored = {self._rel(p) for p in ignore}
+        with self.lock:
+            candidates = set()
+            for i, shift in enumerate(_CHUNK_SHIFTS):
+                chunk = (phash >> shift) & ((1 << _CHUNK_BITS[i]) - 1)
+                candidates.update(self.buckets[i].get(chunk, ()))
+            candidates = [p for p in candidates if self.paths[p] is not None and self.paths[p] not in ignored]
+            if not candidates:
+                return None
+            positions = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+            distances = _popcount(self.hashes[positions] ^ np.uint64(phash))
+            best = int(np.argmin(distances))
+            if distances[best] > max_distance:
+                return None
+            return os.path.join(self.root, self.paths[positions[best]]), int(distances[best])
+
+    def distance(self, path, phash):
+        """Hamming distance between phash and an indexed photo, or None if it isn't indexed."""
+        with self.lock:
+            position = self.positions.get(self._rel(path))
+            if position is None:
+                return None
+            return int(_popcount(np.array([self.hashes[position] ^ np.uint64(phash)], dtype=np.uint64))[0])
+
+    ## Updates
+    def add(self, path, phash):
+        """Adds a photo that is about to land in the albums (lookups see it right away)."""
+        with self.lock:
+            self._insert(self._rel(path), phash)
+
+    def record(self, path):
+        """Persists a photo added with add() once it is on disk."""
+        rel_path = self._rel(path)
+        with self.lock:
+            position = self.positions.get(rel_path)
+            if position is None:
+                return
+            try:
+                st = os.stat(path)
+            except OSError:
+                self._discard(rel_path)
+                return
+            self.conn.execute("INSERT OR REPLACE INTO photos VALUES (?, ?, ?, ?)",
+                              (rel_path, st.st_size, st.st_mtime_ns, _to_signed(int(self.hashes[position]))))
+
+    def remove(self, path):
+        rel_path = self._rel(path)
+        with self.lock:
+            self._discard(rel_path)
+            self.conn.execute("DELETE FROM photos WHERE rel_path = ?", (rel_path,))
+
+    def refresh(self, directory=None, map_func=map):
+        """
+        Brings the index up to date with a directory under the root (default:
+        the whole root): hashes new or changed photos, forgets removed ones.
+        map_func can be an executor's map to hash in parallel.
+        Returns (hashed, removed) counts.
+        """
+        directory = os.path.abspath(directory or self.root)
+        prefix = self._rel(directory)
+        prefix = "" if prefix == "." else prefix + os.sep
+        with self.lock:
+            known = {rel: (size, mtime_ns) for rel, size, mtime_ns in self.conn.execute(
+                "SELECT rel_path, size, mtime_ns FROM photos WHERE substr(rel_path, 1, ?) = ?",
+                (len(prefix), prefix))}
+        seen = set()
+        stale = []
+        for item in scanner.scan_images(directory):
+            rel_path = prefix + item.rel_path
+            seen.add(rel_path)
+            if known.get(rel_path) != (item.size, item.mtime_ns):
+                stale.append((rel_path, item))
+
+        hashed = 0
+        for (rel_path, item), phash in zip(stale, map_func(_hash_item, [item for _, item in stale])):
+            if phash is None:
+                continue
+            with self.lock:
+                self._insert(rel_path, phash)
+                self.conn.execute("INSERT OR REPLACE INTO photos VALUES (?, ?, ?, ?)",
+                                  (rel_path, item.size, item.mtime_ns, _to_signed(phash)))
+            hashed += 1
+        removed = [rel for rel in known if rel not in seen]
+        with self.lock:
+            for rel_path in removed:
+                self._discard(rel_path)
+                self.conn.execute("DELETE FROM photos WHERE rel_path = ?", (rel_path,))
+            self.conn.commit()
+        return hashed, len(removed)
+
+    def commit(self):
+        with self.lock:
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.commit()
+            self.conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Perceptual-hash duplicate index of an Albums directory.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    update = sub.add_parser("update", help="Index new and changed photos, forget removed ones")
+    update.add_argument("albums_dir")
+    update.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    find = sub.add_parser("find", help="List the indexed duplicates of photos")
+    find.add_argument("albums_dir")
+    find.add_argument("photos", nargs="+")
+    find.add_argument("--max-distance", type=int, default=DEFAULT_MAX_DISTANCE)
+    args = parser.parse_args(argv)
+    if args.command == "find":
+        try:
+            _check_max_distance(args.max_distance)
+        except ValueError as e:
+            parser.error(str(e))
+
+    index = DuplicateIndex.for_root(args.albums_dir)
+    try:
+        if args.command == "update":
+            from concurrent.futures import ProcessPoolExecutor
+            start = time.perf_counter()
+            with ProcessPoolExecutor(max_workers=args.workers) as executor:
+                hashed, removed = index.refresh(map_func=lambda f, items: executor.map(f, items, chunksize=16))
+            print(f"Indexed {hashed} photos, removed {removed}, {len(index)} in total "
+                  f"({time.perf_counter() - start:.1f} s).")
+        else:
+            for photo in args.photos:
+                match = index.find(image_hash(photo), args.max_distance, ignore=(photo,))
+                print(f"{photo}: " + (f"duplicate of {match[0]} (distance {match[1]})" if match else "no duplicate"))
+    finally:
+        index.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
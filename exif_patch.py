@@ -0,0 +1,210 @@
+"""
+In-place EXIF date (and GPS) patching.
+
+DateTimeOriginal and DateTimeDigitized are fixed-length ASCII fields (19
+characters plus a NUL). When a photo already has them, retagging only has to
+overwrite those 20 bytes in the existing file instead of rebuilding the EXIF
+block and writing a whole new copy. GPS is patched the same way when the
+file's GPS IFD already holds exactly the tags we write, with the same types
+and sizes.
+
+Only the header is read and only the changed bytes are written (positioned
+writes). Anything that would need the IFDs to grow raises PatchError, and
+the caller falls back to the full rewrite.
+"""
+import os
+import struct
+
+import jpeg_splice
+import scanner
+
+TIFF_EXTENSIONS = ('.tif', '.tiff')
+
+_EXIF_IFD_POINTER = 0x8769
+_GPS_IFD_POINTER = 0x8825
+_DATE_TIME_ORIGINAL = 0x9003
+_DATE_TIME_DIGITIZED = 0x9004
+_EXIF_DATE_LENGTH = 20
+
+_ASCII = 2
+_RATIONAL = 5
+# struct codes of the TIFF field types we can encode (a RATIONAL is two LONGs)
+_PACK_CODES = {1: "B", 3: "H", 4: "L", 5: "L", 7: "B"}
+# Size in bytes of one value, per TIFF field type
+_TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8}
+
+
+class PatchError(ValueError):
+    """Raised when a file cannot be patched in place (the caller rewrites it instead)."""
+
+
+class _TiffBlock:
+    """
+    A TIFF structure inside a file: the whole file for TIFF images, the APP1
+    payload for JPEG. Offsets are relative to the TIFF header; `data` holds
+    the block when it is small enough to have been read in one go.
+    """
+
+    def __init__(self, f, base, data=None):
+        self.f = f
+        self.base = base
+        self.data = data
+        header = self.read(0, 8)
+        if header[:2] == b"II":
+            self.order = "<"
+        elif header[:2] == b"MM":
+            self.order = ">"
+        else:
+            raise PatchError("Invalid TIFF byte order.")
+        magic, self.ifd0 = struct.unpack(self.order + "HL", header[2:8])
+        if magic != 42:
+            raise PatchError("Invalid TIFF header.")
+
+    def read(self, offset, size):
+        if self.data is not None:
+            chunk = self.data[offset:offset + size]
+        else:
+            self.f.seek(self.base + offset)
+            chunk = self.f.read(size)
+        if len(chunk) != size:
+            raise PatchError(f"EXIF data truncated at offset {offset}.")
+        return chunk
+
+    def entries(self, ifd_offset):
+        """Returns {tag: (type, count, value_offset)} for one IFD."""
+        (count,) = struct.unpack(self.order + "H", self.read(ifd_offset, 2))
+        raw = self.read(ifd_offset + 2, count * 12)
+        entries = {}
+        for i in range(count):
+            tag, typ, n = struct.unpack(self.order + "HHL", raw[i * 12:i * 12 + 8])
+            value_offset = ifd_offset + 2 + i * 12 + 8
+            if _TYPE_SIZES.get(typ, 0) * n > 4:
+                (value_offset,) = struct.unpack(self.order + "L", raw[i * 12 + 8:i * 12 + 12])
+            entries[tag] = (typ, n, value_offset)
+        return entries
+
+    def pointer(self, entries, tag):
+        if tag not in entries:
+            return None
+        _, _, value_offset = entries[tag]
+        (offset,) = struct.unpack(self.order + "L", self.read(value_offset, 4))
+        return offset
+
+
+def _encode(order, typ, count, value):
+    """Encodes a piexif-style value as `count` values of TIFF type `typ`, or None if it doesn't fit."""
+    if typ == _ASCII:
+        data = value if value.endswith(b"\x00") else value + b"\x00"
+        return data if len(data) == count else None
+    if isinstance(value, bytes):
+        values = list(value)
+    elif isinstance(value, int):
+        values = [value]
+    else:
+        values = list(value)
+    if typ == _RATIONAL:
+        values = [part for pair in values for part in pair]
+        count *= 2
+    if typ not in _PACK_CODES or len(values) != count:
+        return None
+    try:
+        return struct.pack(order + _PACK_CODES[typ] * count, *values)
+    except struct.error:
+        return None
+
+
+def plan_patch(block, exif_date, exif_gps_dict):
+    """
+    Works out the writes for the date and GPS tags.
+    Returns a list of (offset in block, new bytes); raises PatchError if the
+    tags are missing or don't have room for the new values.
+    """
+    if len(exif_date) != _EXIF_DATE_LENGTH - 1:
+        raise PatchError("Unexpected EXIF date length.")
+    ifd0 = block.entries(block.ifd0)
+    exif_ifd = block.pointer(ifd0, _EXIF_IFD_POINTER)
+    if exif_ifd is None:
+        raise PatchError("No EXIF IFD.")
+    exif_entries = block.entries(exif_ifd)
+
+    writes = []
+    for tag in (_DATE_TIME_ORIGINAL, _DATE_TIME_DIGITIZED):
+        typ, count, value_offset = exif_entries.get(tag, (None, None, None))
+        if typ != _ASCII or count != _EXIF_DATE_LENGTH:
+            raise PatchError(f"Tag 0x{tag:04X} is missing or not a 20-byte date.")
+        writes.append((value_offset, exif_date + b"\x00"))
+
+    if exif_gps_dict:
+        gps_ifd = block.pointer(ifd0, _GPS_IFD_POINTER)
+        if gps_ifd is None:
+            raise PatchError("No GPS IFD.")
+        gps_entries = block.entries(gps_ifd)
+        # A full rewrite replaces the GPS IFD with exactly these tags.
+        if set(gps_entries) != set(exif_gps_dict):
+            raise PatchError("GPS IFD has different tags.")
+        for tag, value in exif_gps_dict.items():
+            typ, count, value_offset = gps_entries[tag]
+            data = _encode(block.order, typ, count, value)
+            if data is None:
+                raise PatchError(f"GPS tag {tag} does not fit in place.")
+            writes.append((value_offset, data))
+    return writes
+
+
+def holds_tags(raw_exif, exif_date, exif_gps_dict=None):
+    """
+    True if a raw EXIF payload (as jpeg_splice.read_exif returns it) holds
+    exactly the bytes patch_file would write for the date and GPS tags.
+    Raises PatchError if the tags are missing or have another shape.
+    """
+    if not raw_exif.startswith(jpeg_splice.EXIF_HEADER):
+        raise PatchError("No EXIF segment.")
+    block = _TiffBlock(None, 0, raw_exif[len(jpeg_splice.EXIF_HEADER):])
+    return all(block.read(offset, len(data)) == data for offset, data in plan_patch(block, exif_date, exif_gps_dict))
+
+
+def _open_block(f, path):
+    if path.lower().endswith(scanner.JPEG_EXTENSIONS):
+        try:
+            found = jpeg_splice.locate_exif(f)
+        except jpeg_splice.SpliceError as e:
+            raise PatchError(str(e))
+        if found is None:
+            raise PatchError("No EXIF segment.")
+        offset, payload = found
+        header_length = len(jpeg_splice.EXIF_HEADER)
+        return _TiffBlock(f, offset + header_length, payload[header_length:])
+    if path.lower().endswith(TIFF_EXTENSIONS):
+        return _TiffBlock(f, 0)
+    raise PatchError("In-place patching is only supported for JPEG and TIFF files.")
+
+
+def _write_at(f, data, offset):
+    if hasattr(os, "pwrite"):
+        os.pwrite(f.fileno(), data, offset)
+    else:
+        f.seek(offset)
+        f.write(data)
+
+
+def patch_file(path, exif_date, exif_gps_dict=None):
+    """
+    Overwrites the date (and GPS) tags of path in place. Bytes that already
+    hold the new value are not rewritten. Returns the number of bytes written;
+    raises PatchError (leaving the file untouched) if the file needs a full
+    rewrite. The caller is responsible for fsyncing the file.
+    """
+    with open(path, "r+b") as f:
+        # e.g. an original linked into the album next to its XMP sidecar
+        if os.fstat(f.fileno()).st_nlink > 1:
+            raise PatchError("File is hard linked; patching it would change the other links too.")
+        block = _open_block(f, path)
+        writes = plan_patch(block, exif_date, exif_gps_dict)
+        # Validate every offset before writing anything.
+        current = [block.read(offset, len(data)) for offset, data in writes]
+        written = 0
+        for (offset, data), old in zip(writes, current):
+            if data != old:
+                _write_at(f, data, block.base + offset)
+                written += len(data)
+    return written
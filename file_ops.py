@@ -0,0 +1,253 @@
+"""
+Crash-safe file operations for the write and archive stages.
+
+Outputs are written to a hidden temp file next to their final name and only
+renamed into place once they are on disk, so a crash never leaves a
+truncated photo in an album. fsync is done per batch of files rather than
+per file. Archiving uses a plain rename when possible, and a reflink or
+copy_file_range copy otherwise; originals placed next to an XMP sidecar are
+hard linked or reflinked the same way.
+"""
+import errno
+import os
+import shutil
+import time
+import uuid
+
+import instrumentation
+
+TEMP_SUFFIX = ".phototagger.tmp"
+# Temp files older than this are left over from a crashed run and can be removed.
+STALE_TEMP_AGE = 10 * 60
+COPY_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Linux FICLONE ioctl (reflink the whole file on btrfs, XFS, ...)
+_FICLONE = 0x40049409
+
+# How link_file puts an untouched original into the album
+LINK_AUTO = "auto"
+LINK_HARDLINK = "hardlink"
+LINK_REFLINK = "reflink"
+LINK_COPY = "copy"
+LINK_MODES = (LINK_AUTO, LINK_HARDLINK, LINK_REFLINK, LINK_COPY)
+
+
+def temp_path_for(final_path):
+    """A hidden, unique temp path in the same directory as final_path."""
+    directory, name = os.path.split(final_path)
+    return os.path.join(directory, f".{name}.{uuid.uuid4().hex[:8]}{TEMP_SUFFIX}")
+
+
+def remove_stale_temps(directory, max_age=STALE_TEMP_AGE):
+    """Deletes temp files left behind by an interrupted run."""
+    now = time.time()
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                if entry.name.startswith('.') and entry.name.endswith(TEMP_SUFFIX):
+                    try:
+                        if now - entry.stat().st_mtime > max_age:
+                            os.remove(entry.path)
+                    except OSError:
+                        pass
+    except OSError:
+        pass
+
+
+def discard(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def fsync_path(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def fsync_directory(directory):
+    """Makes renames in directory durable. Not possible (nor needed) on Windows."""
+    if os.name == "nt":
+        return
+    try:
+        fsync_path(directory)
+    except OSError:
+        pass
+
+
+def commit_batch(pairs, labels=None):
+    """
+    Makes a batch of finished temp files durable and moves them into place.
+    pairs is a list of (temp_path, final_path), or of lists of such pairs
+    that go together (an original and its XMP sidecar): they are renamed in
+    order, and none of them is if one fails. All temps are fsynced, then
+    renamed, then each affected directory is fsynced once. A pair whose
+    temp_path is final_path (a file patched in place) is only fsynced.
+    labels optionally names each entry for the fsync instrumentation spans.
+    Returns a list of (final_path, error) with error None on success.
+    """
+    results = []
+    synced = []
+    for i, group in enumerate(pairs):
+        group = group if isinstance(group, list) else [group]
+        try:
+            with instrumentation.span("fsync", labels[i] if labels else group[-1][1]):
+                for temp_path, _ in group:
+                    fsync_path(temp_path)
+            synced.append(group)
+        except OSError as e:
+            _fail(group, e, results)
+
+    directories = set()
+    for group in synced:
+        for n, (temp_path, final_path) in enumerate(group):
+            if temp_path == final_path:
+                results.append((final_path, None))
+                continue
+            try:
+                os.replace(temp_path, final_path)
+                directories.add(os.path.dirname(final_path))
+                results.append((final_path, None))
+            except OSError as e:
+                _fail(group[n:], e, results)
+                break
+
+    for directory in directories:
+        fsync_directory(directory)
+    return results
+
+
+def _fail(pairs, error, results):
+    for temp_path, final_path in pairs:
+        if temp_path != final_path:
+            discard(temp_path)
+        results.append((final_path, error))
+
+
+## Copying
+def copy_stream(src, dst, offset=0):
+    """
+    Copies everything from offset to the end of src into dst (both binary
+    file objects, dst positioned where the data should go). Uses
+    os.copy_file_range where available so the data stays in the kernel
+    (or is shared by the filesystem), otherwise a buffered copy.
+    """
+    if hasattr(os, "copy_file_range"):
+        dst.flush()
+        src_fd, dst_fd = src.fileno(), dst.fileno()
+        dst_offset = dst.tell()
+        try:
+            while True:
+                copied = os.copy_file_range(src_fd, dst_fd, COPY_CHUNK_SIZE, offset, dst_offset)
+                if copied == 0:
+                    break
+                offset += copied
+                dst_offset += copied
+            dst.seek(dst_offset)
+            return
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF):
+                raise
+            # Not supported here: carry on with a plain copy from where we are.
+            dst.seek(dst_offset)
+    src.seek(offset)
+    shutil.copyfileobj(src, dst, COPY_CHUNK_SIZE)
+
+
+def _reflink(src, dst):
+    import fcntl
+    fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+
+
+def copy_file(source_path, dest_path):
+    """Copies a file (data + metadata), trying a reflink first. The copy is fsynced."""
+    with open(source_path, "rb") as src, open(dest_path, "wb") as dst:
+        try:
+            if os.name != "posix":
+                raise OSError(errno.EOPNOTSUPP, "reflink not supported")
+            _reflink(src, dst)
+        except (OSError, ImportError):
+            copy_stream(src, dst)
+        dst.flush()
+        os.fsync(dst.fileno())
+    shutil.copystat(source_path, dest_path)
+
+
+def is_linked(source_path, dest_path):
+    """True if dest_path already is source_path (hard linked there by an earlier run)."""
+    return os.path.exists(dest_path) and os.path.samefile(source_path, dest_path)
+
+
+def link_to_temp(source_path, temp_path, mode=LINK_AUTO):
+    """
+    Creates temp_path as an untouched copy of source_path without rewriting
+    the data: a hard link, a reflink (raises OSError where not supported) or
+    a copy (reflink first). auto tries a hard link, then a copy. Nothing is
+    left at temp_path if it fails.
+    """
+    try:
+        if mode in (LINK_AUTO, LINK_HARDLINK):
+            try:
+                os.link(source_path, temp_path)
+            except OSError:
+                if mode == LINK_HARDLINK:
+                    raise
+                copy_file(source_path, temp_path)
+        elif mode == LINK_REFLINK:
+            if os.name != "posix":
+                raise OSError(errno.EOPNOTSUPP, "reflink not supported")
+            with open(source_path, "rb") as src, open(temp_path, "wb") as dst:
+                _reflink(src, dst)
+            shutil.copystat(source_path, temp_path)
+        else:
+            copy_file(source_path, temp_path)
+    except BaseException:
+        discard(temp_path)
+        raise
+
+
+def link_file(source_path, dest_path, mode=LINK_AUTO):
+    """
+    Puts an untouched copy of source_path at dest_path (see link_to_temp).
+    An existing dest_path is replaced atomically, unless it already is
+    source_path.
+    """
+    if is_linked(source_path, dest_path):
+        return
+    temp_path = temp_path_for(dest_path)
+    link_to_temp(source_path, temp_path, mode)
+    try:
+        os.replace(temp_path, dest_path)
+    except BaseException:
+        discard(temp_path)
+        raise
+
+
+def move_file(source_path, dest_path):
+    """
+    Moves a file as cheaply as possible: os.rename on the same device,
+    otherwise a (reflink) copy that is made durable before the source is
+    deleted. Never overwrites an existing file.
+    """
+    if os.path.exists(dest_path):
+        raise FileExistsError(errno.EEXIST, "Destination already exists", dest_path)
+    try:
+        os.rename(source_path, dest_path)
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+
+    temp_path = temp_path_for(dest_path)
+    try:
+        copy_file(source_path, temp_path)
+        os.replace(temp_path, dest_path)
+    except BaseException:
+        discard(temp_path)
+        raise
+    fsync_directory(os.path.dirname(dest_path))
+    os.remove(source_path)
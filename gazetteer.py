@@ -0,0 +1,317 @@
+"""
+Offline geocoder backed by a local GeoNames-style gazetteer.
+
+Build the index once from a GeoNames dump (e.g. cities500.txt or
+cities1000.txt from https://download.geonames.org/export/dump/):
+
+    python gazetteer.py build cities500.txt
+
+Then search names by prefix, or find the nearest place to a coordinate,
+without any network access:
+
+    python gazetteer.py search "saint-m"
+    python gazetteer.py reverse 48.8566 2.3522
+
+Names (including alternate names) are kept in a sorted array searched with
+bisect. The best matches of short prefixes, and of every prefix that more
+than SCAN_LIMIT names start with, are precomputed, so any prefix is ranked
+by population over all its matches while typing stays fast. Reverse lookups
+use a 1-degree grid, searched over a radius that widens with latitude and
+wraps around the antimeridian.
+
+search_online is the (optional) Nominatim lookup the app falls back to for
+names that are not in the index. It blocks, so call it off the GUI thread.
+"""
+import bisect
+import heapq
+import json
+import logging
+import math
+import os
+import pickle
+import sys
+import unicodedata
+import urllib.parse
+import urllib.request
+from collections import namedtuple
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.expanduser("~"), ".photo-tagger", "gazetteer.idx")
+INDEX_PATH_ENV = "PHOTO_TAGGER_GAZETTEER"
+INDEX_VERSION = 2
+
+# Prefixes up to this length get their best matches precomputed.
+PRECOMPUTED_PREFIX_LENGTH = 3
+MAX_RESULTS = 10
+# Longer prefixes matching more names than this get their best matches
+# precomputed too; the others are ranked by scanning all their matches.
+SCAN_LIMIT = 2000
+# Grid cell size for reverse lookups (degrees).
+GRID_SIZE = 1.0
+_LON_CELLS = int(round(360 / GRID_SIZE))
+_KM_PER_DEGREE = 111.2
+# Online fallback (OpenStreetMap Nominatim, at most one request per second)
+NOMINATIM_URL = "https://nominatim.openstreetmap.org/search"
+USER_AGENT = "PhotoImporterApp/1.0"
+ONLINE_TIMEOUT = 10
+
+log = logging.getLogger(__name__)
+
+Place = namedtuple("Place", ["name", "country", "latitude", "longitude", "population"])
+
+
+def default_index_path():
+    return os.environ.get(INDEX_PATH_ENV) or DEFAULT_INDEX_PATH
+
+
+def normalize(text):
+    """Lower-cases and strips accents, so 'Liège' matches 'liege'."""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold().strip()
+
+
+def _wrap_lon_cell(cell):
+    """Longitude cells wrap around: the cell east of 179..180 is -180..-179."""
+    return (cell + _LON_CELLS // 2) % _LON_CELLS - _LON_CELLS // 2
+
+
+def _grid_cell(latitude, longitude):
+    return int(math.floor(latitude / GRID_SIZE)), _wrap_lon_cell(int(math.floor(longitude / GRID_SIZE)))
+
+
+def _prefix_end(prefix):
+    """The smallest string greater than every string starting with prefix."""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def _top_prefixes(keys, key_places, places):
+    """
+    Best matches (most populated first) of every prefix up to
+    PRECOMPUTED_PREFIX_LENGTH characters and of every longer prefix with
+    more than SCAN_LIMIT matching names. Only prefixes of such dense
+    prefixes can be dense themselves, so the walk stays in their ranges.
+    """
+    def best(lo, hi):
+        return heapq.nlargest(MAX_RESULTS, set(key_places[lo:hi]), key=lambda i: places[i].population)
+
+    top = {}
+    ranges = [(0, len(keys))]
+    length = 0
+    while ranges:
+        length += 1
+        dense = []
+        for lo, hi in ranges:
+            pos = lo
+            while pos < hi:
+                if len(keys[pos]) < length:
+                    pos += 1
+                    continue
+                prefix = keys[pos][:length]
+                end = bisect.bisect_left(keys, _prefix_end(prefix), pos, hi)
+                if length <= PRECOMPUTED_PREFIX_LENGTH or end - pos > SCAN_LIMIT:
+                    top[prefix] = best(pos, end)
+                if end - pos > SCAN_LIMIT:
+                    dense.append((pos, end))
+                pos = end
+        # Short prefixes are all precomputed, dense or not.
+        ranges = [(0, len(keys))] if length < PRECOMPUTED_PREFIX_LENGTH else dense
+    return top
+
+
+## Building
+def read_geonames(path):
+    """Yields (name, alternate_names, Place) from a GeoNames tab-separated dump."""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            cols = line.rstrip("\n").split("\t")
+            if len(cols) < 15:
+                continue
+            try:
+                latitude, longitude = float(cols[4]), float(cols[5])
+                population = int(cols[14] or 0)
+            except ValueError:
+                continue
+            alternates = [n for n in cols[3].split(",") if n] if cols[3] else []
+            alternates.append(cols[2])
+            yield cols[1], alternates, Place(cols[1], cols[8], latitude, longitude, population)
+
+
+def build_index(geonames_path, index_path=None):
+    """Builds the on-disk index from a GeoNames dump. Returns the number of places."""
+    index_path = index_path or default_index_path()
+    places = []
+    entries = set()
+    for name, alternates, place in read_geonames(geonames_path):
+        idx = len(places)
+        places.append(place)
+        for n in [name] + alternates:
+            key = normalize(n)
+            if key:
+                entries.add((key, idx))
+
+    entries = sorted(entries)
+    keys = [key for key, _ in entries]
+    key_places = [idx for _, idx in entries]
+
+    top = _top_prefixes(keys, key_places, places)
+
+    grid = {}
+    for idx, place in enumerate(places):
+        grid.setdefault(_grid_cell(place.latitude, place.longitude), []).append(idx)
+
+    os.makedirs(os.path.dirname(os.path.abspath(index_path)), exist_ok=True)
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump({
+            "version": INDEX_VERSION,
+            "places": [tuple(p) for p in places],
+            "keys": keys,
+            "key_places": key_places,
+            "top": top,
+            "grid": grid,
+        }, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, index_path)
+    return len(places)
+
+
+## Searching
+class Gazetteer:
+    """A loaded gazetteer index. Use Gazetteer.load() to read one from disk."""
+
+    def __init__(self, places, keys, key_places, top, grid):
+        self.places = places
+        self.keys = keys
+        self.key_places = key_places
+        self.top = top
+        self.grid = grid
+
+    @classmethod
+    def load(cls, index_path=None):
+        """Loads an index built by build_index. Returns None if there is none."""
+        index_path = index_path or default_index_path()
+        if not os.path.isfile(index_path):
+            return None
+        with open(index_path, "rb") as f:
+            data = pickle.load(f)
+        if data.get("version") != INDEX_VERSION:
+            log.warning("Gazetteer index %s is outdated, please rebuild it.", index_path)
+            return None
+        places = [Place(*p) for p in data["places"]]
+        return cls(places, data["keys"], data["key_places"], data["top"], data["grid"])
+
+    def search(self, query, limit=MAX_RESULTS):
+        """Returns places whose name starts with query, most populated first."""
+        prefix = normalize(query)
+        if not prefix:
+            return []
+
+        def rank(ids):
+            return sorted(ids, key=lambda i: -self.places[i].population)
+
+        start = bisect.bisect_left(self.keys, prefix)
+        exact = set()
+        pos = start
+        while pos < len(self.keys) and self.keys[pos] == prefix:
+            exact.add(self.key_places[pos])
+            pos += 1
+        if prefix in self.top:
+            others = self.top[prefix]
+        else:
+            # Not precomputed, so at most SCAN_LIMIT names match.
+            end = bisect.bisect_left(self.keys, _prefix_end(prefix), start)
+            others = rank(set(self.key_places[start:end]))
+
+        ids = rank(exact) + [i for i in others if i not in exact]
+        return [self.places[i] for i in ids[:limit]]
+
+    def reverse(self, latitude, longitude, max_distance_km=50):
+        """Returns the nearest place to a coordinate, or None if none is within max_distance_km."""
+        best, best_distance = None, max_distance_km
+        for cell in _cells_within(latitude, longitude, max_distance_km):
+            for idx in self.grid.get(cell, ()):
+                place = self.places[idx]
+                distance = distance_km(latitude, longitude, place.latitude, place.longitude)
+                if distance <= best_distance:
+                    best, best_distance = place, distance
+        return best
+
+
+def _cells_within(latitude, longitude, radius_km):
+    """
+    The grid cells that can hold places within radius_km. A degree of
+    longitude shrinks with cos(latitude), so the longitude span widens
+    towards the poles (all longitudes if the radius reaches a pole).
+    """
+    d_lat = radius_km / _KM_PER_DEGREE
+    lat_cells = range(int(math.floor(max(-90.0, latitude - d_lat) / GRID_SIZE)),
+                      int(math.floor(min(90.0, latitude + d_lat) / GRID_SIZE)) + 1)
+    poleward = abs(latitude) + d_lat
+    d_lon = 180.0 if poleward >= 90 else d_lat / math.cos(math.radians(poleward))
+    if d_lon >= 180:
+        lon_cells = range(-_LON_CELLS // 2, _LON_CELLS // 2)
+    else:
+        lon_cells = {_wrap_lon_cell(cell) for cell in range(int(math.floor((longitude - d_lon) / GRID_SIZE)),
+                                                            int(math.floor((longitude + d_lon) / GRID_SIZE)) + 1)}
+    return [(lat_cell, lon_cell) for lat_cell in lat_cells for lon_cell in lon_cells]
+
+
+def distance_km(lat1, lon1, lat2, lon2):
+    """Great-circle (haversine) distance in km."""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    d_lat, d_lon = p2 - p1, math.radians(lon2 - lon1)
+    a = math.sin(d_lat / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(d_lon / 2) ** 2
+    return 6371.0 * 2 * math.asin(math.sqrt(a))
+
+
+def search_online(query, timeout=ONLINE_TIMEOUT):
+    """
+    The best Nominatim match for query as a Place (country and population
+    unknown), or None if there is none. Raises OSError if the service can't
+    be reached.
+    """
+    url = NOMINATIM_URL + "?" + urllib.parse.urlencode({"q": query, "format": "json", "limit": 1})
+    request = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        try:
+            results = json.load(response)
+        except ValueError as e:
+            raise OSError(f"Unexpected answer from Nominatim: {e}")
+    if not results:
+        return None
+    best = results[0]
+    name = best.get("display_name", query).split(",")[0]
+    return Place(name, "", float(best["lat"]), float(best["lon"]), 0)
+
+
+def describe(place):
+    return f"{place.name} ({place.country})" if place.country else place.name
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) >= 2 and argv[0] == "build":
+        index_path = argv[2] if len(argv) > 2 else None
+        count = build_index(argv[1], index_path)
+        print(f"Indexed {count} places into {index_path or default_index_path()}")
+        return 0
+    if len(argv) == 2 and argv[0] == "search":
+        gazetteer = Gazetteer.load()
+        if gazetteer is None:
+            print("No gazetteer index found. Run: python gazetteer.py build <geonames file>")
+            return 1
+        for place in gazetteer.search(argv[1]):
+            print(f"{describe(place)}\t{place.latitude:.5f}, {place.longitude:.5f}")
+        return 0
+    if len(argv) == 3 and argv[0] == "reverse":
+        gazetteer = Gazetteer.load()
+        if gazetteer is None:
+            print("No gazetteer index found. Run: python gazetteer.py build <geonames file>")
+            return 1
+        place = gazetteer.reverse(float(argv[1]), float(argv[2]))
+        print(describe(place) if place else "No place nearby.")
+        return 0
+    print(__doc__)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
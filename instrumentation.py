@@ -0,0 +1,266 @@
+"""
+Per-stage instrumentation for imports.
+
+Records timed spans per file for the pipeline stages (scan, open, exif_parse,
+dump, write, verify, fsync, move), aggregates them into histograms and can
+write every span to a JSON-lines trace file. Three modes:
+
+  off     - the default; span() returns a shared no-op object
+  sampled - only every Nth file is traced
+  full    - every file is traced
+
+Configure with configure(), or from the environment with configure_from_env():
+
+    PHOTO_TAGGER_TRACE=sampled PHOTO_TAGGER_TRACE_FILE=trace.jsonl python tagger.py
+
+Worker tasks (which may run in other processes) record into a local list
+with collect() and hand the spans back to the pipeline, which adds them to
+the recorder with Recorder.add_spans().
+"""
+import json
+import math
+import os
+import threading
+import time
+
+MODE_OFF = "off"
+MODE_SAMPLED = "sampled"
+MODE_FULL = "full"
+MODES = (MODE_OFF, MODE_SAMPLED, MODE_FULL)
+
+STAGES = ("scan", "open", "exif_parse", "dump", "write", "verify", "fsync", "move")
+DEFAULT_SAMPLE_EVERY = 20
+
+TRACE_ENV = "PHOTO_TAGGER_TRACE"
+TRACE_FILE_ENV = "PHOTO_TAGGER_TRACE_FILE"
+SAMPLE_EVERY_ENV = "PHOTO_TAGGER_TRACE_SAMPLE_EVERY"
+
+_recorder = None
+_local = threading.local()
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("sink", "stage", "file", "start")
+
+    def __init__(self, sink, stage, file):
+        self.sink = sink
+        self.stage = stage
+        self.file = file
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.sink.add(self.stage, self.file, time.time(), time.perf_counter() - self.start)
+        return False
+
+
+class Histogram:
+    """Log2-bucketed latency histogram (microsecond resolution)."""
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        micros = max(seconds * 1_000_000, 1.0)
+        bucket = int(math.log2(micros))
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """Upper bound (in seconds) of the bucket holding the q-th quantile."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= target:
+                return min(2 ** (bucket + 1) / 1_000_000, self.max)
+        return self.max
+
+
+class _LocalCollector:
+    """Collects the spans of one file inside a worker task."""
+
+    def __init__(self, file):
+        self.file = file
+        self.spans = []
+
+    def wants(self, file):
+        return True
+
+    def add(self, stage, file, wall_time, seconds):
+        self.spans.append((stage, file or self.file, wall_time, seconds, os.getpid(),
+                           threading.current_thread().name))
+
+
+class Recorder:
+    """Aggregates spans for a run and optionally writes them to a trace file."""
+
+    def __init__(self, mode=MODE_FULL, sample_every=DEFAULT_SAMPLE_EVERY, trace_path=None):
+        self.mode = mode
+        self.sample_every = max(1, sample_every)
+        self.trace_path = trace_path
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.sampled = set()
+        self._seen = 0
+        self._trace = open(trace_path, "a", encoding="utf-8") if trace_path else None
+        self.run_started = None
+
+    ## Sampling
+    def sample(self, file):
+        """Decides whether a file is traced. Call once per file, when it is first seen."""
+        with self.lock:
+            self._seen += 1
+            if self.mode == MODE_FULL or (self._seen - 1) % self.sample_every == 0:
+                self.sampled.add(file)
+                return True
+            return False
+
+    def wants(self, file):
+        return file is None or file in self.sampled
+
+    ## Recording
+    def add(self, stage, file, wall_time, seconds, pid=None, thread=None):
+        with self.lock:
+            self.histograms.setdefault(stage, Histogram()).add(seconds)
+            if self._trace:
+                self._trace.write(json.dumps({
+                    "t": round(wall_time, 6), "stage": stage, "file": file,
+                    "ms": round(seconds * 1000, 3), "pid": pid or os.getpid(),
+                    "thread": thread or threading.current_thread().name,
+                }) + "\n")
+
+    def add_spans(self, spans):
+        """Adds spans returned by a worker task (see collect())."""
+        for stage, file, wall_time, seconds, pid, thread in spans or ():
+            self.add(stage, file, wall_time, seconds, pid, thread)
+
+    ## Run lifecycle
+    def start_run(self):
+        with self.lock:
+            self.histograms = {}
+            self.sampled = set()
+            self._seen = 0
+            self.run_started = time.perf_counter()
+
+    def summary(self):
+        """Per-stage counts and timings (ms) for the run so far."""
+        with self.lock:
+            stages = {}
+            for stage, h in self.histograms.items():
+                stages[stage] = {
+                    "count": h.count,
+                    "total_ms": round(h.total * 1000, 2),
+                    "mean_ms": round(h.total * 1000 / h.count, 3) if h.count else 0,
+                    "p50_ms": round(h.quantile(0.5) * 1000, 3),
+                    "p99_ms": round(h.quantile(0.99) * 1000, 3),
+                    "max_ms": round(h.max * 1000, 3),
+                }
+            wall = time.perf_counter() - self.run_started if self.run_started else 0
+            return {"mode": self.mode, "files_traced": len(self.sampled),
+                    "wall_ms": round(wall * 1000, 2), "stages": stages}
+
+    def finish_run(self):
+        summary = self.summary()
+        with self.lock:
+            if self._trace:
+                self._trace.write(json.dumps({"summary": summary}) + "\n")
+                self._trace.flush()
+        return summary
+
+    def close(self):
+        with self.lock:
+            if self._trace:
+                self._trace.close()
+                self._trace = None
+
+
+## Module-level API
+def configure(mode=MODE_OFF, sample_every=DEFAULT_SAMPLE_EVERY, trace_path=None):
+    """Sets the process-wide recorder. Returns it (None when off)."""
+    global _recorder
+    if mode not in MODES:
+        raise ValueError(f"Unknown trace mode '{mode}', expected one of {', '.join(MODES)}")
+    if _recorder:
+        _recorder.close()
+    _recorder = None if mode == MODE_OFF else Recorder(mode, sample_every, trace_path)
+    return _recorder
+
+
+def configure_from_env():
+    sample_every = int(os.environ.get(SAMPLE_EVERY_ENV) or DEFAULT_SAMPLE_EVERY)
+    return configure(os.environ.get(TRACE_ENV) or MODE_OFF, sample_every,
+                     os.environ.get(TRACE_FILE_ENV) or None)
+
+
+def current():
+    """The active recorder, or None when instrumentation is off."""
+    return _recorder
+
+
+def span(stage, file=None):
+    """
+    Times a block as a span of `stage`. Inside a worker task the span goes to the
+    task's collector; elsewhere to the active recorder, if the file is sampled.
+    """
+    sink = getattr(_local, "collector", None) or _recorder
+    if sink is None or not sink.wants(file):
+        return _NULL_SPAN
+    return _Span(sink, stage, file)
+
+
+class collect:
+    """
+    Context manager for worker tasks: spans recorded inside go to a local list
+    (`.spans`) that the task returns to the pipeline. Does nothing if not enabled.
+    """
+
+    def __init__(self, file, enabled=True):
+        self.collector = _LocalCollector(file) if enabled else None
+        self.spans = None
+
+    def __enter__(self):
+        if self.collector:
+            self._previous = getattr(_local, "collector", None)
+            _local.collector = self.collector
+        return self
+
+    def __exit__(self, *exc):
+        if self.collector:
+            _local.collector = self._previous
+            self.spans = self.collector.spans
+        return False
+
+
+def format_summary(summary):
+    """Human-readable table of a run summary."""
+    lines = [f"Stage timings ({summary['mode']}, {summary['files_traced']} files traced, "
+             f"wall {summary['wall_ms'] / 1000:.2f} s):",
+             f"  {'stage':<11}{'count':>7}{'total ms':>12}{'mean ms':>10}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}"]
+    ordered = [s for s in STAGES if s in summary["stages"]] + \
+              sorted(s for s in summary["stages"] if s not in STAGES)
+    for stage in ordered:
+        s = summary["stages"][stage]
+        lines.append(f"  {stage:<11}{s['count']:>7}{s['total_ms']:>12.1f}{s['mean_ms']:>10.2f}"
+                     f"{s['p50_ms']:>10.2f}{s['p99_ms']:>10.2f}{s['max_ms']:>10.2f}")
+    return "\n".join(lines)
@@ -0,0 +1,151 @@
+"""
+Window of the import job queue (see jobs.JobScheduler): the queued jobs
+with their status, photo counts, throughput and ETA, and the overall
+progress of the queue. Jobs are added from the main window ("Add to
+Queue") or from a manifest file, also while the queue runs.
+"""
+import logging
+import os
+import queue
+from tkinter import filedialog, messagebox, ttk
+
+import customtkinter as ctk
+
+import instrumentation
+import jobs
+import tagging
+
+log = logging.getLogger(__name__)
+
+# How often the table is refreshed from the scheduler (ms)
+POLL_MS = 250
+COLUMNS = (("job", "Job", 360), ("status", "Status", 130), ("photos", "Photos", 110),
+           ("rate", "Rate", 80), ("eta", "ETA", 80))
+
+
+class JobQueueWindow(ctk.CTkToplevel):
+    """
+    Non-modal: the main window stays usable to set up the next job. Closing
+    the window only hides it; the queue keeps running.
+    options_func returns the scheduler options (see JobScheduler.configure)
+    from the main window's settings when the queue is started.
+    """
+
+    def __init__(self, master, options_func, albums_dir_func):
+        super().__init__(master)
+        self.title("Import Queue")
+        self.geometry("820x420")
+        self.options_func = options_func
+        self.albums_dir_func = albums_dir_func
+        self.scheduler = jobs.JobScheduler()
+        self.protocol("WM_DELETE_WINDOW", self.withdraw)
+
+        self.grid_columnconfigure(0, weight=1)
+        self.grid_rowconfigure(0, weight=1)
+
+        # A named style: the calendar in the main window uses ttk too.
+        style = ttk.Style(self)
+        style.configure("Queue.Treeview", background="#2b2b2b", fieldbackground="#2b2b2b",
+                        foreground="#dce4ee", rowheight=24, borderwidth=0)
+        style.configure("Queue.Treeview.Heading", background="#333333", foreground="#dce4ee", relief="flat")
+        style.map("Queue.Treeview", background=[("selected", "#1f6aa5")])
+
+        table_frame = ctk.CTkFrame(self)
+        table_frame.grid(row=0, column=0, sticky="nsew", padx=10, pady=(10, 5))
+        table_frame.grid_columnconfigure(0, weight=1)
+        table_frame.grid_rowconfigure(0, weight=1)
+        self.table = ttk.Treeview(table_frame, columns=[c[0] for c in COLUMNS], show="headings",
+                                  style="Queue.Treeview")
+        for name, heading, width in COLUMNS:
+            self.table.heading(name, text=heading)
+            self.table.column(name, width=width, stretch=name == "job", anchor="w" if name == "job" else "e")
+        self.table.grid(row=0, column=0, sticky="nsew")
+        scrollbar = ctk.CTkScrollbar(table_frame, command=self.table.yview)
+        scrollbar.grid(row=0, column=1, sticky="ns")
+        self.table.configure(yscrollcommand=scrollbar.set)
+
+        self.overall_label = ctk.CTkLabel(self, text="No jobs queued.", anchor="w")
+        self.overall_label.grid(row=1, column=0, sticky="ew", padx=15, pady=5)
+
+        buttons = ctk.CTkFrame(self, fg_color="transparent")
+        buttons.grid(row=2, column=0, sticky="ew", padx=10, pady=(5, 10))
+        ctk.CTkButton(buttons, text="Load Manifest...", command=self.load_manifest).pack(side="left")
+        ctk.CTkButton(buttons, text="Remove", width=90, command=self.remove_selected).pack(side="left", padx=5)
+        self.cancel_button = ctk.CTkButton(buttons, text="Cancel", width=90, state="disabled",
+                                           command=self.cancel)
+        self.cancel_button.pack(side="right")
+        self.start_button = ctk.CTkButton(buttons, text="Start Queue", command=self.start)
+        self.start_button.pack(side="right", padx=5)
+
+        self.after(POLL_MS, self.poll)
+
+    def add_job(self, job):
+        index = self.scheduler.add(job)
+        self.table.insert("", "end", iid=str(index), values=(job.name, jobs.STATE_QUEUED, "?", "", ""))
+        self.show()
+
+    def show(self):
+        self.deiconify()
+        self.lift()
+
+    def load_manifest(self):
+        path = filedialog.askopenfilename(parent=self, title="Select Job Manifest",
+                                          filetypes=[("Job manifests", "*.csv *.json"), ("All files", "*.*")])
+        if not path:
+            return
+        try:
+            loaded = jobs.load_manifest(path, self.albums_dir_func() or None)
+        except tagging.ValidationError as e:
+            messagebox.showerror(e.title, str(e), parent=self)
+            return
+        for job in loaded:
+            self.add_job(job)
+        log.info("Queued %s jobs from %s", len(loaded), os.path.basename(path))
+
+    def remove_selected(self):
+        for iid in self.table.selection():
+            if self.scheduler.remove(int(iid)):
+                self.table.delete(iid)
+
+    def start(self):
+        if self.scheduler.running:
+            return
+        self.scheduler.configure(**self.options_func())
+        self.scheduler.start()
+        self.start_button.configure(state="disabled")
+        self.cancel_button.configure(state="normal", text="Cancel")
+
+    def cancel(self):
+        self.scheduler.cancel()
+        self.cancel_button.configure(state="disabled", text="Cancelling...")
+
+    def close(self):
+        """Stops the queue (after the photos in flight) when the app exits."""
+        self.scheduler.cancel()
+
+    def poll(self):
+        finished = None
+        try:
+            while True:
+                event = self.scheduler.events.get_nowait()
+                if event[0] == "job" and event[2][0] == "stats":
+                    log.info("%s", instrumentation.format_summary(event[2][1]))
+                elif event[0] == "finished":
+                    finished = event
+        except queue.Empty:
+            pass
+
+        for index, progress in enumerate(self.scheduler.progress):
+            if self.table.exists(str(index)):
+                self.table.item(str(index), values=(progress.job.name,) + jobs.describe_progress(progress))
+        if any(p.state != jobs.STATE_REMOVED for p in self.scheduler.progress):
+            self.overall_label.configure(text=jobs.describe_overall(self.scheduler))
+
+        if finished is not None:
+            self.start_button.configure(state="normal")
+            self.cancel_button.configure(state="disabled", text="Cancel")
+            failed = [p for p in self.scheduler.progress if p.errors]
+            if failed:
+                messagebox.showwarning("Import Queue", "Some photos could not be tagged (see console for details):\n"
+                                       + "\n".join(f"{p.job.name}: {len(p.errors)}" for p in failed), parent=self)
+        self.after(POLL_MS, self.poll)
@@ -0,0 +1,521 @@
+"""
+Import job queue.
+
+A job is one source -> album import with its own date, GPS position and
+archive folder, i.e. what one click of "Tag & Copy Photos" does. Jobs are
+queued from the GUI or read from a manifest (CSV with a header row, or a
+JSON list of objects) with the columns:
+
+    source, album, date, lat, lon, move_to   (lat/lon/move_to may be empty)
+
+and run by a JobScheduler on one shared worker pool:
+
+    python jobs.py shoebox.csv --albums-dir /photos/Albums --workers 8
+
+Relative paths in a manifest are relative to the manifest's folder.
+"""
+import argparse
+import collections
+import csv
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import file_ops
+import tagging
+
+log = logging.getLogger(__name__)
+
+MANIFEST_FIELDS = ("source", "album", "date", "lat", "lon", "move_to")
+# Jobs running at once: the next one starts while the last photos of the previous one are written.
+MAX_ACTIVE_JOBS = 2
+# Throughput is measured over this many seconds.
+RATE_WINDOW = 30
+
+STATE_QUEUED = "queued"
+STATE_RUNNING = "running"
+STATE_DONE = "done"
+STATE_CANCELLED = "cancelled"
+STATE_REMOVED = "removed"
+
+# skip_paths are normalized paths of photos to leave out (see tagging.scan_source).
+ImportJob = namedtuple("ImportJob", ["name", "source", "dest_dir", "exif_date", "gps_data",
+                                     "move_enabled", "move_dest", "skip_paths"])
+
+
+def make_job(source, albums_dir, album, date, gps_data=None, move_to=None, skip_paths=frozenset()):
+    """
+    Validates one job's settings like a single import does (sources are
+    archived to move_to unless it is None). Raises tagging.ValidationError.
+    """
+    move_enabled = move_to is not None
+    dest_dir = tagging.validate_import(source, albums_dir, album, move_enabled, move_to or "")
+    exif_date = tagging.make_exif_date(date)
+    name = f"{os.path.basename(os.path.normpath(source))} -> {album} ({date})"
+    return ImportJob(name, source, dest_dir, exif_date, gps_data, move_enabled, move_to or "", frozenset(skip_paths))
+
+
+def _read_manifest_rows(path):
+    if path.lower().endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            rows = json.load(f)
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise tagging.ValidationError("Invalid Manifest", f"{path}: expected a list of job objects.")
+        return rows
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def job_from_row(row, base_dir, albums_dir=None):
+    """
+    The job of one manifest row (a dict with the MANIFEST_FIELDS, and
+    optionally albums_dir); relative paths are relative to base_dir.
+    Raises tagging.ValidationError.
+    """
+    def resolve(value):
+        value = str(value or "").strip()
+        return os.path.join(base_dir, os.path.expanduser(value)) if value else ""
+
+    row = {str(k).strip().lower(): v for k, v in row.items() if k is not None}
+    lat, lon = (str(row.get(k) or "").strip() for k in ("lat", "lon"))
+    if bool(lat) != bool(lon):
+        raise tagging.ValidationError("Invalid GPS", "lat and lon must be given together.")
+    try:
+        gps_data = (float(lat), float(lon)) if lat else None
+    except ValueError:
+        raise tagging.ValidationError("Invalid GPS", f"'{lat}, {lon}' is not a position.")
+    return make_job(resolve(row.get("source")), resolve(row.get("albums_dir")) or albums_dir,
+                    str(row.get("album") or "").strip(), str(row.get("date") or "").strip(),
+                    gps_data, resolve(row.get("move_to")) or None)
+
+
+def load_manifest(path, albums_dir=None):
+    """
+    Reads the jobs of a CSV or JSON manifest (a row may set its own
+    albums_dir). Raises tagging.ValidationError naming the first bad job.
+    """
+    base = os.path.dirname(os.path.abspath(path))
+    try:
+        rows = _read_manifest_rows(path)
+    except (OSError, ValueError, csv.Error) as e:
+        raise tagging.ValidationError("Invalid Manifest", f"Could not read {path}: {e}")
+
+    jobs = []
+    for number, row in enumerate(rows, 1):
+        try:
+            jobs.append(job_from_row(row, base, albums_dir))
+        except tagging.ValidationError as e:
+            raise tagging.ValidationError(e.title, f"{os.path.basename(path)}, job {number}: {e}")
+    if not jobs:
+        raise tagging.ValidationError("Empty Manifest", f"{path} has no jobs.")
+    return jobs
+
+
+def _is_under(path, root):
+    path, root = (os.path.normcase(os.path.abspath(p)) for p in (path, root))
+    try:
+        return os.path.commonpath([path, root]) == root
+    except ValueError:  # different drives
+        return False
+
+
+class Throughput:
+    """Photos per second over the last RATE_WINDOW seconds, and the time left at that rate."""
+
+    def __init__(self, window=RATE_WINDOW):
+        self.window = window
+        self.samples = collections.deque()
+
+    def update(self, done, now=None):
+        now = time.monotonic() if now is None else now
+        self.samples.append((now, done))
+        # Keep one sample older than the window, so the rate spans all of it.
+        while len(self.samples) > 2 and self.samples[1][0] < now - self.window:
+            self.samples.popleft()
+
+    def rate(self):
+        if len(self.samples) < 2:
+            return None
+        (t0, d0), (t1, d1) = self.samples[0], self.samples[-1]
+        return (d1 - d0) / (t1 - t0) if t1 > t0 else None
+
+    def eta(self, remaining):
+        """Seconds left for `remaining` photos, or None if there is no rate yet."""
+        rate = self.rate()
+        if remaining <= 0:
+            return 0.0
+        return remaining / rate if rate else None
+
+
+class JobProgress:
+    """Where one job stands, updated from its pipeline events."""
+
+    def __init__(self, job):
+        self.job = job
+        self.state = STATE_QUEUED
+        self.counted = None  # photos found by the background count, before the job starts
+        self.discovered = 0
+        self.scan_complete = False
+        self.done = 0
+        self.processed = 0
+        self.skipped = 0
+        self.duplicates = 0
+        self.moved = 0
+        self.errors = []
+        self.started = None
+        self.finished = None
+        self.meter = Throughput()
+
+    @property
+    def total(self):
+        """Photos in the job, as far as known."""
+        if self.scan_complete:
+            return self.discovered
+        return max(self.discovered, self.counted or 0)
+
+    @property
+    def total_known(self):
+        return self.scan_complete or self.counted is not None
+
+    @property
+    def remaining(self):
+        if self.state in (STATE_DONE, STATE_CANCELLED, STATE_REMOVED):
+            return 0
+        return max(0, self.total - self.done)
+
+    def apply(self, event):
+        kind = event[0]
+        if kind == "discovered":
+            self.discovered = max(self.discovered, event[1])
+            self.scan_complete = event[2]
+        elif kind == "tagged":
+            self.done += 1
+            if event[2] is None:
+                self.processed += 1
+            else:
+                self.errors.append(event[1])
+        elif kind == "skipped":
+            self.done += 1
+            self.skipped += 1
+        elif kind == "duplicate":
+            self.done += 1
+            self.duplicates += 1
+        elif kind == "moved" and event[2] is None:
+            self.moved += 1
+        self.meter.update(self.done)
+
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.monotonic()) - self.started
+
+
+class JobScheduler:
+    """
+    Runs ImportJobs in order on one worker pool. A job starts as soon as the
+    one before has handed all its photos to the pool and workers are free
+    (TaggingPipeline.draining), so the pool keeps busy while the previous
+    job's last photos are written and archived. Jobs into the same album
+    never overlap. Jobs can be added while the queue runs.
+
+    Events on `events`:
+      ("job", index, event)     - a pipeline event of job `index` (see TaggingPipeline)
+      ("job_started", index)
+      ("job_finished", index)
+      ("finished", cancelled)   - the queue is empty (or was cancelled)
+    `progress` holds a JobProgress per job; read it from any thread.
+    """
+
+    def __init__(self, **options):
+        self.configure(**options)
+        self.progress = []
+        self.events = queue.Queue()
+        self.meter = Throughput()
+        self.lock = threading.Lock()
+        self.cancel_event = threading.Event()
+        self._thread = None
+        self._count_thread = None
+
+    def configure(self, workers=None, pool_kind=tagging.POOL_THREADS, resume=True, recursive=True,
+                  output_mode=tagging.OUTPUT_REWRITE, link_mode=file_ops.LINK_AUTO, duplicate_root=None):
+        """
+        Sets the pool and pipeline options (see TaggingPipeline); they apply
+        from the next start(). Duplicates are only checked for jobs whose
+        album is under duplicate_root.
+        """
+        self.workers = max(1, workers or tagging.default_worker_count())
+        self.pool_kind = pool_kind
+        self.resume = resume
+        self.recursive = recursive
+        self.output_mode = output_mode
+        self.link_mode = link_mode
+        self.duplicate_root = duplicate_root
+
+    def add(self, job):
+        """Queues a job. Returns its index."""
+        with self.lock:
+            self.progress.append(JobProgress(job))
+            index = len(self.progress) - 1
+        self._start_count()
+        return index
+
+    def remove(self, index):
+        """Drops a job that hasn't started yet. Returns False if it has."""
+        with self.lock:
+            progress = self.progress[index]
+            if progress.state != STATE_QUEUED:
+                return False
+            progress.state = STATE_REMOVED
+            return True
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Runs the queued jobs in the background (no-op if already running)."""
+        if self.running:
+            return
+        self.cancel_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        """Stops the running jobs after the photos in flight; queued jobs stay queued."""
+        self.cancel_event.set()
+
+    def overall(self):
+        """(done, total, total_known, rate, eta) over the jobs not removed."""
+        with self.lock:
+            jobs = [p for p in self.progress if p.state != STATE_REMOVED]
+        done = sum(p.done for p in jobs)
+        total = sum(p.done + p.remaining for p in jobs)
+        known = all(p.total_known for p in jobs)
+        return done, total, known, self.meter.rate(), self.meter.eta(total - done)
+
+    def _start_count(self):
+        if self._count_thread is None or not self._count_thread.is_alive():
+            self._count_thread = threading.Thread(target=self._count, daemon=True)
+            self._count_thread.start()
+
+    def _count(self):
+        """Counts the photos of queued jobs (a listing only), for the overall ETA."""
+        while True:
+            with self.lock:
+                todo = [p for p in self.progress if p.counted is None and p.state == STATE_QUEUED]
+            if not todo:
+                return
+            for progress in todo:
+                job = progress.job
+                files = tagging.scan_source(job.source, recursive=self.recursive,
+                                            exclude_dirs=(job.dest_dir, job.move_dest if job.move_enabled else None),
+                                            skip_paths=job.skip_paths)
+                progress.counted = sum(1 for _ in files)
+
+    def _make_executor(self):
+        if self.pool_kind == tagging.POOL_PROCESSES:
+            return ProcessPoolExecutor(max_workers=self.workers)
+        return ThreadPoolExecutor(max_workers=self.workers)
+
+    def _open_duplicate_index(self):
+        if not self.duplicate_root:
+            return None
+        try:
+            import duplicates
+        except ImportError as e:
+            log.warning("Duplicate check disabled (%s).", e)
+            return None
+        return duplicates.DuplicateIndex.for_root(self.duplicate_root)
+
+    def _next_job(self, active):
+        """Index of the job to start now, or None."""
+        if self.cancel_event.is_set() or len(active) >= MAX_ACTIVE_JOBS:
+            return None
+        if not all(pipeline.draining.is_set() for pipeline in active.values()):
+            return None
+        busy = {os.path.normcase(os.path.abspath(self.progress[i].job.dest_dir)) for i in active}
+        with self.lock:
+            for index, progress in enumerate(self.progress):
+                if progress.state == STATE_QUEUED:
+                    dest = os.path.normcase(os.path.abspath(progress.job.dest_dir))
+                    return None if dest in busy else index
+        return None
+
+    def _start_job(self, index, executor, dup_index):
+        progress = self.progress[index]
+        job = progress.job
+        if dup_index is not None and not _is_under(job.dest_dir, self.duplicate_root):
+            log.warning("Not checking %s for duplicates: its album is not under %s.",
+                        job.name, self.duplicate_root)
+            dup_index = None
+        pipeline = tagging.TaggingPipeline(workers=self.workers, pool_kind=self.pool_kind, resume=self.resume,
+                                           output_mode=self.output_mode, link_mode=self.link_mode,
+                                           executor=executor, duplicate_index=dup_index)
+        files = tagging.scan_source(job.source, recursive=self.recursive,
+                                    exclude_dirs=(job.dest_dir, job.move_dest if job.move_enabled else None),
+                                    skip_paths=job.skip_paths)
+        exif_gps_dict = tagging.convert_gps_to_exif(*job.gps_data) if job.gps_data else {}
+        with self.lock:
+            progress.state = STATE_RUNNING
+            progress.started = time.monotonic()
+        pipeline.start(job.source, job.dest_dir, files, job.exif_date, exif_gps_dict,
+                       job.move_enabled, job.move_dest)
+        self.events.put(("job_started", index))
+        return pipeline
+
+    def _run(self):
+        active = {}
+        dup_index = self._open_duplicate_index()
+        try:
+            with self._make_executor() as executor:
+                if dup_index is not None:
+                    # Once for all jobs: they keep it up to date as their photos land.
+                    dup_index.refresh(map_func=executor.map)
+                while True:
+                    index = self._next_job(active)
+                    if index is not None:
+                        active[index] = self._start_job(index, executor, dup_index)
+                        continue
+                    if not active:
+                        break
+                    if self.cancel_event.is_set():
+                        for pipeline in active.values():
+                            pipeline.cancel()
+                    for index, pipeline in list(active.items()):
+                        self._forward(index, pipeline, active)
+                    time.sleep(0.05)
+        finally:
+            if dup_index is not None:
+                dup_index.close()
+            self.events.put(("finished", self.cancel_event.is_set()))
+
+    def _forward(self, index, pipeline, active):
+        progress = self.progress[index]
+        try:
+            while True:
+                event = pipeline.events.get_nowait()
+                with self.lock:
+                    progress.apply(event)
+                    if event[0] == "finished":
+                        progress.state = STATE_CANCELLED if event[1] else STATE_DONE
+                        progress.finished = time.monotonic()
+                    self.meter.update(sum(p.done for p in self.progress))
+                self.events.put(("job", index, event))
+                if event[0] == "finished":
+                    del active[index]
+                    self.events.put(("job_finished", index))
+                    return
+        except queue.Empty:
+            pass
+
+
+## Display helpers
+def format_duration(seconds):
+    if seconds is None:
+        return "--:--"
+    seconds = int(seconds + 0.5)
+    hours, rest = divmod(seconds, 3600)
+    return f"{hours}:{rest // 60:02d}:{rest % 60:02d}" if hours else f"{rest // 60}:{rest % 60:02d}"
+
+
+def format_rate(rate):
+    return f"{rate:.1f}/s" if rate else "-"
+
+
+def describe_progress(progress):
+    """(status, photos, rate, eta) strings for one job."""
+    total = f"{progress.total}{'' if progress.total_known else '+'}"
+    photos = f"{progress.done} / {total}" if progress.state != STATE_QUEUED else total if progress.counted is not None else "?"
+    if progress.state == STATE_RUNNING:
+        return (progress.state, photos, format_rate(progress.meter.rate()),
+                format_duration(progress.meter.eta(progress.remaining)))
+    status = progress.state
+    if progress.errors:
+        status += f", {len(progress.errors)} errors"
+    rate = progress.done / progress.elapsed() if progress.finished and progress.elapsed() else None
+    return status, photos, format_rate(rate), ""
+
+
+def describe_overall(scheduler):
+    done, total, known, rate, eta = scheduler.overall()
+    return (f"{done} / {total}{'' if known else '+'} photos, {format_rate(rate)}, "
+            f"ETA {format_duration(eta)}{'' if known else '+'}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the import jobs of a CSV or JSON manifest.")
+    parser.add_argument("manifest", help="CSV (with a header row) or JSON file with the columns "
+                                         + ", ".join(MANIFEST_FIELDS))
+    parser.add_argument("--albums-dir", help="Parent directory of the albums (unless set per job)")
+    parser.add_argument("--workers", type=int, default=tagging.default_worker_count(),
+                        help="Photos tagged in parallel (default: number of CPUs)")
+    parser.add_argument("--processes", action="store_true", help="Use a process pool instead of a thread pool")
+    parser.add_argument("--no-recursive", action="store_true", help="Don't import photos from sub-folders")
+    parser.add_argument("--no-resume", action="store_true", help="Retag photos already in the album journals")
+    parser.add_argument("--sidecar", action="store_true", help="Write .xmp sidecars instead of rewriting photos")
+    parser.add_argument("--skip-duplicates", action="store_true",
+                        help="Don't import photos already in one of the albums (needs --albums-dir)")
+    parser.add_argument("--status-every", type=float, default=5.0, metavar="SECONDS",
+                        help="Print the overall progress this often (default: 5)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(name)s: %(message)s")
+    if args.skip_duplicates and not args.albums_dir:
+        parser.error("--skip-duplicates needs --albums-dir")
+
+    try:
+        jobs = load_manifest(args.manifest, args.albums_dir)
+    except tagging.ValidationError as e:
+        parser.error(str(e))
+    if args.skip_duplicates:
+        # One duplicate index for the whole run: every album must be in it.
+        outside = [job.name for job in jobs if not _is_under(job.dest_dir, args.albums_dir)]
+        if outside:
+            more = f" (and {len(outside) - 1} more jobs)" if len(outside) > 1 else ""
+            parser.error(f"--skip-duplicates: the album of {outside[0]} is not under {args.albums_dir}{more}")
+    scheduler = JobScheduler(workers=args.workers,
+                             pool_kind=tagging.POOL_PROCESSES if args.processes else tagging.POOL_THREADS,
+                             resume=not args.no_resume, recursive=not args.no_recursive,
+                             output_mode=tagging.OUTPUT_SIDECAR if args.sidecar else tagging.OUTPUT_REWRITE,
+                             duplicate_root=args.albums_dir if args.skip_duplicates else None)
+    for job in jobs:
+        scheduler.add(job)
+    scheduler.start()
+
+    next_status = time.monotonic() + args.status_every
+    while True:
+        try:
+            event = scheduler.events.get(timeout=0.5)
+        except queue.Empty:
+            event = None
+        except KeyboardInterrupt:
+            scheduler.cancel()
+            continue
+        if time.monotonic() >= next_status:
+            print(describe_overall(scheduler))
+            next_status = time.monotonic() + args.status_every
+        if event is None:
+            continue
+        if event[0] == "job_started":
+            print(f"Started {scheduler.progress[event[1]].job.name}")
+        elif event[0] == "job_finished":
+            progress = scheduler.progress[event[1]]
+            status, photos, rate, _ = describe_progress(progress)
+            print(f"Finished {progress.job.name}: {status}, {photos} photos, {rate}")
+            for filename in progress.errors:
+                print(f"  error: {filename}")
+        elif event[0] == "finished":
+            print(describe_overall(scheduler))
+            cancelled = event[1]
+            break
+    failed = any(p.errors for p in scheduler.progress)
+    return 1 if failed or cancelled else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
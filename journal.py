@@ -0,0 +1,168 @@
+"""
+Per-album import journal.
+
+Records every source photo that has been tagged into an album (keyed by
+source path, size, mtime and a fast content hash) so that an interrupted or
+repeated import can skip work that is already done. Stored as a small SQLite
+database inside the album folder, created with the first record (an import
+that tags nothing leaves no file behind).
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+JOURNAL_FILENAME = ".photo-tagger-journal.sqlite"
+
+# Bytes hashed from the start and from the end of each file.
+HASH_SAMPLE_SIZE = 64 * 1024
+
+# Commit after this many records (a crash only loses the last uncommitted batch).
+COMMIT_EVERY = 50
+
+
+def journal_path_for(album_dir):
+    return os.path.join(album_dir, JOURNAL_FILENAME)
+
+
+def fast_hash(path, size=None):
+    """
+    Hashes the first and last HASH_SAMPLE_SIZE bytes plus the file size.
+    Much cheaper than a full hash on 40 MB scans, and enough to tell files apart.
+    """
+    if size is None:
+        size = os.path.getsize(path)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(size.to_bytes(8, "little"))
+    with open(path, "rb") as f:
+        h.update(f.read(HASH_SAMPLE_SIZE))
+        if size > HASH_SAMPLE_SIZE * 2:
+            f.seek(size - HASH_SAMPLE_SIZE)
+        h.update(f.read(HASH_SAMPLE_SIZE))
+    return h.hexdigest()
+
+
+def fingerprint(path):
+    """Returns (size, mtime_ns, content_hash) for a file."""
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns, fast_hash(path, st.st_size)
+
+
+def make_tag_key(exif_date, exif_gps_dict):
+    """A stable string describing the tags written, so a rerun with other tags is not skipped."""
+    date = exif_date.decode("ascii", "replace") if isinstance(exif_date, bytes) else str(exif_date)
+    gps = sorted((k, repr(v)) for k, v in (exif_gps_dict or {}).items())
+    return f"{date}|{gps}"
+
+
+class ImportJournal:
+    """
+    SQLite journal of tagged files. Safe to share between the pipeline's
+    coordinator thread (lookups) and its I/O stage (records).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.conn = None
+        self._uncommitted = 0
+        if os.path.exists(path):
+            self._connect()
+
+    @classmethod
+    def for_album(cls, album_dir):
+        return cls(journal_path_for(album_dir))
+
+    def _connect(self):
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                source_path   TEXT PRIMARY KEY,
+                size          INTEGER NOT NULL,
+                mtime_ns      INTEGER NOT NULL,
+                content_hash  TEXT NOT NULL,
+                dest_path     TEXT NOT NULL,
+                dest_size     INTEGER NOT NULL,
+                dest_mtime_ns INTEGER NOT NULL,
+                tag_key       TEXT NOT NULL,
+                archived_to   TEXT,
+                updated       REAL NOT NULL
+            )""")
+        self.conn.commit()
+
+    def is_done(self, source_path, dest_path, tag_key, source_stat=None):
+        """
+        True if source_path was already tagged to dest_path with the same tags,
+        the source is unchanged and the output is still there untouched.
+        Only hashes the source when its mtime changed but the size did not.
+        source_stat, if given, is a cached (size, mtime_ns) for the source.
+        """
+        with self.lock:
+            if self.conn is None:
+                return False
+            row = self.conn.execute(
+                "SELECT size, mtime_ns, content_hash, dest_path, dest_size, dest_mtime_ns, tag_key "
+                "FROM files WHERE source_path = ?", (os.path.abspath(source_path),)).fetchone()
+        if row is None:
+            return False
+        size, mtime_ns, content_hash, rec_dest, dest_size, dest_mtime_ns, rec_tag_key = row
+        if rec_tag_key != tag_key or rec_dest != os.path.abspath(dest_path):
+            return False
+
+        try:
+            dest_st = os.stat(dest_path)
+            if source_stat is None:
+                src_st = os.stat(source_path)
+                source_stat = (src_st.st_size, src_st.st_mtime_ns)
+        except OSError:
+            return False
+        if dest_st.st_size != dest_size or dest_st.st_mtime_ns != dest_mtime_ns:
+            return False
+        src_size, src_mtime_ns = source_stat
+        if src_size != size:
+            return False
+        if src_mtime_ns != mtime_ns and fast_hash(source_path, src_size) != content_hash:
+            return False
+        return True
+
+    def record_tagged(self, source_path, dest_path, tag_key, source_fingerprint):
+        size, mtime_ns, content_hash = source_fingerprint
+        dest_st = os.stat(dest_path)
+        with self.lock:
+            if self.conn is None:
+                self._connect()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO files (source_path, size, mtime_ns, content_hash, dest_path, "
+                "dest_size, dest_mtime_ns, tag_key, archived_to, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, NULL, ?)",
+                (os.path.abspath(source_path), size, mtime_ns, content_hash, os.path.abspath(dest_path),
+                 dest_st.st_size, dest_st.st_mtime_ns, tag_key, time.time()))
+            self._maybe_commit()
+
+    def record_archived(self, source_path, archived_to):
+        with self.lock:
+            if self.conn is None:
+                return  # nothing recorded to update
+            self.conn.execute("UPDATE files SET archived_to = ?, updated = ? WHERE source_path = ?",
+                              (os.path.abspath(archived_to), time.time(), os.path.abspath(source_path)))
+            self._maybe_commit()
+
+    def _maybe_commit(self):
+        self._uncommitted += 1
+        if self._uncommitted >= COMMIT_EVERY:
+            self.commit()
+
+    def commit(self):
+        with self.lock:
+            if self.conn is not None:
+                self.conn.commit()
+            self._uncommitted = 0
+
+    def close(self):
+        with self.lock:
+            self.commit()
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
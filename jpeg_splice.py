@@ -0,0 +1,181 @@
+"""
+Lossless EXIF splicing for JPEG files.
+
+Only the APP1/EXIF segment is replaced (or inserted). Every other byte of the
+file - other APPn segments, ICC profiles, quantization tables and the
+entropy-coded scan data - is streamed to the destination unchanged, so the
+image is never decoded or re-compressed.
+"""
+import os
+
+import file_ops
+
+EXIF_HEADER = b"Exif\x00\x00"
+MAX_SEGMENT_PAYLOAD = 0xFFFF - 2
+# Below malloc's mmap threshold, so the compare buffers aren't page-faulted in anew for every file.
+COMPARE_CHUNK_SIZE = 64 * 1024
+
+# Markers that stand alone (no length field).
+_STANDALONE_MARKERS = {0x01} | set(range(0xD0, 0xD8))
+_SOI = 0xD8
+_EOI = 0xD9
+_SOS = 0xDA
+_APP0 = 0xE0
+_APP1 = 0xE1
+
+
+class SpliceError(ValueError):
+    """Raised when a file cannot be spliced losslessly."""
+
+
+def scan_header(f):
+    """
+    Walks the JPEG marker segments of an open binary file up to the first SOS.
+    Returns a list of (marker, start, end) tuples, where start is the offset of
+    the 0xFF byte and end is the offset just past the segment.
+    """
+    f.seek(0)
+    if f.read(2) != b"\xff\xd8":
+        raise SpliceError("Not a JPEG file (missing SOI marker).")
+
+    segments = []
+    pos = 2
+    while True:
+        f.seek(pos)
+        byte = f.read(1)
+        if byte != b"\xff":
+            raise SpliceError(f"Expected marker at offset {pos}.")
+        start = pos
+        # Skip fill bytes (any number of 0xFF before the marker code).
+        while byte == b"\xff":
+            byte = f.read(1)
+            pos += 1
+        if not byte:
+            raise SpliceError("Unexpected end of file in header.")
+        marker = byte[0]
+        pos += 1
+
+        if marker in (_SOI, _EOI):
+            raise SpliceError(f"Unexpected marker 0x{marker:02X} before scan data.")
+        if marker in _STANDALONE_MARKERS:
+            segments.append((marker, start, pos))
+            continue
+
+        length_bytes = f.read(2)
+        if len(length_bytes) != 2:
+            raise SpliceError("Unexpected end of file in segment length.")
+        length = int.from_bytes(length_bytes, "big")
+        if length < 2:
+            raise SpliceError(f"Invalid segment length at offset {start}.")
+        end = pos + length
+        segments.append((marker, start, end))
+
+        if marker == _SOS:
+            return segments
+        pos = end
+
+
+def _find_exif_segment(f, segments):
+    for marker, start, end in segments:
+        if marker != _APP1:
+            continue
+        f.seek(start)
+        header = f.read(end - start)
+        # Skip the fill bytes, marker and length field.
+        payload_start = header.index(bytes([_APP1])) + 3
+        if header[payload_start:payload_start + len(EXIF_HEADER)] == EXIF_HEADER:
+            return start, end, header[payload_start:]
+    return None
+
+
+def _exif_bounds(f, segments):
+    """(start, end) of the EXIF segment, or the empty range where splice_exif inserts one."""
+    found = _find_exif_segment(f, segments)
+    if found:
+        return found[0], found[1]
+    insert_at = segments[0][2] if segments and segments[0][0] == _APP0 else 2
+    return insert_at, insert_at
+
+
+def read_exif(path):
+    """
+    Returns the raw APP1 EXIF payload (starting with b'Exif\\x00\\x00') of a
+    JPEG file, or b'' if it has none. Only the header segments are read.
+    """
+    with open(path, "rb") as f:
+        segments = scan_header(f)
+        found = _find_exif_segment(f, segments)
+    return found[2] if found else b""
+
+
+def locate_exif(f):
+    """
+    Finds the EXIF payload of an open JPEG file. Returns (offset, payload),
+    offset being the file position of the payload's b'Exif' header, or None
+    if the file has no EXIF segment.
+    """
+    found = _find_exif_segment(f, scan_header(f))
+    if not found:
+        return None
+    _, end, payload = found
+    return end - len(payload), payload
+
+
+def splice_exif(source_path, dest_path, exif_bytes):
+    """
+    Copies source_path to dest_path, replacing the APP1/EXIF segment with
+    exif_bytes (as returned by piexif.dump). If the source has no EXIF
+    segment, one is inserted after SOI (and after a leading JFIF APP0).
+    The output is byte-identical to the source outside of the APP1 segment.
+    """
+    if not exif_bytes.startswith(EXIF_HEADER):
+        raise SpliceError("EXIF data must start with the 'Exif' header.")
+    if len(exif_bytes) > MAX_SEGMENT_PAYLOAD:
+        raise SpliceError(f"EXIF data too large for one APP1 segment ({len(exif_bytes)} bytes).")
+
+    new_segment = b"\xff\xe1" + (len(exif_bytes) + 2).to_bytes(2, "big") + exif_bytes
+
+    with open(source_path, "rb") as src:
+        # Validate the whole header before touching the destination.
+        keep_until, resume_at = _exif_bounds(src, scan_header(src))
+
+        if os.path.abspath(source_path) == os.path.abspath(dest_path):
+            raise SpliceError("Source and destination must be different files.")
+
+        with open(dest_path, "wb") as dst:
+            src.seek(0)
+            dst.write(src.read(keep_until))
+            dst.write(new_segment)
+            # The scan data is copied in-kernel (copy_file_range) where supported.
+            file_ops.copy_stream(src, dst, resume_at)
+
+
+def same_payload(source_path, dest_path):
+    """
+    True if dest_path is source_path apart from the APP1/EXIF segment, i.e.
+    if everything splice_exif copies unchanged arrived intact. Only the
+    headers are parsed; the scan data of both files is streamed and compared
+    chunk by chunk.
+    """
+    with open(source_path, "rb") as src, open(dest_path, "rb") as dst:
+        src_start, src_end = _exif_bounds(src, scan_header(src))
+        dst_start, dst_end = _exif_bounds(dst, scan_header(dst))
+        if (src_start != dst_start or
+                os.fstat(src.fileno()).st_size - src_end != os.fstat(dst.fileno()).st_size - dst_end):
+            return False
+        src.seek(0)
+        dst.seek(0)
+        if src.read(src_start) != dst.read(dst_start):
+            return False
+        src.seek(src_end)
+        dst.seek(dst_end)
+        # Full chunks compare with one memcmp, without allocating a bytes object per read.
+        src_buffer, dst_buffer = bytearray(COMPARE_CHUNK_SIZE), bytearray(COMPARE_CHUNK_SIZE)
+        while True:
+            n = src.readinto(src_buffer)
+            if dst.readinto(dst_buffer) != n:
+                return False
+            if n < COMPARE_CHUNK_SIZE:
+                return src_buffer[:n] == dst_buffer[:n]
+            if src_buffer != dst_buffer:
+                return False
@@ -0,0 +1,39 @@
+"""
+TkinterMapView that loads its tiles through a tile_cache.TileProvider
+(MBTiles archives, persistent disk cache, then the network).
+"""
+import io
+
+from PIL import Image, ImageTk, UnidentifiedImageError
+from tkintermapview import TkinterMapView
+
+
+class CachedMapView(TkinterMapView):
+
+    def __init__(self, *args, tile_provider=None, **kwargs):
+        self.tile_provider = tile_provider
+        super().__init__(*args, **kwargs)
+
+    def request_image(self, zoom, x, y, db_cursor=None):
+        # Called from the map's background loading threads.
+        if self.tile_provider is None:
+            return super().request_image(zoom, x, y, db_cursor=db_cursor)
+
+        data = self.tile_provider.get_tile(self.tile_server, zoom, x, y)
+        if data is None:
+            # Not cached and not reachable: don't remember it, so it is retried later.
+            return self.empty_tile_image
+
+        try:
+            image = Image.open(io.BytesIO(data))
+            if not self.running:
+                return self.empty_tile_image
+            image_tk = ImageTk.PhotoImage(image)
+        except UnidentifiedImageError:
+            self.tile_image_cache[f"{zoom}{x}{y}"] = self.empty_tile_image
+            return self.empty_tile_image
+        except Exception:
+            return self.empty_tile_image
+
+        self.tile_image_cache[f"{zoom}{x}{y}"] = image_tk
+        return image_tk
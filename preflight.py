@@ -0,0 +1,295 @@
+"""
+Read-only pre-flight check of a source folder.
+
+Reports, before an import, which photos already have dates or GPS that the
+import would overwrite, which have EXIF that cannot be parsed, and which
+have the SceneType/FileSource quirk that tagging fixes up. Only the start
+of each file is read (HEADER_READ_SIZE, enough for the JPEG APP1 segment);
+TIFF IFDs beyond it are fetched with small positioned reads instead of
+loading the file. Nothing is decoded and nothing is written.
+
+    python preflight.py /scans --date 1985-07-14 --lat 48.8566 --lon 2.3522
+"""
+import argparse
+import io
+import os
+import struct
+import sys
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import piexif
+
+import jpeg_splice
+import scanner
+import tagging
+
+HEADER_READ_SIZE = 64 * 1024
+# Further reads (TIFF IFDs past the header, late JPEG segments) are rounded up to this.
+PAGE_SIZE = 4096
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+STATUS_OK = "ok"
+STATUS_NO_EXIF = "no_exif"
+STATUS_CORRUPT = "corrupt"
+STATUS_UNREADABLE = "unreadable"
+
+# date_original/date_digitized are EXIF date strings, gps a (lat, lon) in
+# decimal degrees, quirks the names of fields stored with the wrong type.
+FileReport = namedtuple("FileReport", ["rel_path", "status", "date_original", "date_digitized", "gps",
+                                       "quirks", "error", "bytes_read"])
+
+
+class _FileView:
+    """
+    Read-only bytes-like view of a file for piexif: the header is read once,
+    any slice past it is read on demand. Only slicing is supported.
+    """
+
+    def __init__(self, f, head):
+        self.f = f
+        self.head = head
+        self.size = os.fstat(f.fileno()).st_size
+        self.bytes_read = len(head)
+        self.pages = {}
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice) or key.step not in (None, 1):
+            raise TypeError("_FileView only supports simple slices")
+        start, stop, _ = key.indices(self.size)
+        if stop <= len(self.head):
+            return self.head[start:stop]
+        first, last = start // PAGE_SIZE, (max(stop, start + 1) - 1) // PAGE_SIZE
+        chunks = []
+        for page in range(first, last + 1):
+            if page not in self.pages:
+                self.f.seek(page * PAGE_SIZE)
+                self.pages[page] = self.f.read(PAGE_SIZE)
+                self.bytes_read += len(self.pages[page])
+            chunks.append(self.pages[page])
+        data = b"".join(chunks)
+        offset = first * PAGE_SIZE
+        return data[start - offset:stop - offset]
+
+
+def _png_exif(f, head):
+    """The eXIf chunk of a PNG (raw TIFF data), or b''. Stops at the first IDAT."""
+    pos = len(PNG_SIGNATURE)
+    while True:
+        chunk_header = head[pos:pos + 8]
+        if len(chunk_header) < 8:
+            f.seek(pos)
+            chunk_header = f.read(8)
+            if len(chunk_header) < 8:
+                return b""
+        length, kind = struct.unpack(">L4s", chunk_header)
+        if kind == b"IDAT" or kind == b"IEND":
+            return b""
+        if kind == b"eXIf":
+            data = head[pos + 8:pos + 8 + length]
+            if len(data) < length:
+                f.seek(pos + 8)
+                data = f.read(length)
+            return data
+        pos += 12 + length
+
+
+def read_raw_exif(f):
+    """
+    Returns the raw EXIF of an open image file without decoding it, as
+    something piexif.load accepts (b'' when there is none).
+    """
+    head = f.read(HEADER_READ_SIZE)
+    if head[:2] == b"\xff\xd8":
+        try:
+            found = jpeg_splice.locate_exif(io.BytesIO(head))
+        except jpeg_splice.SpliceError:
+            if len(head) < HEADER_READ_SIZE:
+                raise
+            # Segments continue past the header (e.g. a large ICC profile): walk the file.
+            found = jpeg_splice.locate_exif(f)
+        return found[1] if found else b""
+    if head[:4] in (b"II*\x00", b"MM\x00*"):
+        return _FileView(f, head)
+    if head.startswith(PNG_SIGNATURE):
+        return _png_exif(f, head)
+    return b""
+
+
+def _gps_decimal(gps):
+    """(lat, lon) in decimal degrees from a piexif GPS dict, or None."""
+    try:
+        values = []
+        for coord_tag, ref_tag in ((piexif.GPSIFD.GPSLatitude, piexif.GPSIFD.GPSLatitudeRef),
+                                   (piexif.GPSIFD.GPSLongitude, piexif.GPSIFD.GPSLongitudeRef)):
+            (d, d_den), (m, m_den), (s, s_den) = gps[coord_tag]
+            value = d / d_den + m / m_den / 60 + s / s_den / 3600
+            if gps.get(ref_tag) in (b"S", b"W"):
+                value = -value
+            values.append(value)
+        return tuple(values)
+    except (KeyError, ValueError, TypeError, ZeroDivisionError):
+        return None
+
+
+def _text(value):
+    if isinstance(value, bytes):
+        return value.rstrip(b"\x00").decode("ascii", "replace")
+    return None
+
+
+def check_file(path, rel_path=None):
+    """Inspects one file. Never raises: problems are reported in the FileReport."""
+    rel_path = rel_path or os.path.basename(path)
+    bytes_read = 0
+    try:
+        with open(path, "rb") as f:
+            raw = read_raw_exif(f)
+            error = None
+            exif_dict = None
+            if len(raw):
+                try:
+                    exif_dict = piexif.load(raw)
+                except Exception as e:
+                    error = str(e) or repr(e)
+            bytes_read = raw.bytes_read if isinstance(raw, _FileView) else f.tell()
+    except (OSError, jpeg_splice.SpliceError) as e:
+        return FileReport(rel_path, STATUS_UNREADABLE, None, None, None, (), str(e), bytes_read)
+    if error:
+        return FileReport(rel_path, STATUS_CORRUPT, None, None, None, (), error, bytes_read)
+    if exif_dict is None:
+        return FileReport(rel_path, STATUS_NO_EXIF, None, None, None, (), None, bytes_read)
+
+    exif = exif_dict.get("Exif") or {}
+    # Stored as BYTE instead of UNDEFINED: piexif reads an int, tagging converts it back.
+    quirks = tuple(name for tag, name in ((piexif.ExifIFD.SceneType, "SceneType"),
+                                          (piexif.ExifIFD.FileSource, "FileSource"))
+                   if isinstance(exif.get(tag), int))
+    return FileReport(rel_path, STATUS_OK,
+                      _text(exif.get(piexif.ExifIFD.DateTimeOriginal)),
+                      _text(exif.get(piexif.ExifIFD.DateTimeDigitized)),
+                      _gps_decimal(exif_dict.get("GPS") or {}),
+                      quirks, None, bytes_read)
+
+
+def _check_item(item):
+    return check_file(item.path, item.rel_path)
+
+
+def run_preflight(source_dir, recursive=True, workers=None, pool_kind=tagging.POOL_THREADS, exclude_dirs=()):
+    """Checks every photo of a source folder in parallel. Returns (reports, seconds)."""
+    start = time.perf_counter()
+    files = scanner.scan_images(source_dir, recursive=recursive, exclude_dirs=exclude_dirs)
+    workers = max(1, workers or tagging.default_worker_count())
+    if pool_kind == tagging.POOL_PROCESSES:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            reports = list(executor.map(_check_item, files, chunksize=64))
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            reports = list(executor.map(_check_item, files))
+    return reports, time.perf_counter() - start
+
+
+## Summary
+def summarize(reports, exif_date=None, gps_data=None):
+    """
+    Counts per category. With the date (EXIF bytes) and GPS (lat, lon) of the
+    planned import, also counts the photos whose existing values differ.
+    """
+    planned_date = exif_date.decode("ascii") if isinstance(exif_date, bytes) else exif_date
+    summary = {
+        "files": len(reports),
+        "no_exif": [], "corrupt": [], "unreadable": [], "quirks": [],
+        "with_date": [], "date_conflicts": [], "with_gps": [], "gps_conflicts": [],
+        "dates": Counter(),
+        "bytes_read": sum(r.bytes_read for r in reports),
+    }
+    for r in reports:
+        if r.status == STATUS_NO_EXIF:
+            summary["no_exif"].append(r.rel_path)
+        elif r.status == STATUS_CORRUPT:
+            summary["corrupt"].append(r.rel_path)
+        elif r.status == STATUS_UNREADABLE:
+            summary["unreadable"].append(r.rel_path)
+        if r.quirks:
+            summary["quirks"].append(r.rel_path)
+        existing_date = r.date_original or r.date_digitized
+        if existing_date:
+            summary["with_date"].append(r.rel_path)
+            summary["dates"][existing_date[:10]] += 1
+            if planned_date and any(d and d != planned_date for d in (r.date_original, r.date_digitized)):
+                summary["date_conflicts"].append(r.rel_path)
+        if r.gps:
+            summary["with_gps"].append(r.rel_path)
+            if gps_data and (abs(r.gps[0] - gps_data[0]) > 1e-4 or abs(r.gps[1] - gps_data[1]) > 1e-4):
+                summary["gps_conflicts"].append(r.rel_path)
+    return summary
+
+
+def format_report(summary, seconds=None, examples=5):
+    """Human-readable table of a summary, with a few example files per category."""
+    files = summary["files"]
+    lines = [f"Pre-flight check: {files} files"
+             + (f" in {seconds:.2f} s" if seconds is not None else "")
+             + (f", {summary['bytes_read'] / files / 1024:.0f} KB read per file" if files else "")]
+    rows = [
+        ("Existing date", "with_date"),
+        ("  would be overwritten", "date_conflicts"),
+        ("Existing GPS", "with_gps"),
+        ("  would be overwritten", "gps_conflicts"),
+        ("No EXIF", "no_exif"),
+        ("Corrupt EXIF", "corrupt"),
+        ("SceneType/FileSource quirk (fixed on import)", "quirks"),
+        ("Unreadable", "unreadable"),
+    ]
+    for label, key in rows:
+        lines.append(f"  {label:<46}{len(summary[key]):>7}")
+    if summary["dates"]:
+        lines.append("Most common existing dates:")
+        for date, count in summary["dates"].most_common(5):
+            lines.append(f"  {date:<46}{count:>7}")
+    for label, key in (("Dates that would be overwritten", "date_conflicts"),
+                       ("GPS that would be overwritten", "gps_conflicts"),
+                       ("Corrupt EXIF", "corrupt"), ("Unreadable", "unreadable")):
+        if summary[key]:
+            lines.append(f"{label}:")
+            lines.extend(f"  {name}" for name in summary[key][:examples])
+            if len(summary[key]) > examples:
+                lines.append(f"  ... and {len(summary[key]) - examples} more")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Read-only EXIF pre-flight check of a source folder.")
+    parser.add_argument("source", help="Directory containing the scanned photos")
+    parser.add_argument("--date", help="Planned date (YYYY-MM-DD), to count the dates that would be overwritten")
+    parser.add_argument("--lat", type=float, help="Planned GPS latitude")
+    parser.add_argument("--lon", type=float, help="Planned GPS longitude")
+    parser.add_argument("--workers", type=int, default=tagging.default_worker_count())
+    parser.add_argument("--processes", action="store_true", help="Use a process pool instead of a thread pool")
+    parser.add_argument("--no-recursive", action="store_true", help="Don't look into sub-folders")
+    parser.add_argument("--examples", type=int, default=5, help="Files listed per category (default: 5)")
+    args = parser.parse_args(argv)
+
+    if (args.lat is None) != (args.lon is None):
+        parser.error("--lat and --lon must be given together")
+    try:
+        exif_date = tagging.make_exif_date(args.date) if args.date else None
+    except tagging.ValidationError as e:
+        parser.error(str(e))
+    if not os.path.isdir(args.source):
+        parser.error(f"'{args.source}' is not a directory")
+
+    reports, seconds = run_preflight(args.source, recursive=not args.no_recursive, workers=args.workers,
+                                     pool_kind=tagging.POOL_PROCESSES if args.processes else tagging.POOL_THREADS)
+    gps_data = (args.lat, args.lon) if args.lat is not None else None
+    print(format_report(summarize(reports, exif_date, gps_data), seconds, args.examples))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,55 @@
+"""
+Streaming source scanner.
+
+Walks a source tree with os.scandir and yields photos as soon as they are
+found, so tagging can start before the whole tree has been listed. Size and
+mtime come from the DirEntry stat cache (free on Windows, one stat per file
+elsewhere) and are passed along so later stages don't stat again.
+"""
+import logging
+import os
+from collections import namedtuple
+
+log = logging.getLogger(__name__)
+
+JPEG_EXTENSIONS = ('.jpg', '.jpeg')
+SCAN_EXTENSIONS = JPEG_EXTENSIONS + ('.tif', '.tiff', '.png')
+
+# rel_path is relative to the source directory and uses os.sep.
+ScannedFile = namedtuple("ScannedFile", ["rel_path", "path", "size", "mtime_ns"])
+
+
+def scan_images(source_dir, recursive=True, extensions=SCAN_EXTENSIONS, exclude_dirs=()):
+    """
+    Yields a ScannedFile for every image under source_dir.
+    Hidden directories and anything in exclude_dirs (e.g. an archive folder
+    inside the source tree) are skipped. Unreadable directories are reported
+    and skipped.
+    """
+    excluded = {os.path.normcase(os.path.abspath(d)) for d in exclude_dirs if d}
+    stack = [(source_dir, "")]
+    while stack:
+        directory, rel_dir = stack.pop()
+        try:
+            with os.scandir(directory) as it:
+                subdirs = []
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if (recursive and not entry.name.startswith('.')
+                                    and os.path.normcase(os.path.abspath(entry.path)) not in excluded):
+                                subdirs.append(entry)
+                            continue
+                        if not entry.name.lower().endswith(extensions) or not entry.is_file():
+                            continue
+                        st = entry.stat()
+                    except OSError as e:
+                        log.error("Could not read %s: %s", entry.path, e)
+                        continue
+                    yield ScannedFile(os.path.join(rel_dir, entry.name), entry.path, st.st_size, st.st_mtime_ns)
+        except OSError as e:
+            log.error("Could not scan %s: %s", directory, e)
+            continue
+        # Push in reverse so sub-folders are visited in listing order.
+        for entry in reversed(subdirs):
+            stack.append((entry.path, os.path.join(rel_dir, entry.name)))
@@ -0,0 +1,115 @@
+"""
+Size-bounded LRU cache of blobs in a single SQLite file, shared by the map
+tile cache (tile_cache.py) and the thumbnail cache (thumbnails.py).
+
+Each cache has its own table: its key columns, then `data`, `size` and
+`last_access`. Cache hits only record their access time in memory; the
+times are written in one batch at most every ACCESS_FLUSH_INTERVAL seconds
+(or once ACCESS_FLUSH_COUNT hits are pending), before evicting and on
+flush()/close(), so reading from the cache doesn't cost a commit per hit.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+# Cache hits are written out at most this often (s), or once this many are pending.
+ACCESS_FLUSH_INTERVAL = 60
+ACCESS_FLUSH_COUNT = 1024
+
+
+class SQLiteLRUCache:
+    """
+    LRU cache in `table`, keyed by `key_columns` ((name, SQL type) pairs).
+    Keys are tuples in that order. Thread-safe.
+    """
+
+    def __init__(self, path, table, key_columns, max_bytes):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.table = table
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        columns = "".join(f"{name} {kind} NOT NULL, " for name, kind in key_columns)
+        names = [name for name, _ in key_columns]
+        self.conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                {columns}data BLOB NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL,
+                PRIMARY KEY ({", ".join(names)})
+            )""")
+        self.conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_last_access ON {table} (last_access)")
+        self.conn.commit()
+        self.where_key = " AND ".join(f"{name}=?" for name in names)
+        self.total_bytes = self.conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {table}").fetchone()[0]
+        self.accessed = {}
+        self.last_flush = time.monotonic()
+
+    def get(self, key):
+        key = tuple(key)
+        with self.lock:
+            row = self.conn.execute(f"SELECT data FROM {self.table} WHERE {self.where_key}", key).fetchone()
+            if row is None:
+                return None
+            self.accessed[key] = time.time()
+            if (len(self.accessed) >= ACCESS_FLUSH_COUNT or
+                    time.monotonic() - self.last_flush >= ACCESS_FLUSH_INTERVAL):
+                self._write_access_times()
+                self.conn.commit()
+            return row[0]
+
+    def put(self, key, data):
+        key = tuple(key)
+        with self.lock:
+            self.accessed.pop(key, None)
+            freed = self._delete_replaced(key)
+            self.conn.execute(f"INSERT INTO {self.table} VALUES ({', '.join('?' * (len(key) + 3))})",
+                              key + (sqlite3.Binary(data), len(data), time.time()))
+            self.total_bytes += len(data) - freed
+            if self.total_bytes > self.max_bytes:
+                self._write_access_times()
+                self._evict()
+            self.conn.commit()
+
+    def _delete_replaced(self, key):
+        """Deletes the rows a put of `key` replaces and returns their size."""
+        freed = self.conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table} WHERE {self.where_key}",
+                                  key).fetchone()[0]
+        self.conn.execute(f"DELETE FROM {self.table} WHERE {self.where_key}", key)
+        return freed
+
+    def flush(self):
+        """Writes the pending access times."""
+        with self.lock:
+            self._write_access_times()
+            self.conn.commit()
+
+    def _write_access_times(self):
+        if self.accessed:
+            self.conn.executemany(f"UPDATE {self.table} SET last_access=? WHERE {self.where_key}",
+                                  [(t,) + key for key, t in self.accessed.items()])
+            self.accessed = {}
+        self.last_flush = time.monotonic()
+
+    def _evict(self):
+        """Drops least recently used entries until the cache is at 90% of its limit."""
+        target = self.max_bytes * 0.9
+        while self.total_bytes > target:
+            rows = self.conn.execute(
+                f"SELECT rowid, size FROM {self.table} ORDER BY last_access LIMIT 256").fetchall()
+            if not rows:
+                self.total_bytes = 0
+                break
+            for rowid, size in rows:
+                self.conn.execute(f"DELETE FROM {self.table} WHERE rowid=?", (rowid,))
+                self.total_bytes -= size
+                if self.total_bytes <= target:
+                    break
+
+    def close(self):
+        with self.lock:
+            self._write_access_times()
+            self.conn.commit()
+            self.conn.close()
@@ -0,0 +1,99 @@
+"""
+Startup timing of the GUI.
+
+The app marks its startup phases (imports done, window built, first paint,
+interactive, deferred widgets built) with mark(). The report is logged once
+the window is up with PHOTO_TAGGER_STARTUP=1, or printed before the app
+exits with --startup-report:
+
+    PHOTO_TAGGER_STARTUP=1 python tagger.py
+    python tagger.py --startup-report
+
+Times are from when tagger.py starts running (the interpreter's own startup
+is not included). The import part can be tracked without a display: this
+runs `python -X importtime -c "import tagger"` and lists the slowest
+imports, failing if importing tagger takes longer than the budget:
+
+    python startup_timing.py --top 15 --budget-ms 250
+"""
+# Imported first thing by the app, so argparse and subprocess are only imported where used.
+import os
+import sys
+import time
+
+STARTUP_ENV = "PHOTO_TAGGER_STARTUP"
+# Startup goal: an interactive window within this many ms.
+STARTUP_BUDGET_MS = 500
+
+_start = time.perf_counter()
+_marks = []
+
+
+def enabled():
+    return bool(os.environ.get(STARTUP_ENV))
+
+
+def mark(phase):
+    """Records that startup reached `phase` now."""
+    _marks.append((phase, time.perf_counter() - _start))
+
+
+def format_report():
+    lines = ["Startup timings (ms since start, ms since previous):"]
+    previous = 0.0
+    for phase, elapsed in _marks:
+        lines.append(f"  {phase:<20} {elapsed * 1000:8.1f} {(elapsed - previous) * 1000:+8.1f}")
+        previous = elapsed
+    interactive = dict(_marks).get("interactive")
+    if interactive is not None:
+        verdict = "within" if interactive * 1000 <= STARTUP_BUDGET_MS else "OVER"
+        lines.append(f"  interactive after {interactive * 1000:.0f} ms, {verdict} the {STARTUP_BUDGET_MS} ms goal")
+    return "\n".join(lines)
+
+
+def measure_imports(module="tagger"):
+    """
+    Imports module in a fresh interpreter with -X importtime. Returns
+    (module_us, startup_us, [(cumulative_us, self_us, depth, name)] for
+    every module), startup_us being the interpreter's own imports (site etc.).
+    """
+    import subprocess
+    here = os.path.dirname(os.path.abspath(__file__))
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=here, capture_output=True, text=True, check=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((int(cumulative_us), int(self_us), depth, name.strip()))
+    module_us = sum(cumulative for cumulative, _, depth, name in rows if depth == 0 and name == module)
+    startup_us = sum(cumulative for cumulative, _, depth, name in rows if depth == 0 and name != module)
+    return module_us, startup_us, rows
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Report the import time of the GUI (like python -X importtime).")
+    parser.add_argument("--module", default="tagger")
+    parser.add_argument("--top", type=int, default=15, help="Number of slowest imports to list")
+    parser.add_argument("--budget-ms", type=float, help="Exit with status 1 if the imports take longer")
+    args = parser.parse_args(argv)
+
+    total, startup, rows = measure_imports(args.module)
+    # Only modules imported at this point for the first time count; their
+    # cumulative time includes the modules they import.
+    print(f"{'cumulative ms':>14} {'self ms':>8}  module")
+    for cumulative, self_us, depth, name in sorted(rows, reverse=True)[:args.top]:
+        print(f"{cumulative / 1000:14.1f} {self_us / 1000:8.1f}  {'  ' * depth}{name}")
+    print(f"import {args.module}: {total / 1000:.1f} ms, after {startup / 1000:.1f} ms of interpreter startup "
+          f"({len(rows)} modules)")
+    if args.budget_ms is not None and total / 1000 > args.budget_ms:
+        print(f"Over the budget of {args.budget_ms:.0f} ms.", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
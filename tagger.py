@@ -1,21 +1,43 @@
+import startup_timing  # first: its clock measures the imports below
 import customtkinter as ctk
 import tkinter as tk
 from tkinter import filedialog, messagebox
-from tkcalendar import Calendar
-from tkintermapview import TkinterMapView
 import os
-import shutil
-import piexif
-from PIL import Image
 import datetime
+import importlib
+import logging
+import queue
+import threading
+import albums
+import instrumentation
+import tagging
+import gazetteer
+# The map (tkintermapview, ~200 ms to import), calendar, thumbnails,
+# pre-flight and job queue modules are imported where they are first used,
+# so the window shows up quickly (see on_first_paint).
+
+log = logging.getLogger(__name__)
+
+# How often the UI drains progress events from the worker pool (ms)
+PROGRESS_POLL_MS = 100
+
+# Delay after the last keystroke before refreshing place suggestions (ms)
+SEARCH_DEBOUNCE_MS = 120
+
+# Visible rows of the album picker's list
+ALBUM_LIST_ROWS = 12
+
+# Delay between the first paint and building the calendar (ms), so the window is drawn first
+DEFERRED_BUILD_MS = 10
 
 # Set application appearance (Dark mode, Blue theme)
 ctk.set_appearance_mode("dark")
 ctk.set_default_color_theme("blue")
 
 class PhotoImporterApp(ctk.CTk):
-    def __init__(self):
+    def __init__(self, exit_after_startup=False):
         super().__init__()
+        self.exit_after_startup = exit_after_startup
 
         self.title("Photo Scan Exif Tagger v1.0")
         self.geometry("1100x850")
@@ -24,6 +46,10 @@ class PhotoImporterApp(ctk.CTk):
         self.source_dir = ctk.StringVar()
         self.target_dir = ctk.StringVar()
         self.selected_album = ctk.StringVar()
+        self.nested_albums = ctk.BooleanVar(value=False)
+        self.album_index = None
+        self.album_matches = []
+        self._album_after_id = None
         self.selected_gps = None  # Will store (latitude, longitude)
         self.map_marker = None
         
@@ -32,20 +58,90 @@ class PhotoImporterApp(ctk.CTk):
         self.move_dest_dir = ctk.StringVar()
         # -------------------------------------
 
+        # Worker pool settings for the tagging pipeline
+        self.worker_count = ctk.StringVar(value=str(tagging.default_worker_count()))
+        self.pool_kind = ctk.StringVar(value=tagging.POOL_THREADS)
+        self.resume_import = ctk.BooleanVar(value=True)
+        self.sidecar_output = ctk.BooleanVar(value=False)
+        self.skip_duplicates = ctk.BooleanVar(value=False)
+        self.recursive_scan = ctk.BooleanVar(value=True)
+        self.pipeline = None
+        self.queue_window = None
+
+        # Offline geocoder (loaded in the background, None until ready or if not built)
+        self.gazetteer = None
+        self.allow_online_search = ctk.BooleanVar(value=False)
+        self.suggestions = []
+        self._search_after_id = None
+
+        # Built after the first paint or on first use
+        self.calendar = None
+        self.map_widget = None
+        self.tile_provider = None
+        self.thumbnail_loader = None
+        self.thumbnail_grid = None
+        self._map_imported = threading.Event()
+        self._map_error = None
+
         # Configure the main grid
         # Column 1 (map) will be wider
         self.grid_columnconfigure(0, weight=1)
         self.grid_columnconfigure(1, weight=3)
         self.grid_rowconfigure(0, weight=0)  # Row for directories
         self.grid_rowconfigure(1, weight=0)  # Row for album
-        self.grid_rowconfigure(2, weight=1)  # Row for calendar + map
+        self.grid_rowconfigure(2, weight=1)  # Row for calendar + map / photo preview
         self.grid_rowconfigure(3, weight=0)  # Row for import button
 
         self.create_directory_widgets()
         self.create_album_widgets()
         self.create_date_widgets()
         self.create_map_widgets()
+        self.create_preview_widgets()
         self.create_action_widgets()
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+        startup_timing.mark("window built")
+        self.after_idle(self.on_first_paint)
+
+    ## 0. Deferred startup
+    def on_first_paint(self):
+        """Loads the slow parts once the window is on screen: the map modules and gazetteer in the background."""
+        startup_timing.mark("first paint")
+        threading.Thread(target=self.import_map_modules, daemon=True).start()
+        threading.Thread(target=self.load_gazetteer, daemon=True).start()
+        self.after(DEFERRED_BUILD_MS, self.build_deferred_widgets)
+
+    def import_map_modules(self):
+        # Only imported here; build_map() then finds them in sys.modules.
+        try:
+            importlib.import_module("map_view")
+            importlib.import_module("tile_cache")
+        except Exception as e:
+            log.error("Could not load the map: %s", e)
+            self._map_error = e
+        self._map_imported.set()
+
+    def build_deferred_widgets(self):
+        self.ensure_calendar()
+        current_year = datetime.date.today().year
+        self.year_dropdown.configure(values=[str(y) for y in range(current_year, 1899, -1)])
+        startup_timing.mark("interactive")
+        self.wait_for_map()
+
+    def wait_for_map(self):
+        """Builds the map once its modules are imported, then reports the startup timings."""
+        if not self._map_imported.is_set():
+            self.after(PROGRESS_POLL_MS, self.wait_for_map)
+            return
+        if self._map_error is None:
+            self.ensure_map()
+        else:
+            self.map_placeholder.configure(text=f"Map not available: {self._map_error}")
+        startup_timing.mark("map ready")
+        if startup_timing.enabled():
+            log.info("%s", startup_timing.format_report())
+        if self.exit_after_startup:
+            print(startup_timing.format_report())
+            self.on_close()
 
     ## 1. Directory Widgets
     def create_directory_widgets(self):
@@ -58,6 +154,8 @@ class PhotoImporterApp(ctk.CTk):
         ctk.CTkLabel(frame, text="Source Directory:").grid(row=0, column=0, padx=(10, 5), pady=5, sticky="w")
         ctk.CTkEntry(frame, textvariable=self.source_dir).grid(row=0, column=1, padx=5, pady=5, sticky="ew")
         ctk.CTkButton(frame, text="Browse...", command=self.select_source).grid(row=0, column=2, padx=(5, 10), pady=5)
+        ctk.CTkCheckBox(frame, text="Include sub-folders", variable=self.recursive_scan,
+                        command=self.show_source_preview).grid(row=0, column=3, padx=(5, 10), pady=5, sticky="w")
 
         # Target
         ctk.CTkLabel(frame, text="Albums Directory:").grid(row=1, column=0, padx=(10, 5), pady=5, sticky="w")
@@ -71,11 +169,33 @@ class PhotoImporterApp(ctk.CTk):
         frame.grid_columnconfigure(1, weight=1)
 
         ctk.CTkLabel(frame, text="Album:").grid(row=0, column=0, padx=(10, 5), pady=10)
-        
-        self.album_dropdown = ctk.CTkOptionMenu(frame, variable=self.selected_album, values=[""], state="disabled")
-        self.album_dropdown.grid(row=0, column=1, padx=5, pady=10, sticky="ew")
-        
-        ctk.CTkButton(frame, text="Refresh ↻", command=self.refresh_albums).grid(row=0, column=2, padx=(5, 10), pady=10)
+
+        # Type to filter the albums; the matches are listed below the entry
+        self.album_entry = ctk.CTkEntry(frame, textvariable=self.selected_album, state="disabled")
+        self.album_entry.grid(row=0, column=1, padx=5, pady=10, sticky="ew")
+        self.album_entry.bind("<KeyRelease>", self.on_album_typed)
+        self.album_entry.bind("<Down>", lambda event: self.focus_album_list())
+        self.album_entry.bind("<Return>", lambda event: self.choose_album(first=True))
+        self.album_entry.bind("<Escape>", lambda event: self.hide_album_list())
+
+        self.album_list_button = ctk.CTkButton(frame, text="▾", width=30, state="disabled",
+                                               command=self.toggle_album_list)
+        self.album_list_button.grid(row=0, column=2, padx=(0, 5), pady=10)
+        ctk.CTkCheckBox(frame, text="Nested albums", variable=self.nested_albums,
+                        command=self.refresh_albums).grid(row=0, column=3, padx=5, pady=10)
+        ctk.CTkButton(frame, text="Refresh ↻", command=self.refresh_albums).grid(row=0, column=4, padx=(5, 10), pady=10)
+
+        # Shown over the widgets below the entry
+        self.album_list_frame = tk.Frame(self)
+        self.album_list = tk.Listbox(self.album_list_frame, height=ALBUM_LIST_ROWS, activestyle="none",
+                                     exportselection=False)
+        album_scrollbar = tk.Scrollbar(self.album_list_frame, command=self.album_list.yview)
+        self.album_list.configure(yscrollcommand=album_scrollbar.set)
+        self.album_list.pack(side="left", fill="both", expand=True)
+        album_scrollbar.pack(side="right", fill="y")
+        self.album_list.bind("<Return>", lambda event: self.choose_album())
+        self.album_list.bind("<ButtonRelease-1>", lambda event: self.choose_album())
+        self.album_list.bind("<Escape>", lambda event: self.hide_album_list())
 
     ## 3. Date Widget
     def create_date_widgets(self):
@@ -89,23 +209,28 @@ class PhotoImporterApp(ctk.CTk):
         
         ctk.CTkLabel(frame, text="Quick Year Select:").pack(pady=(10, 2))
         
-        year_list = [str(y) for y in range(current_year, 1899, -1)]
+        # The other years (back to 1900) are added after the first paint
         self.selected_year_var = ctk.StringVar(value=str(current_year))
         
         self.year_dropdown = ctk.CTkOptionMenu(frame,
                                                variable=self.selected_year_var,
-                                               values=year_list,
+                                               values=[str(current_year)],
                                                command=self.on_year_selected)
     
         self.year_dropdown.pack(padx=10, pady=(0, 10))
-
-        # Default (small) calendar with year selection
-        self.calendar = Calendar(frame, selectmode='day',
-                                 year=today.year, month=today.month, day=today.day,
-                                 date_pattern='y-mm-dd')
-        
-        self.calendar.pack(padx=10, pady=10, anchor="n")
-
+        self.date_frame = frame
+
+    def ensure_calendar(self):
+        """The calendar, built on first use."""
+        if self.calendar is None:
+            from tkcalendar import Calendar
+            today = datetime.date.today()
+            # Default (small) calendar with year selection
+            self.calendar = Calendar(self.date_frame, selectmode='day',
+                                     year=today.year, month=today.month, day=today.day,
+                                     date_pattern='y-mm-dd')
+            self.calendar.pack(padx=10, pady=10, anchor="n")
+        return self.calendar
 
     def on_year_selected(self, selected_year_str):
         """
@@ -116,52 +241,134 @@ class PhotoImporterApp(ctk.CTk):
             year = int(selected_year_str)
             new_date = datetime.date(year, 1, 1)
 
-            self.calendar.selection_set(new_date)
+            self.ensure_calendar().selection_set(new_date)
             
             # --- DEBUG MESSAGE ---
-            print(f"[Debug] Quick Year selected: {selected_year_str}. Calendar set to {new_date}.")
+            log.debug("Quick Year selected: %s. Calendar set to %s.", selected_year_str, new_date)
             # ---------------------
             
         except Exception as e:
-            print(f"Error setting year: {e}")
+            log.error("Error setting year: %s", e)
             messagebox.showerror("Error", "Invalid year selected.")
 
     ## 4. Map Widgets
     def create_map_widgets(self):
-        frame = ctk.CTkFrame(self)
-        frame.grid(row=2, column=1, padx=10, pady=10, sticky="nsew")
+        # The map shares its place with the preview of the source photos
+        self.tabview = ctk.CTkTabview(self, command=self.show_source_preview)
+        self.tabview.grid(row=2, column=1, padx=10, pady=(0, 10), sticky="nsew")
+        frame = self.tabview.add("Location")
         
         frame.grid_rowconfigure(1, weight=1) # Row 1 for map
         frame.grid_rowconfigure(0, weight=0) # Row 0 for search
         frame.grid_rowconfigure(2, weight=0) # Row 2 for status/button
         frame.grid_columnconfigure(0, weight=1)
         frame.grid_columnconfigure(1, weight=0)
+        frame.grid_columnconfigure(2, weight=0)
 
         self.search_entry = ctk.CTkEntry(frame, placeholder_text="Search by city name...")
         self.search_entry.grid(row=0, column=0, sticky="ew", padx=(10, 5), pady=(10, 5))
         self.search_entry.bind("<Return>", lambda event: self.search_location())
+        self.search_entry.bind("<KeyRelease>", self.on_search_typed)
+        self.search_entry.bind("<Down>", lambda event: self.focus_suggestions())
+        self.search_entry.bind("<Escape>", lambda event: self.hide_suggestions())
+
+        ctk.CTkCheckBox(frame, text="Online fallback", variable=self.allow_online_search).grid(row=0, column=1, padx=5, pady=(10, 5))
         
         self.search_button = ctk.CTkButton(frame, text="Search", width=80, command=self.search_location)
-        self.search_button.grid(row=0, column=1, sticky="e", padx=(0, 10), pady=(10, 5))
+        self.search_button.grid(row=0, column=2, sticky="e", padx=(0, 10), pady=(10, 5))
 
-        self.map_widget = TkinterMapView(frame, corner_radius=10)
-        self.map_widget.grid(row=1, column=0, columnspan=2, sticky="nsew", padx=10)
+        # Search-as-you-type suggestions from the offline gazetteer (shown over the map)
+        self.suggestion_list = tk.Listbox(frame, height=6, activestyle="none")
+        self.suggestion_list.bind("<Return>", lambda event: self.choose_suggestion())
+        self.suggestion_list.bind("<Double-Button-1>", lambda event: self.choose_suggestion())
+        self.suggestion_list.bind("<Escape>", lambda event: self.hide_suggestions())
 
-        
-        self.map_widget.set_tile_server("https://a.tile.openstreetmap.org/{z}/{x}/{y}.png")
+        # Replaced by the map once it is loaded
+        self.map_frame = frame
+        self.map_placeholder = ctk.CTkLabel(frame, text="Loading map...")
+        self.map_placeholder.grid(row=1, column=0, columnspan=3, sticky="nsew", padx=10)
+
+        self.gps_label = ctk.CTkLabel(frame, text="GPS Location: Not set")
+        self.gps_label.grid(row=2, column=0, columnspan=2, pady=(5, 10), sticky="w", padx=10)
+
+        ctk.CTkButton(frame, text="Clear Location", command=self.clear_gps).grid(row=2, column=2, pady=(5, 10), sticky="e", padx=10)
+
+    def ensure_map(self):
+        """The map, built on first use (or once its modules are imported after startup)."""
+        if self.map_widget is None:
+            self.build_map()
+        return self.map_widget
+
+    def build_map(self):
+        import tile_cache
+        from map_view import CachedMapView
+
+        # Tiles come from offline MBTiles archives, then the disk cache, then the network
+        try:
+            cache = tile_cache.TileDiskCache()
+        except Exception as e:
+            log.error("Could not open tile cache: %s", e)
+            cache = None
+        self.tile_provider = tile_cache.TileProvider(cache)
+        self.tile_provider.load_default_archives()
+
+        self.map_placeholder.destroy()
+        self.map_widget = CachedMapView(self.map_frame, corner_radius=10, tile_provider=self.tile_provider)
+        self.map_widget.grid(row=1, column=0, columnspan=3, sticky="nsew", padx=10)
+
+        self.map_widget.set_tile_server(tile_cache.DEFAULT_TILE_SERVER)
         self.map_widget.set_position(48.8566, 2.3522) # Paris
         self.map_widget.set_zoom(10)
 
         self.map_widget.add_right_click_menu_command(label="Set Location",
                                                      command=self.set_gps_marker,
                                                      pass_coords=True)
-
-        self.gps_label = ctk.CTkLabel(frame, text="GPS Location: Not set")
-        self.gps_label.grid(row=2, column=0, pady=(5, 10), sticky="w", padx=10)
-
-        ctk.CTkButton(frame, text="Clear Location", command=self.clear_gps).grid(row=2, column=1, pady=(5, 10), sticky="e", padx=10)
-
-    ## 5. Action (Import) Widget
+        self.map_widget.add_right_click_menu_command(label="Load Offline Map (MBTiles)...",
+                                                     command=self.load_mbtiles)
+
+    ## 5. Source Preview Widgets
+    def create_preview_widgets(self):
+        # Filled in when the tab is first shown
+        self.preview_frame = self.tabview.add("Source Photos")
+        self.preview_frame.grid_rowconfigure(0, weight=1)
+        self.preview_frame.grid_columnconfigure(0, weight=1)
+
+    def ensure_preview(self):
+        """The thumbnail grid, built on first use."""
+        if self.thumbnail_grid is None:
+            import thumbnails
+            from thumbnail_grid import ThumbnailGrid
+            try:
+                disk_cache = thumbnails.ThumbnailDiskCache()
+            except Exception as e:
+                log.error("Could not open thumbnail cache: %s", e)
+                disk_cache = None
+            self.thumbnail_loader = thumbnails.ThumbnailLoader(disk_cache)
+            self.thumbnail_grid = ThumbnailGrid(self.preview_frame, self.thumbnail_loader, fg_color="transparent")
+            self.thumbnail_grid.grid(row=0, column=0, sticky="nsew")
+        return self.thumbnail_grid
+
+    def show_source_preview(self):
+        """Loads the source folder into the preview grid when it is shown."""
+        if self.tabview.get() != "Source Photos":
+            return
+        source = self.source_dir.get()
+        if source and os.path.isdir(source):
+            self.ensure_preview().load(source, recursive=self.recursive_scan.get())
+        else:
+            self.ensure_preview().clear()
+
+    def on_close(self):
+        if self.queue_window:
+            self.queue_window.close()
+        if self.thumbnail_loader:
+            self.thumbnail_loader.close()
+        if self.tile_provider and self.tile_provider.cache:
+            # Not closed: map tiles may still be loading on other threads.
+            self.tile_provider.cache.flush()
+        self.destroy()
+
+    ## 6. Action (Import) Widget
     def create_action_widgets(self):
         # Create a frame to hold all action widgets
         action_frame = ctk.CTkFrame(self)
@@ -188,83 +395,304 @@ class PhotoImporterApp(ctk.CTk):
         self.move_browse_button.grid(row=1, column=2, padx=(5, 10), pady=(0, 10))
         # --- End New Widgets ---
 
+        # Worker pool options
+        pool_frame = ctk.CTkFrame(action_frame, fg_color="transparent")
+        pool_frame.grid(row=0, column=1, columnspan=2, padx=(5, 10), pady=(10, 5), sticky="e")
+        ctk.CTkCheckBox(pool_frame, text="Skip already tagged", variable=self.resume_import).pack(side="left", padx=(0, 15))
+        ctk.CTkCheckBox(pool_frame, text="XMP sidecars only", variable=self.sidecar_output).pack(side="left", padx=(0, 15))
+        ctk.CTkCheckBox(pool_frame, text="Skip duplicates", variable=self.skip_duplicates).pack(side="left", padx=(0, 15))
+        ctk.CTkLabel(pool_frame, text="Workers:").pack(side="left", padx=(0, 5))
+        worker_values = [str(n) for n in range(1, tagging.default_worker_count() * 2 + 1)]
+        ctk.CTkOptionMenu(pool_frame, variable=self.worker_count, values=worker_values, width=70).pack(side="left", padx=(0, 10))
+        ctk.CTkOptionMenu(pool_frame, variable=self.pool_kind,
+                          values=[tagging.POOL_THREADS, tagging.POOL_PROCESSES], width=110).pack(side="left")
+
         # Main Import Button
         self.import_button = ctk.CTkButton(action_frame, 
                                            text="Tag & Copy Photos", 
                                            height=50, 
                                            command=self.run_import, 
                                            font=("Arial", 16))
-        self.import_button.grid(row=2, column=0, columnspan=3, padx=10, pady=(10, 10), sticky="ew")
+        self.import_button.grid(row=2, column=0, columnspan=2, padx=(10, 5), pady=(10, 10), sticky="ew")
+
+        # Queue this import (with its own date and GPS) to run after the others
+        self.queue_button = ctk.CTkButton(action_frame,
+                                          text="Add to Queue",
+                                          height=50,
+                                          command=self.add_to_queue)
+        self.queue_button.grid(row=2, column=2, padx=(5, 10), pady=(10, 10), sticky="ew")
+
+        # Read-only look at the source's existing EXIF before importing
+        self.preflight_button = ctk.CTkButton(action_frame,
+                                              text="Check Source (Pre-flight)",
+                                              command=self.run_preflight)
+        self.preflight_button.grid(row=3, column=0, columnspan=3, padx=10, pady=(0, 10), sticky="ew")
 
     def select_source(self):
         path = filedialog.askdirectory(title="Select Source Directory")
         if path:
             self.source_dir.set(path)
+            self.show_source_preview()
 
     def select_target(self):
         path = filedialog.askdirectory(title="Select Target Directory (parent of albums)")
         if path:
             self.target_dir.set(path)
-            
-            # --- NEW CHECK ---
-            try:
-                # Check for subdirectories (albums)
-                subdirs = [d for d in os.listdir(path) if os.path.isdir(os.path.join(path, d))]
-                if not subdirs:
-                    messagebox.showwarning("Empty Directory", 
-                                         "This folder is empty.\n\nThe 'Albums Directory' should be a parent folder that already contains subfolders (albums).")
-            except Exception as e:
-                messagebox.showerror("Error", f"Could not read directory: {e}")
-            # --- END CHECK ---
-            
-            self.refresh_albums() # This will still run to update the list
-            
-    def refresh_albums(self):
+            # Warns if there are no sub-folders (albums) in it
+            self.refresh_albums(warn_empty=True)
+
+    def refresh_albums(self, warn_empty=False):
+        """Updates the album index in the background (only changed folders are listed again)."""
         target = self.target_dir.get()
         if not os.path.isdir(target):
             messagebox.showwarning("Missing Directory", "Please select a valid Target directory first.")
             return
 
+        index = albums.AlbumIndex(target, recursive=self.nested_albums.get())
+        result = {}
+
+        def work():
+            try:
+                result["listed"] = index.refresh()
+            except Exception as e:
+                result["error"] = e
+
+        thread = threading.Thread(target=work, daemon=True)
+        thread.start()
+        self.after(PROGRESS_POLL_MS, lambda: self.poll_album_refresh(thread, index, result, warn_empty))
+
+    def poll_album_refresh(self, thread, index, result, warn_empty):
+        if thread.is_alive():
+            self.after(PROGRESS_POLL_MS, lambda: self.poll_album_refresh(thread, index, result, warn_empty))
+            return
+        if "error" in result:
+            messagebox.showerror("Read Error", f"Could not read albums: {result['error']}")
+            return
+        log.debug("%s albums, %s folders listed.", len(index.albums), result["listed"])
+
+        self.album_index = index
+        self.hide_album_list()
+        if not index.albums:
+            self.album_entry.configure(state="disabled")
+            self.album_list_button.configure(state="disabled")
+            self.selected_album.set("")
+            if warn_empty:
+                messagebox.showwarning("Empty Directory",
+                                       "This folder is empty.\n\nThe 'Albums Directory' should be a parent folder that already contains subfolders (albums).")
+            return
+        self.album_entry.configure(state="normal")
+        self.album_list_button.configure(state="normal")
+        if self.selected_album.get() not in index:
+            self.selected_album.set("")
+
+    def on_album_typed(self, event):
+        if event.keysym in ("Return", "Down", "Escape"):
+            return
+        if self._album_after_id:
+            self.after_cancel(self._album_after_id)
+        self._album_after_id = self.after(SEARCH_DEBOUNCE_MS, self.show_album_list)
+
+    def show_album_list(self, query=None):
+        """Lists the albums matching the entry (or query) below it."""
+        self._album_after_id = None
+        if not self.album_index:
+            return
+        self.album_matches = self.album_index.search(self.selected_album.get() if query is None else query)
+        if not self.album_matches:
+            self.hide_album_list()
+            return
+        self.album_list.delete(0, tk.END)
+        self.album_list.insert(tk.END, *self.album_matches)
+        self.album_list.configure(height=min(len(self.album_matches), ALBUM_LIST_ROWS))
+        self.album_list_frame.place(in_=self.album_entry, relx=0, rely=1, relwidth=1)
+        self.album_list_frame.lift()
+
+    def toggle_album_list(self):
+        if self.album_list_frame.winfo_ismapped():
+            self.hide_album_list()
+            return
+        # An album is already chosen: list them all to pick another one
+        current = self.selected_album.get()
+        self.show_album_list("" if self.album_index and current in self.album_index else current)
+        self.focus_album_list()
+
+    def focus_album_list(self):
+        if self.album_matches and self.album_list_frame.winfo_ismapped():
+            self.album_list.focus_set()
+            self.album_list.selection_clear(0, tk.END)
+            self.album_list.selection_set(0)
+            self.album_list.activate(0)
+
+    def hide_album_list(self):
+        self.album_list_frame.place_forget()
+        self.album_matches = []
+
+    def choose_album(self, first=False):
+        """Takes the album selected in the list (or the first match, on Enter in the entry)."""
+        if first:
+            if self.album_index and self.selected_album.get() in self.album_index:
+                self.hide_album_list()
+                return
+            if self._album_after_id:
+                self.after_cancel(self._album_after_id)
+                self.show_album_list()
+            selection = (0,) if self.album_matches else ()
+        else:
+            selection = self.album_list.curselection()
+        if not selection:
+            return
+        self.selected_album.set(self.album_matches[selection[0]])
+        self.hide_album_list()
+        self.album_entry.focus_set()
+        self.album_entry.icursor(tk.END)
+
+    def load_gazetteer(self):
+        """Loads the offline gazetteer index (runs on a background thread)."""
         try:
-            subdirs = [d for d in os.listdir(target) if os.path.isdir(os.path.join(target, d))]
-            if not subdirs:
-                subdirs = ["(No albums found)"]
-                self.album_dropdown.configure(state="disabled")
-                self.selected_album.set("")
-            else:
-                self.album_dropdown.configure(values=subdirs, state="normal")
-                self.selected_album.set(subdirs[0])
+            self.gazetteer = gazetteer.Gazetteer.load()
         except Exception as e:
-            messagebox.showerror("Read Error", f"Could not read albums: {e}")
+            log.error("Could not load gazetteer index: %s", e)
+        if self.gazetteer is None:
+            log.info("No offline gazetteer index, map search will use the online lookup.")
+
+    def on_search_typed(self, event):
+        if event.keysym in ("Return", "Down", "Escape"):
+            return
+        if self._search_after_id:
+            self.after_cancel(self._search_after_id)
+        self._search_after_id = self.after(SEARCH_DEBOUNCE_MS, self.update_suggestions)
+
+    def update_suggestions(self):
+        self._search_after_id = None
+        query = self.search_entry.get()
+        if not self.gazetteer or not query.strip():
+            self.hide_suggestions()
+            return
+
+        self.suggestions = self.gazetteer.search(query)
+        if not self.suggestions:
+            self.hide_suggestions()
+            return
+
+        self.suggestion_list.delete(0, tk.END)
+        for place in self.suggestions:
+            self.suggestion_list.insert(tk.END, gazetteer.describe(place))
+        self.suggestion_list.configure(height=len(self.suggestions))
+        self.suggestion_list.place(in_=self.search_entry, relx=0, rely=1, relwidth=1)
+        self.suggestion_list.lift()
+
+    def focus_suggestions(self):
+        if self.suggestions and self.suggestion_list.winfo_ismapped():
+            self.suggestion_list.focus_set()
+            self.suggestion_list.selection_clear(0, tk.END)
+            self.suggestion_list.selection_set(0)
+            self.suggestion_list.activate(0)
+
+    def hide_suggestions(self):
+        self.suggestion_list.place_forget()
+        self.suggestions = []
+
+    def choose_suggestion(self):
+        selection = self.suggestion_list.curselection()
+        if not selection:
+            return
+        place = self.suggestions[selection[0]]
+        self.search_entry.delete(0, tk.END)
+        self.search_entry.insert(0, place.name)
+        self.hide_suggestions()
+        self.go_to_place(place)
+
+    def go_to_place(self, place):
+        self.ensure_map().set_position(place.latitude, place.longitude)
+        self.set_gps_marker((place.latitude, place.longitude))
+        self.map_widget.set_zoom(13)
 
     def search_location(self):
         query = self.search_entry.get()
         if not query:
             return
+        self.hide_suggestions()
+
+        # Offline gazetteer first
+        if self.gazetteer:
+            results = self.gazetteer.search(query, limit=1)
+            if results:
+                self.go_to_place(results[0])
+                return
+
+        if not self.allow_online_search.get():
+            if self.gazetteer:
+                messagebox.showinfo("Not Found", f"No place named '{query}' in the offline gazetteer.")
+            else:
+                messagebox.showinfo("Not Found", "No offline gazetteer is installed (see gazetteer.py), "
+                                                 "and Online fallback is off.")
+            return
+        if self.search_button.cget("state") == "disabled":
+            return  # an online search is still running
 
-        self.map_widget.set_address(query)
-        coords = self.map_widget.get_position()
-        
-        self.set_gps_marker(coords)
-        
-        self.map_widget.set_zoom(13)
+        # Online fallback (Nominatim), off the Tk thread so the window stays responsive
+        result = {}
+
+        def work():
+            try:
+                result["place"] = gazetteer.search_online(query)
+            except OSError as e:
+                result["error"] = e
+
+        self.search_button.configure(state="disabled", text="Searching...")
+        thread = threading.Thread(target=work, daemon=True)
+        thread.start()
+        self.after(PROGRESS_POLL_MS, lambda: self.poll_online_search(thread, query, result))
+
+    def poll_online_search(self, thread, query, result):
+        if thread.is_alive():
+            self.after(PROGRESS_POLL_MS, lambda: self.poll_online_search(thread, query, result))
+            return
+        self.search_button.configure(state="normal", text="Search")
+        if "error" in result:
+            messagebox.showerror("Search Error", f"Could not search online for '{query}': {result['error']}")
+        elif result["place"] is None:
+            messagebox.showerror("Not Found", f"Could not find '{query}' online.")
+        else:
+            self.go_to_place(result["place"])
+
+    def load_mbtiles(self):
+        """Adds a pre-seeded MBTiles archive as an offline tile source."""
+        path = filedialog.askopenfilename(title="Select Offline Map Archive",
+                                          filetypes=[("MBTiles", "*.mbtiles"), ("All files", "*.*")])
+        if not path:
+            return
+        try:
+            self.tile_provider.add_archive(path)
+        except Exception as e:
+            messagebox.showerror("Error", f"Could not open map archive: {e}")
+            return
+        log.info("Loaded offline map archive: %s", path)
+        # Redraw so tiles from the archive replace blank ones
+        self.map_widget.tile_image_cache.clear()
+        self.map_widget.draw_initial_array()
 
     def set_gps_marker(self, coords):
         # --- DEBUG MESSAGE ---
-        print(f"[Debug] GPS Location Set: {coords}")
+        log.debug("GPS Location Set: %s", coords)
         # ---------------------
         
         self.selected_gps = coords  # (lat, lon)
-        self.gps_label.configure(text=f"GPS Location: {coords[0]:.6f}, {coords[1]:.6f}")
+        location_text = f"GPS Location: {coords[0]:.6f}, {coords[1]:.6f}"
+        if self.gazetteer:
+            nearest = self.gazetteer.reverse(coords[0], coords[1])
+            if nearest:
+                location_text += f" (near {gazetteer.describe(nearest)})"
+        self.gps_label.configure(text=location_text)
 
         if self.map_marker:
             self.map_marker.delete()
 
-        self.map_marker = self.map_widget.set_marker(coords[0], coords[1], text="Import")
+        self.map_marker = self.ensure_map().set_marker(coords[0], coords[1], text="Import")
 
     def clear_gps(self):
         # --- DEBUG MESSAGE ---
-        print("[Debug] GPS Location Cleared.")
+        log.debug("GPS Location Cleared.")
         # ---------------------
         
         self.selected_gps = None
@@ -288,221 +716,267 @@ class PhotoImporterApp(ctk.CTk):
         if path:
             self.move_dest_dir.set(path)
             
-    def run_import(self):
-        # 1. Validation
+    def collect_job(self):
+        """The import set up in the window as a jobs.ImportJob, or None (after an error dialog) if it isn't valid."""
+        import jobs
         source = self.source_dir.get()
-        target = self.target_dir.get()
-        album = self.selected_album.get()
-        
-        # --- NEW: Get and Validate Move options ---
-        move_enabled = self.enable_move.get()
-        move_dest = self.move_dest_dir.get()
-        
-        if move_enabled and not os.path.isdir(move_dest):
-            messagebox.showerror("Invalid Path", "The 'Move to' directory is not valid or not selected.")
-            return
-        # -------------------------------------------
-
-        if not all([source, target, album]) or album == "(No albums found)":
-            messagebox.showerror("Incomplete Fields", "Please select a source directory, target directory, and a valid album.")
-            return
-        destination_path = os.path.join(target, album)
-        if not os.path.isdir(destination_path):
-            messagebox.showerror("Error", f"The album path '{destination_path}' does not exist or is not a directory.")
-            return
-        
-        # 2. Get data
+        move_dest = self.move_dest_dir.get() if self.enable_move.get() else None
+        # Photos deselected in the preview grid are left out
+        skip_paths = (self.thumbnail_grid.excluded_paths(source, recursive=self.recursive_scan.get())
+                      if self.thumbnail_grid else ())
         try:
-            selected_date = self.calendar.get_date()
-            date_obj = datetime.datetime.strptime(selected_date, '%Y-%m-%d')
-            exif_date_str = date_obj.strftime("%Y:%m:%d %H:%M:%S")
-            exif_date_bytes = exif_date_str.encode('utf-8')
-        except Exception as e:
-            messagebox.showerror("Invalid Date", f"Invalid date selected: {e}")
-            return
-        
-        gps_data = self.selected_gps
-        
+            job = jobs.make_job(source, self.target_dir.get(), self.selected_album.get(),
+                                self.ensure_calendar().get_date(), self.selected_gps, move_dest, skip_paths)
+        except tagging.ValidationError as e:
+            messagebox.showerror(e.title, str(e))
+            return None
+
         # --- DEBUG MESSAGES ---
-        print("="*30)
-        print(f"[Debug] Import started with Date: {selected_date}")
-        print(f"[Debug] Import started with GPS: {gps_data if gps_data else 'None'}")
-        print(f"[Debug] Move processed files: {move_enabled}")
-        if move_enabled:
-            print(f"[Debug] Move destination: {move_dest}")
-        print("="*30)
+        log.debug("Import set up with Date: %s", job.exif_date.decode())
+        log.debug("Import set up with GPS: %s", job.gps_data if job.gps_data else 'None')
+        log.debug("Move processed files: %s", job.move_enabled)
+        if job.move_enabled:
+            log.debug("Move destination: %s", job.move_dest)
         # ----------------------
-        
-        # 3. Start process (pass new options)
-        self.process_files(source, destination_path, exif_date_bytes, gps_data, move_enabled, move_dest)
-
-    def process_files(self, source_dir, dest_dir, exif_date, gps_data, move_enabled, move_dest):
+        return job
 
-        image_files = [f for f in os.listdir(source_dir) 
-                       if f.lower().endswith(('.jpg', '.jpeg'))]
+    def pipeline_options(self):
+        """Worker pool and output settings of the window, as TaggingPipeline keyword arguments."""
+        return {
+            "workers": int(self.worker_count.get()),
+            "pool_kind": self.pool_kind.get(),
+            "resume": self.resume_import.get(),
+            "output_mode": tagging.OUTPUT_SIDECAR if self.sidecar_output.get() else tagging.OUTPUT_REWRITE,
+            "duplicate_root": self.target_dir.get() if self.skip_duplicates.get() else None,
+        }
 
-        if not image_files:
-            messagebox.showinfo("Info", "No .jpg or .jpeg files found in the source directory.")
+    def run_import(self):
+        job = self.collect_job()
+        if job:
+            self.process_files(job.source, job.dest_dir, job.exif_date, job.gps_data,
+                               job.move_enabled, job.move_dest, job.skip_paths)
+
+    def add_to_queue(self):
+        job = self.collect_job()
+        if not job:
             return
+        if self.queue_window is None:
+            from job_queue_window import JobQueueWindow
+            self.queue_window = JobQueueWindow(
+                self, lambda: dict(self.pipeline_options(), recursive=self.recursive_scan.get()),
+                self.target_dir.get)
+        self.queue_window.add_job(job)
+
+    def run_preflight(self):
+        """Checks the source's existing EXIF in the background and shows the report."""
+        import preflight
+        source = self.source_dir.get()
+        if not source or not os.path.isdir(source):
+            messagebox.showerror("Invalid Path", "Please select a valid source directory.")
+            return
+        try:
+            exif_date = tagging.make_exif_date(self.ensure_calendar().get_date())
+        except tagging.ValidationError:
+            exif_date = None
+        move_dest = self.move_dest_dir.get() if self.enable_move.get() else None
+        album_path = os.path.join(self.target_dir.get(), self.selected_album.get()) if self.target_dir.get() else None
+        recursive = self.recursive_scan.get()
+        workers = int(self.worker_count.get())
+        pool_kind = self.pool_kind.get()
+        result = {}
+
+        def work():
+            result["reports"], result["seconds"] = preflight.run_preflight(
+                source, recursive=recursive, workers=workers,
+                pool_kind=pool_kind, exclude_dirs=(album_path, move_dest))
+
+        self.preflight_button.configure(state="disabled", text="Checking source...")
+        thread = threading.Thread(target=work, daemon=True)
+        thread.start()
+        self.after(PROGRESS_POLL_MS, lambda: self.poll_preflight(thread, result, exif_date, self.selected_gps))
+
+    def poll_preflight(self, thread, result, exif_date, gps_data):
+        if thread.is_alive():
+            self.after(PROGRESS_POLL_MS, lambda: self.poll_preflight(thread, result, exif_date, gps_data))
+            return
+        self.preflight_button.configure(state="normal", text="Check Source (Pre-flight)")
+        if "reports" not in result:
+            messagebox.showerror("Error", "The pre-flight check failed (see console for details).")
+            return
+        import preflight
+        summary = preflight.summarize(result["reports"], exif_date, gps_data)
+        report = preflight.format_report(summary, result["seconds"], examples=20)
+
+        window = ctk.CTkToplevel(self)
+        window.title("Pre-flight Check")
+        window.geometry("640x480")
+        window.transient(self)
+        textbox = ctk.CTkTextbox(window, font=("Courier", 12), wrap="none")
+        textbox.pack(fill="both", expand=True, padx=10, pady=(10, 5))
+        textbox.insert("1.0", report)
+        textbox.configure(state="disabled")
+        ctk.CTkButton(window, text="Close", command=window.destroy).pack(pady=(5, 10))
+
+    def process_files(self, source_dir, dest_dir, exif_date, gps_data, move_enabled, move_dest, skip_paths=()):
+
+        # Photos are streamed from a recursive scan; tagging starts with the first one found.
+        image_files = tagging.scan_source(source_dir, recursive=self.recursive_scan.get(),
+                                          exclude_dirs=(dest_dir, move_dest if move_enabled else None),
+                                          skip_paths=skip_paths)
         
-        total = len(image_files)
-        processed_count = 0
-        error_count = 0
-        error_list = [] 
-        
-        # --- NEW: List to track successful files for moving ---
-        successfully_processed_files = [] 
-        # ------------------------------------------------------
-
-        progress_window = ctk.CTkToplevel(self)
-        progress_window.title("Import in progress...")
-        progress_window.geometry("400x150")
-        progress_window.transient(self)
-        progress_window.grab_set()
-
-        ctk.CTkLabel(progress_window, text="Processing photos...").pack(pady=10)
-        progress_label = ctk.CTkLabel(progress_window, text=f"Photo 0 / {total}")
-        progress_label.pack(pady=5)
-        progress_bar = ctk.CTkProgressBar(progress_window, width=360)
-        progress_bar.pack(pady=10)
-        progress_bar.set(0)
-
         exif_gps_dict = {}
         if gps_data:
-            exif_gps_dict = self.convert_gps_to_exif(gps_data[0], gps_data[1])
+            exif_gps_dict = tagging.convert_gps_to_exif(gps_data[0], gps_data[1])
+
+        # State shared with the queue poller
+        self.import_state = {
+            "discovered": 0,
+            "scan_complete": False,
+            "done": 0,
+            "processed": 0,
+            "patched": 0,
+            "skipped": 0,
+            "duplicates": [],
+            "errors": [],
+            "moved": 0,
+            "move_enabled": move_enabled,
+        }
 
-        for i, filename in enumerate(image_files):
-            try:
-                progress_label.configure(text=f"Photo {i+1} / {total}: {filename}")
-                progress_bar.set((i + 1) / total)
-                self.update_idletasks() 
-
-                source_file = os.path.join(source_dir, filename)
-                dest_file = os.path.join(dest_dir, filename)
-
-                # --- DEBUG MESSAGE ---
-                print(f"\n[Debug] Processing: {filename}\n  From: {source_file}\n  To:   {dest_file}")
-                # ---------------------
-
-                img = Image.open(source_file)
-                
-                # Load EXIF
-                try:
-                    exif_dict = piexif.load(img.info.get('exif', b''))
-                except piexif.InvalidImageDataError:
-                    exif_dict = {"0th": {}, "Exif": {}, "GPS": {}, "1st": {}}
-                
-                if "0th" not in exif_dict: exif_dict["0th"] = {}
-                if "Exif" not in exif_dict: exif_dict["Exif"] = {}
-                if "GPS" not in exif_dict: exif_dict["GPS"] = {}
-
-                # 1. OVERWRITE "Date Taken" fields only.
-                exif_dict["Exif"][piexif.ExifIFD.DateTimeOriginal] = exif_date
-                exif_dict["Exif"][piexif.ExifIFD.DateTimeDigitized] = exif_date
-
-                # 2. Add/Overwrite GPS
-                if gps_data:
-                    exif_dict["GPS"] = exif_gps_dict
-                
-                # Fix piexif bugs (int vs bytes)
-                if piexif.ExifIFD.SceneType in exif_dict["Exif"]:
-                    val = exif_dict["Exif"][piexif.ExifIFD.SceneType]
-                    if isinstance(val, int):
-                        exif_dict["Exif"][piexif.ExifIFD.SceneType] = val.to_bytes(1, 'big')
-
-                if piexif.ExifIFD.FileSource in exif_dict["Exif"]:
-                    val = exif_dict["Exif"][piexif.ExifIFD.FileSource]
-                    if isinstance(val, int):
-                        exif_dict["Exif"][piexif.ExifIFD.FileSource] = val.to_bytes(1, 'big')
-                
-                # Save
-                exif_bytes = piexif.dump(exif_dict)
-                img.save(dest_file, exif=exif_bytes)
-                img.close()
-                
-                processed_count += 1
-                
-                # --- NEW: Add to success list for moving ---
-                successfully_processed_files.append((source_file, filename))
-                # -------------------------------------------
+        self.progress_window = ctk.CTkToplevel(self)
+        self.progress_window.title("Import in progress...")
+        self.progress_window.geometry("400x190")
+        self.progress_window.transient(self)
+        self.progress_window.grab_set()
+        self.progress_window.protocol("WM_DELETE_WINDOW", self.cancel_import)
+
+        ctk.CTkLabel(self.progress_window, text="Processing photos...").pack(pady=10)
+        self.progress_label = ctk.CTkLabel(self.progress_window, text="Scanning source folder...")
+        self.progress_label.pack(pady=5)
+        self.progress_bar = ctk.CTkProgressBar(self.progress_window, width=360)
+        self.progress_bar.pack(pady=10)
+        self.progress_bar.set(0)
+        self.cancel_button = ctk.CTkButton(self.progress_window, text="Cancel", command=self.cancel_import)
+        self.cancel_button.pack(pady=(0, 10))
+
+        # Run the batch on a worker pool, off the Tk main thread
+        self.pipeline = tagging.TaggingPipeline(**self.pipeline_options())
+        log.debug("Starting pipeline: %s %s", self.pipeline.workers, self.pipeline.pool_kind)
+        self.pipeline.start(source_dir, dest_dir, image_files, exif_date, exif_gps_dict, move_enabled, move_dest)
+        self.after(PROGRESS_POLL_MS, self.poll_import_progress)
+
+    def cancel_import(self):
+        """Asks the running pipeline to stop after the files already in flight."""
+        if self.pipeline:
+            log.debug("Cancel requested.")
+            self.pipeline.cancel()
+            self.cancel_button.configure(state="disabled", text="Cancelling...")
+
+    def show_tag_progress(self, current):
+        """Shows processed / discovered counts; the total keeps growing until the scan is complete."""
+        state = self.import_state
+        total = max(state["discovered"], state["done"])
+        more = "" if state["scan_complete"] else "+"
+        moved = f" ({state['moved']} moved)" if state["move_enabled"] else ""
+        self.progress_label.configure(text=f"Photo {state['done']} / {total}{more}{moved}: {current}")
+        if total:
+            self.progress_bar.set(state["done"] / total)
+
+    def poll_import_progress(self):
+        """Drains pipeline events on the Tk main thread and updates the progress window."""
+        state = self.import_state
+        finished = None
+        try:
+            while True:
+                event = self.pipeline.events.get_nowait()
+                kind = event[0]
+                if kind == "discovered":
+                    state["discovered"] = max(state["discovered"], event[1])
+                    state["scan_complete"] = event[2]
+                elif kind == "tagged":
+                    _, filename, error = event
+                    state["done"] += 1
+                    if error is None:
+                        state["processed"] += 1
+                    else:
+                        state["errors"].append(filename)
+                    self.show_tag_progress(filename)
+                elif kind == "patched":
+                    state["patched"] += 1
+                elif kind == "skipped":
+                    state["done"] += 1
+                    state["skipped"] += 1
+                    self.show_tag_progress(f"{event[1]} (already tagged)")
+                elif kind == "duplicate":
+                    state["done"] += 1
+                    state["duplicates"].append(event[1])
+                    self.show_tag_progress(f"{event[1]} (duplicate)")
+                elif kind == "moved":
+                    # Sources are archived as soon as their tagged copy is safely written
+                    if event[2] is None:
+                        state["moved"] += 1
+                elif kind == "stats":
+                    log.info("%s", instrumentation.format_summary(event[1]))
+                elif kind == "finished":
+                    finished = event
+                    break
+        except queue.Empty:
+            pass
+
+        if finished is None:
+            self.after(PROGRESS_POLL_MS, self.poll_import_progress)
+            return
+
+        if state["scan_complete"] and state["discovered"] == 0:
+            self.progress_window.destroy()
+            self.pipeline = None
+            messagebox.showinfo("Info", "No .jpg, .jpeg, .tif, .tiff or .png files found in the source directory.")
+            return
+
+        cancelled = finished[1]
+        processed_count = state["processed"]
+        error_count = len(state["errors"])
+        error_list = state["errors"]
 
-            except Exception as e:
-                print(f"Error while processing {filename}: {e}")
-                error_count += 1
-                error_list.append(filename)
-        
-        # --- NEW: Move files AFTER processing loop is complete ---
-        if move_enabled:
-            print(f"\n[Debug] Moving {len(successfully_processed_files)} successfully processed files...")
-            # Update progress bar for the move operation
-            progress_label.configure(text=f"Moving 0 / {len(successfully_processed_files)} files...")
-            total_moved = len(successfully_processed_files)
-            
-            for i, (source_file_path, base_filename) in enumerate(successfully_processed_files):
-                progress_label.configure(text=f"Moving {i+1} / {total_moved}: {base_filename}")
-                progress_bar.set((i + 1) / total_moved)
-                self.update_idletasks()
-                
-                try:
-                    move_dest_path = os.path.join(move_dest, base_filename)
-                    shutil.move(source_file_path, move_dest_path)
-                except Exception as e:
-                    print(f"[Error] Failed to move {base_filename}: {e}")
-                    # We still count the file as "processed", but the move failed.
-                    # This will just be reported in the console.
-            
-            print("[Debug] Move complete.")
-        # ---------------------------------------------------------
-        
         # --- DEBUG MESSAGE ---
-        print(f"\n[Debug] Processing complete. {processed_count} files tagged, {error_count} errors.")
-        print("="*30)
+        log.debug("Processing complete. %s files tagged, %s errors.", processed_count, error_count)
         # ---------------------
 
         # End
-        progress_window.destroy()
-        
-        msg = f"Import complete!\n\nPhotos processed: {processed_count}\nErrors: {error_count}"
-        if move_enabled:
-            msg += f"\nPhotos moved: {len(successfully_processed_files)}"
+        self.progress_window.destroy()
+        self.pipeline = None
+
+        title = "Import Cancelled" if cancelled else "Import Complete"
+        msg = f"{'Import cancelled.' if cancelled else 'Import complete!'}\n\nPhotos processed: {processed_count}\nErrors: {error_count}"
+        if state["patched"]:
+            msg += f"\nRetagged in place: {state['patched']}"
+        if state["skipped"]:
+            msg += f"\nAlready tagged (skipped): {state['skipped']}"
+        if state["duplicates"]:
+            msg += f"\nAlready in the albums (duplicates): {len(state['duplicates'])}"
+        if state["move_enabled"]:
+            msg += f"\nPhotos moved: {state['moved']}"
+        if cancelled:
+            msg += f"\nNot processed: {state['discovered'] - state['done']}"
             
         if error_count > 0:
             msg += f"\n\nFiles with errors (see console for details):\n" + "\n".join(error_list[:5])
             if error_count > 5:
                 msg += "\n..."
         
-        messagebox.showinfo("Import Complete", msg)
-
-    def convert_gps_to_exif(self, latitude, longitude):
-        """Converts decimal GPS coordinates to EXIF rational format."""
-        
-        def to_rational(decimal_coord):
-            abs_coord = abs(decimal_coord)
-            deg_num = int(abs_coord)
-            min_num = int((abs_coord - deg_num) * 60)
-            sec_num = int(((abs_coord - deg_num) * 60 - min_num) * 60 * 10000)
-            sec_den = 10000
-            
-            return [
-                (deg_num, 1),
-                (min_num, 1),
-                (sec_num, sec_den)
-            ]
-
-        lat_ref = b'N' if latitude >= 0 else b'S'
-        lat_exif = to_rational(latitude)
-        
-        lon_ref = b'E' if longitude >= 0 else b'W'
-        lon_exif = to_rational(longitude)
-
-        return {
-            piexif.GPSIFD.GPSVersionID: (2, 0, 0, 0),
-            piexif.GPSIFD.GPSLatitudeRef: lat_ref,
-            piexif.GPSIFD.GPSLatitude: lat_exif,
-            piexif.GPSIFD.GPSLongitudeRef: lon_ref,
-            piexif.GPSIFD.GPSLongitude: lon_exif,
-        }
+        messagebox.showinfo(title, msg)
 
 if __name__ == "__main__":
-    app = PhotoImporterApp()
+    # PHOTO_TAGGER_DEBUG=1 shows debug messages; PHOTO_TAGGER_TRACE=sampled|full
+    # logs per-stage timings after each import (see instrumentation.py);
+    # PHOTO_TAGGER_STARTUP=1 logs how long the window took to show up.
+    logging.basicConfig(level=logging.DEBUG if os.environ.get("PHOTO_TAGGER_DEBUG") else logging.INFO,
+                        format="%(levelname)s %(name)s: %(message)s")
+    startup_timing.mark("imports")
+    import argparse
+    parser = argparse.ArgumentParser(description="Photo Scan Exif Tagger")
+    parser.add_argument("--startup-report", action="store_true",
+                        help="Print the startup timings once the window is ready, then exit (see startup_timing.py)")
+    args = parser.parse_args()
+    instrumentation.configure_from_env()
+    app = PhotoImporterApp(exit_after_startup=args.startup_report)
     app.mainloop()
\ No newline at end of file
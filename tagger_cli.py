@@ -0,0 +1,149 @@
+"""
+Command-line entry point for headless imports (no display needed).
+
+Example:
+    python tagger_cli.py /scans /photos/Albums "1985 - Family Vacation" \
+        --date 1985-07-14 --lat 48.8566 --lon 2.3522 --move-to /scans/archive --workers 8
+
+Pass the album itself as the source to retag its photos in place, and
+--sidecar to write .xmp sidecars instead of rewriting the photos.
+--skip-duplicates leaves out photos already in one of the albums.
+
+Add --trace sampled (or full) to print per-stage timings at the end, and
+--trace-file trace.jsonl to keep every span.
+"""
+import argparse
+import logging
+import sys
+
+import file_ops
+import instrumentation
+import preflight
+import tagging
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Batch-add Date and GPS EXIF tags to scanned photos and copy them into an album.")
+    parser.add_argument("source", help="Directory containing the scanned photos")
+    parser.add_argument("albums_dir", help="Parent directory of the albums")
+    parser.add_argument("album", help="Album (sub-folder of albums_dir) to copy the tagged photos into")
+    parser.add_argument("--date", required=True, help="Date taken, as YYYY-MM-DD")
+    parser.add_argument("--lat", type=float, help="GPS latitude in decimal degrees")
+    parser.add_argument("--lon", type=float, help="GPS longitude in decimal degrees")
+    parser.add_argument("--move-to", metavar="DIR", help="Move processed source files to this directory")
+    parser.add_argument("--workers", type=int, default=tagging.default_worker_count(),
+                        help="Number of parallel workers (default: number of CPUs)")
+    parser.add_argument("--processes", action="store_true",
+                        help="Use a process pool instead of a thread pool")
+    parser.add_argument("--no-recursive", action="store_true",
+                        help="Only import photos directly in the source directory, not in sub-folders")
+    parser.add_argument("--sidecar", action="store_true",
+                        help="Don't rewrite the photos: link them into the album and write the tags to .xmp sidecars")
+    parser.add_argument("--link", choices=file_ops.LINK_MODES, default=file_ops.LINK_AUTO,
+                        help="With --sidecar, how originals are put into the album "
+                             "(default: auto, a hard link if possible, otherwise a copy)")
+    parser.add_argument("--skip-duplicates", action="store_true",
+                        help="Don't import photos that are already in one of the albums (perceptual hash match)")
+    parser.add_argument("--preflight", action="store_true",
+                        help="Only report existing dates/GPS, corrupt EXIF and quirks in the source; import nothing")
+    parser.add_argument("--no-resume", action="store_true",
+                        help="Retag every photo, ignoring the album's import journal")
+    parser.add_argument("--no-verify", action="store_true",
+                        help="Don't read each output back (tags and image data) before committing and archiving it")
+    parser.add_argument("--trace", choices=instrumentation.MODES, default=instrumentation.MODE_OFF,
+                        help="Per-stage timing instrumentation (default: off)")
+    parser.add_argument("--trace-file", metavar="FILE", help="Append every span to this JSON-lines file")
+    parser.add_argument("--sample-every", type=int, default=instrumentation.DEFAULT_SAMPLE_EVERY,
+                        help="With --trace sampled, trace one photo in this many (default: %(default)s)")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Only print the final summary")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Print debug messages")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if (args.lat is None) != (args.lon is None):
+        parser.error("--lat and --lon must be given together")
+    gps_data = (args.lat, args.lon) if args.lat is not None else None
+    move_enabled = bool(args.move_to)
+    if args.trace_file and args.trace == instrumentation.MODE_OFF:
+        parser.error("--trace-file needs --trace sampled or --trace full")
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING,
+                        format="%(levelname)s %(name)s: %(message)s")
+    instrumentation.configure(args.trace, args.sample_every, args.trace_file)
+
+    try:
+        destination_path = tagging.validate_import(args.source, args.albums_dir, args.album,
+                                                   move_enabled, args.move_to or "")
+        exif_date = tagging.make_exif_date(args.date)
+    except tagging.ValidationError as e:
+        print(f"{e.title}: {e}", file=sys.stderr)
+        return 2
+
+    pool_kind = tagging.POOL_PROCESSES if args.processes else tagging.POOL_THREADS
+    if args.preflight:
+        reports, seconds = preflight.run_preflight(
+            args.source, recursive=not args.no_recursive, workers=args.workers, pool_kind=pool_kind,
+            exclude_dirs=(destination_path, args.move_to))
+        print(preflight.format_report(preflight.summarize(reports, exif_date, gps_data), seconds))
+        return 0
+
+    progress = {"done": 0, "discovered": 0, "complete": False}
+
+    def counter():
+        total = max(progress["discovered"], progress["done"])
+        return f"{progress['done']}/{total}{'' if progress['complete'] else '+'}"
+
+    def on_event(event):
+        if args.quiet:
+            return
+        kind = event[0]
+        if kind == "discovered":
+            progress["discovered"], progress["complete"] = event[1], event[2]
+        elif kind == "tagged":
+            progress["done"] += 1
+            status = "ok" if event[2] is None else f"ERROR: {event[2]}"
+            print(f"[{counter()}] {event[1]}: {status}")
+        elif kind == "skipped":
+            progress["done"] += 1
+            print(f"[{counter()}] {event[1]}: already tagged, skipped")
+        elif kind == "duplicate":
+            progress["done"] += 1
+            print(f"[{counter()}] {event[1]}: duplicate of {event[2]}, skipped")
+        elif kind == "moved" and event[2] is not None:
+            print(f"[{counter()}] {event[1]}: could not be moved: {event[2]}")
+
+    summary = tagging.run_batch(args.source, destination_path, exif_date, gps_data,
+                                move_enabled, args.move_to or "",
+                                workers=args.workers,
+                                pool_kind=pool_kind,
+                                resume=not args.no_resume,
+                                recursive=not args.no_recursive,
+                                on_event=on_event,
+                                output_mode=tagging.OUTPUT_SIDECAR if args.sidecar else tagging.OUTPUT_REWRITE,
+                                link_mode=args.link,
+                                duplicate_root=args.albums_dir if args.skip_duplicates else None,
+                                verify=not args.no_verify)
+
+    if not summary["discovered"]:
+        print("No .jpg, .jpeg, .tif, .tiff or .png files found in the source directory.")
+        return 0
+
+    print(f"{'Import cancelled' if summary['cancelled'] else 'Import complete'}: "
+          f"{summary['processed']} processed, {summary['skipped']} skipped, {len(summary['errors'])} errors"
+          + (f", {len(summary['duplicates'])} duplicates" if summary["duplicates"] else "")
+          + (f", {summary['moved']} moved" if move_enabled else "")
+          + (f" ({summary['patched']} retagged in place)" if summary["patched"] else ""))
+    for filename in summary["errors"]:
+        print(f"  error: {filename}")
+    if summary["stats"]:
+        print(instrumentation.format_summary(summary["stats"]))
+    return 1 if summary["errors"] or summary["cancelled"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
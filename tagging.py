@@ -0,0 +1,747 @@
+"""
+Headless tagging engine.
+
+Holds everything needed to run an import without a display: input
+validation, EXIF building and the parallel tagging pipeline. Each photo goes
+through three stages - read (EXIF segment only), build/encode (piexif) and
+write (lossless splice or Pillow fallback) - and its output is then read
+back (see verify) before it is committed. Photos are spread over a thread or
+process pool; progress events are pushed onto a queue.Queue so a GUI can
+drain them from its own thread.
+
+This module must not import any Tk modules. Pillow is only imported when a
+file needs the re-encode fallback.
+"""
+import contextlib
+import datetime
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import piexif
+
+import exif_patch
+import file_ops
+import instrumentation
+import jpeg_splice
+import journal
+import scanner
+import verify
+import xmp_sidecar
+
+log = logging.getLogger(__name__)
+
+POOL_THREADS = "threads"
+POOL_PROCESSES = "processes"
+# Output modes: write tagged photos, or leave them untouched and write XMP sidecars
+OUTPUT_REWRITE = "rewrite"
+OUTPUT_SIDECAR = "sidecar"
+NO_ALBUMS_PLACEHOLDER = "(No albums found)"
+
+
+class ValidationError(ValueError):
+    """Raised when import settings are invalid. `title` is a short summary for dialogs."""
+
+    def __init__(self, title, message):
+        super().__init__(message)
+        self.title = title
+
+
+def default_worker_count():
+    return os.cpu_count() or 1
+
+
+## Validation and EXIF building
+def validate_import(source, target, album, move_enabled=False, move_dest=""):
+    """Checks the import settings and returns the album (destination) path."""
+    if move_enabled and not os.path.isdir(move_dest):
+        raise ValidationError("Invalid Path", "The 'Move to' directory is not valid or not selected.")
+
+    if not all([source, target, album]) or album == NO_ALBUMS_PLACEHOLDER:
+        raise ValidationError("Incomplete Fields", "Please select a source directory, target directory, and a valid album.")
+    destination_path = os.path.join(target, album)
+    if not os.path.isdir(destination_path):
+        raise ValidationError("Error", f"The album path '{destination_path}' does not exist or is not a directory.")
+    if move_enabled and is_retag(source, destination_path):
+        raise ValidationError("Invalid Settings", "Photos retagged in place (source is the album) cannot be moved.")
+    return destination_path
+
+
+def is_retag(source_dir, dest_dir):
+    """True if the source is the album itself, i.e. its photos are retagged in place."""
+    try:
+        return os.path.samefile(source_dir, dest_dir)
+    except OSError:
+        return False
+
+
+def make_exif_date(date_str):
+    """Converts a 'YYYY-MM-DD' date to EXIF DateTime bytes."""
+    try:
+        date_obj = datetime.datetime.strptime(date_str, '%Y-%m-%d')
+    except ValueError as e:
+        raise ValidationError("Invalid Date", f"Invalid date selected: {e}")
+    exif_date_str = date_obj.strftime("%Y:%m:%d %H:%M:%S")
+    return exif_date_str.encode('utf-8')
+
+
+def convert_gps_to_exif(latitude, longitude):
+    """Converts decimal GPS coordinates to EXIF rational format."""
+    
+    def to_rational(decimal_coord):
+        abs_coord = abs(decimal_coord)
+        deg_num = int(abs_coord)
+        min_num = int((abs_coord - deg_num) * 60)
+        sec_num = int(((abs_coord - deg_num) * 60 - min_num) * 60 * 10000)
+        sec_den = 10000
+        
+        return [
+            (deg_num, 1),
+            (min_num, 1),
+            (sec_num, sec_den)
+        ]
+
+    lat_ref = b'N' if latitude >= 0 else b'S'
+    lat_exif = to_rational(latitude)
+    
+    lon_ref = b'E' if longitude >= 0 else b'W'
+    lon_exif = to_rational(longitude)
+
+    return {
+        piexif.GPSIFD.GPSVersionID: (2, 0, 0, 0),
+        piexif.GPSIFD.GPSLatitudeRef: lat_ref,
+        piexif.GPSIFD.GPSLatitude: lat_exif,
+        piexif.GPSIFD.GPSLongitudeRef: lon_ref,
+        piexif.GPSIFD.GPSLongitude: lon_exif,
+    }
+
+
+def scan_source(source_dir, recursive=True, exclude_dirs=(), skip_paths=()):
+    """
+    Streams the photos to import (see scanner.scan_images), leaving out
+    skip_paths (normalized with os.path.normcase/abspath, e.g. photos
+    deselected in the preview).
+    """
+    files = scanner.scan_images(source_dir, recursive=recursive, exclude_dirs=exclude_dirs)
+    if not skip_paths:
+        return files
+    return (item for item in files if os.path.normcase(os.path.abspath(item.path)) not in skip_paths)
+
+
+## Stages
+def read_stage(source_file):
+    """Reads the raw EXIF payload. Returns (raw_exif, can_splice)."""
+    with instrumentation.span("open"):
+        if source_file.lower().endswith(scanner.JPEG_EXTENSIONS):
+            try:
+                return jpeg_splice.read_exif(source_file), True
+            except jpeg_splice.SpliceError as e:
+                log.debug("Lossless splice not possible for %s (%s), falling back to re-encode.", source_file, e)
+        from PIL import Image
+        with Image.open(source_file) as img:
+            return img.info.get('exif', b''), False
+
+
+def build_stage(raw_exif, exif_date, exif_gps_dict):
+    """Applies the date/GPS tags to the existing EXIF and returns the dumped bytes."""
+    with instrumentation.span("exif_parse"):
+        try:
+            exif_dict = piexif.load(raw_exif) if raw_exif else {}
+        except piexif.InvalidImageDataError:
+            exif_dict = {"0th": {}, "Exif": {}, "GPS": {}, "1st": {}}
+
+    if "0th" not in exif_dict: exif_dict["0th"] = {}
+    if "Exif" not in exif_dict: exif_dict["Exif"] = {}
+    if "GPS" not in exif_dict: exif_dict["GPS"] = {}
+
+    # 1. OVERWRITE "Date Taken" fields only.
+    exif_dict["Exif"][piexif.ExifIFD.DateTimeOriginal] = exif_date
+    exif_dict["Exif"][piexif.ExifIFD.DateTimeDigitized] = exif_date
+
+    # 2. Add/Overwrite GPS
+    if exif_gps_dict:
+        exif_dict["GPS"] = exif_gps_dict
+
+    # Fix piexif bugs (int vs bytes)
+    if piexif.ExifIFD.SceneType in exif_dict["Exif"]:
+        val = exif_dict["Exif"][piexif.ExifIFD.SceneType]
+        if isinstance(val, int):
+            exif_dict["Exif"][piexif.ExifIFD.SceneType] = val.to_bytes(1, 'big')
+
+    if piexif.ExifIFD.FileSource in exif_dict["Exif"]:
+        val = exif_dict["Exif"][piexif.ExifIFD.FileSource]
+        if isinstance(val, int):
+            exif_dict["Exif"][piexif.ExifIFD.FileSource] = val.to_bytes(1, 'big')
+
+    with instrumentation.span("dump"):
+        return piexif.dump(exif_dict)
+
+
+def write_stage(source_file, dest_file, exif_bytes, can_splice):
+    """Writes the tagged copy, splicing losslessly when possible. Returns verify.SPLICED or verify.ENCODED."""
+    with instrumentation.span("write"):
+        if can_splice:
+            try:
+                jpeg_splice.splice_exif(source_file, dest_file, exif_bytes)
+                return verify.SPLICED
+            except jpeg_splice.SpliceError as e:
+                log.debug("Lossless splice rejected for %s (%s), falling back to re-encode.", source_file, e)
+        from PIL import Image
+        with Image.open(source_file) as img:
+            # Explicit format: dest_file may be a temp name without the image extension.
+            img.save(dest_file, format=img.format, exif=exif_bytes)
+        return verify.ENCODED
+
+
+def tag_file(source_file, dest_file, exif_date, exif_gps_dict):
+    """
+    Runs one photo through all stages. Module-level so process pools can pickle it.
+    The pipeline passes a temp path as dest_file (see file_ops.commit_batch).
+    Returns how the output was written (see write_stage).
+    """
+    raw_exif, can_splice = read_stage(source_file)
+    exif_bytes = build_stage(raw_exif, exif_date, exif_gps_dict)
+    return write_stage(source_file, dest_file, exif_bytes, can_splice)
+
+
+def patch_stage(source_file, exif_date, exif_gps_dict):
+    """
+    Retags a file in place by overwriting its existing date (and GPS) bytes.
+    Returns False, without touching the file, if it needs a full rewrite.
+    """
+    with instrumentation.span("write"):
+        try:
+            exif_patch.patch_file(source_file, exif_date, exif_gps_dict)
+            return True
+        except exif_patch.PatchError as e:
+            log.debug("In-place patch not possible for %s (%s), rewriting it.", source_file, e)
+            return False
+
+
+def run_tag_task(source_file, dest_file, exif_date, exif_gps_dict, journaled=False, trace_name=None,
+                 in_place=False):
+    """
+    Pipeline worker task around tag_file. Returns (source_fingerprint, written, spans):
+    the source fingerprint taken before tagging if journaled (for the journal),
+    how the output was written - verify.PATCHED if the source was patched in
+    place instead of written to dest_file (only tried with in_place) - and
+    the instrumentation spans of this file if trace_name is set.
+    """
+    with instrumentation.collect(trace_name, enabled=trace_name is not None) as trace:
+        source_fingerprint = journal.fingerprint(source_file) if journaled else None
+        if in_place and patch_stage(source_file, exif_date, exif_gps_dict):
+            written = verify.PATCHED
+        else:
+            written = tag_file(source_file, dest_file, exif_date, exif_gps_dict)
+    return source_fingerprint, written, trace.spans
+
+
+def run_sidecar_task(source_file, image_file, image_temp, sidecar_file, exif_date, exif_gps_dict, link_mode,
+                     journaled=False, trace_name=None):
+    """
+    Pipeline worker task for the sidecar output mode: puts the untouched
+    source at image_temp (see file_ops.link_to_temp; nothing is done if
+    image_temp is image_file, already the source) and writes the XMP sidecar
+    to sidecar_file, merged with the sidecar image_file may already have.
+    Both temps are moved to image_file and its sidecar by one commit.
+    Returns (source_fingerprint, verify.SIDECAR, spans) like run_tag_task.
+    """
+    with instrumentation.collect(trace_name, enabled=trace_name is not None) as trace:
+        source_fingerprint = journal.fingerprint(source_file) if journaled else None
+        with instrumentation.span("write"):
+            if image_temp != image_file:
+                file_ops.link_to_temp(source_file, image_temp, link_mode)
+            xmp_sidecar.write_sidecar(sidecar_file, exif_date, exif_gps_dict,
+                                      existing_path=xmp_sidecar.sidecar_path(image_file))
+    return source_fingerprint, verify.SIDECAR, trace.spans
+
+
+def run_verify_task(source_file, image_file, output_file, exif_date, exif_gps_dict, written, trace_name=None):
+    """
+    Pipeline worker task that reads a finished output back (see verify).
+    output_file is what the tag task wrote: the temp file, the sidecar's temp
+    file (image_file being the original linked next to it, still a temp file
+    too unless it already was in the album) or, for a patched photo, the
+    photo itself. Raises verify.VerifyError if the output
+    doesn't pass. Returns the instrumentation spans of this file.
+    """
+    with instrumentation.collect(trace_name, enabled=trace_name is not None) as trace:
+        with instrumentation.span("verify"):
+            if written == verify.SIDECAR:
+                verify.verify_sidecar(source_file, image_file, output_file, exif_date, exif_gps_dict)
+            else:
+                verify.verify_output(source_file, output_file, exif_date, exif_gps_dict, written)
+    return trace.spans
+
+
+def hash_task(source_file):
+    """Pipeline worker task for the duplicate check: the perceptual hash, or None if it can't be computed."""
+    import duplicates  # NumPy is only needed when the check is on
+    try:
+        return duplicates.image_hash(source_file)
+    except Exception as e:
+        log.debug("Could not hash %s (%s), not checking it for duplicates.", source_file, e)
+        return None
+
+
+def unique_path(path, claimed=()):
+    """path, or 'name_2.ext', 'name_3.ext'... if it exists or is claimed."""
+    stem, ext = os.path.splitext(path)
+    candidate, n = path, 1
+    while os.path.exists(candidate) or candidate in claimed:
+        n += 1
+        candidate = f"{stem}_{n}{ext}"
+    return candidate
+
+
+## Pipeline
+class WriteArchiveStage:
+    """
+    The I/O stage, on its own thread: makes finished outputs durable in
+    batches (temp file + fsync + atomic rename) and archives each source as
+    soon as its output is safely in the album, so archiving overlaps with
+    tagging instead of running as a second pass.
+    """
+
+    # Outputs committed per fsync batch, and how long to wait for a batch to fill up (s):
+    # for the next output, and at most since the first one (a steady trickle of photos).
+    BATCH_SIZE = 32
+    BATCH_IDLE_FLUSH = 0.5
+    BATCH_MAX_WAIT = 1.0
+
+    def __init__(self, events, album_journal, tag_key, move_enabled, move_dest, dup_index=None, max_queued=0):
+        self.events = events
+        self.album_journal = album_journal
+        self.dup_index = dup_index
+        self.tag_key = tag_key
+        self.move_enabled = move_enabled
+        self.move_dest = move_dest
+        # With max_queued, commit() blocks while the stage is that far behind.
+        self.inbox = queue.Queue(maxsize=max_queued)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def commit(self, item, temp_file, dest_file, source_fingerprint=None, indexed_path=None, linked=None):
+        """
+        Queues a tagged output (written to temp_file) for commit, then archiving.
+        temp_file is dest_file for a file patched in place; it is only fsynced.
+        indexed_path is the album photo added to the duplicate index, recorded
+        there once the output is committed. linked is the (temp, final) pair of
+        the original next to an XMP sidecar, committed together with it.
+        """
+        self.inbox.put((item, temp_file, dest_file, source_fingerprint, indexed_path, linked))
+
+    def archive_only(self, item):
+        """Queues a source whose output is already in the album (skipped) for archiving."""
+        if self.move_enabled:
+            self.inbox.put((item, None, None, None, None, None))
+
+    def close(self):
+        """Flushes everything queued and waits for the stage to finish."""
+        self.inbox.put(None)
+        self._thread.join()
+
+    def _run(self):
+        batch = []
+        deadline = None
+        while True:
+            timeout = None
+            if batch:
+                timeout = max(0.0, min(self.BATCH_IDLE_FLUSH, deadline - time.monotonic()))
+            try:
+                job = self.inbox.get(timeout=timeout)
+            except queue.Empty:
+                job = False
+            if job is None:
+                self._flush(batch)
+                return
+            if job:
+                if not batch:
+                    deadline = time.monotonic() + self.BATCH_MAX_WAIT
+                batch.append(job)
+            if batch and (job is False or len(batch) >= self.BATCH_SIZE or time.monotonic() >= deadline):
+                self._flush(batch)
+                batch = []
+
+    def _flush(self, batch):
+        if not batch:
+            return
+        to_commit = [(item, [linked, (temp_file, dest_file)] if linked else (temp_file, dest_file))
+                     for item, temp_file, dest_file, _, _, linked in batch if temp_file]
+        results = dict(file_ops.commit_batch([pairs for _, pairs in to_commit],
+                                             labels=[item.rel_path for item, _ in to_commit]))
+        for item, temp_file, dest_file, source_fingerprint, indexed_path, _ in batch:
+            if temp_file:
+                error = results.get(dest_file)
+                if error is not None:
+                    log.error("Error while writing %s: %s", item.rel_path, error)
+                    if indexed_path:
+                        self.dup_index.remove(indexed_path)
+                    self.events.put(("tagged", item.rel_path, error))
+                    continue
+                if indexed_path:
+                    self.dup_index.record(indexed_path)
+                if self.album_journal:
+                    self.album_journal.record_tagged(item.path, dest_file, self.tag_key, source_fingerprint)
+                if temp_file == dest_file:
+                    self.events.put(("patched", item.rel_path))
+                self.events.put(("tagged", item.rel_path, None))
+
+            if self.move_enabled:
+                self._archive(item)
+        if self.album_journal:
+            self.album_journal.commit()
+        if self.dup_index is not None:
+            self.dup_index.commit()
+
+    def _archive(self, item):
+        try:
+            move_dest_path = os.path.join(self.move_dest, item.rel_path)
+            os.makedirs(os.path.dirname(move_dest_path), exist_ok=True)
+            with instrumentation.span("move", item.rel_path):
+                file_ops.move_file(item.path, move_dest_path)
+            if self.album_journal:
+                self.album_journal.record_archived(item.path, move_dest_path)
+            self.events.put(("moved", item.rel_path, None))
+        except Exception as e:
+            log.error("Failed to move %s: %s", item.rel_path, e)
+            self.events.put(("moved", item.rel_path, e))
+
+
+class TaggingPipeline:
+    """
+    Runs a batch on a worker pool from a background thread.
+
+    Photos come from an iterable of scanner.ScannedFile (usually the streaming
+    scanner), consumed on a feeder thread so tagging starts with the first
+    file found. Workers write to temp files; a WriteArchiveStage commits them
+    and archives the sources. Events put on `events` (a queue.Queue):
+      ("discovered", count, complete) - photos found so far; complete once the scan is over
+      ("tagged", rel_path, error)     - error is None once the output is durable in the album
+      ("patched", rel_path)           - sent before "tagged" when a photo was retagged in place
+      ("skipped", rel_path)           - already tagged according to the album journal
+      ("duplicate", rel_path, path)   - not imported: path in the albums is a near-duplicate
+      ("moved", rel_path, error)      - source archived (only with move enabled)
+      ("stats", summary)              - per-stage timings (only with instrumentation on)
+      ("finished", cancelled)
+
+    With output_mode OUTPUT_SIDECAR, photos are not rewritten: the original
+    is hard linked (or reflinked, or copied, see link_mode) into the album
+    and the tags go into an XMP sidecar next to it, which is the output that
+    gets journaled. Both are written as temp files and committed together.
+
+    With duplicate_root (the Albums directory), each photo is hashed before
+    it is tagged and skipped if a near-duplicate is already in any album
+    (see duplicates). The index is brought up to date with the whole Albums
+    directory first; only new or changed photos are hashed. A different
+    photo with the same name as one already in the album is then saved as
+    name_2.jpg instead of overwriting it.
+
+    When the source directory is the album itself, photos are retagged in
+    place: their existing date/GPS bytes are overwritten (see exif_patch)
+    and only photos without those tags are rewritten in full. The journal is
+    not used then, as a repeat run costs no more than the journal lookup.
+
+    max_queued bounds the photos waiting between the stages (scanner to
+    workers, workers to the I/O stage). The intake then slows down to the
+    pace of the album drive instead of queueing up photos in memory, for a
+    `files` iterable that never ends (see watch.py). Unbounded by default,
+    so a batch's scan runs ahead and the progress total is known early.
+
+    With verify on (the default), each output is read back on the pool once
+    it is written (see verify) and only committed, and its source archived,
+    if it carries the requested tags and intact image data. A failure is
+    reported like a write error; the source stays where it is.
+
+    Several pipelines can share one executor and duplicate index (see
+    jobs.JobScheduler); shared ones are left open at the end of a run.
+    `draining` is set once every photo has been handed to the pool and
+    workers are free again, i.e. when the next job can start.
+    """
+
+    # Send a "discovered" event every this many photos found.
+    DISCOVERED_EVENT_EVERY = 50
+
+    def __init__(self, workers=None, pool_kind=POOL_THREADS, resume=True,
+                 output_mode=OUTPUT_REWRITE, link_mode=file_ops.LINK_AUTO, duplicate_root=None,
+                 executor=None, duplicate_index=None, max_queued=None, verify=True):
+        self.workers = max(1, workers or default_worker_count())
+        self.pool_kind = pool_kind
+        self.resume = resume
+        self.output_mode = output_mode
+        self.link_mode = link_mode
+        self.duplicate_root = duplicate_root
+        self.executor = executor
+        self.duplicate_index = duplicate_index
+        self.max_queued = max_queued
+        self.verify = verify
+        self.events = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.draining = threading.Event()
+        self._thread = None
+
+    def start(self, source_dir, dest_dir, files, exif_date, exif_gps_dict, move_enabled, move_dest):
+        self._thread = threading.Thread(
+            target=self._run,
+            args=(source_dir, dest_dir, files, exif_date, exif_gps_dict, move_enabled, move_dest),
+            daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def _make_executor(self):
+        if self.pool_kind == POOL_PROCESSES:
+            # Imports multiprocessing, which the GUI doesn't need at startup
+            from concurrent.futures import ProcessPoolExecutor
+            return ProcessPoolExecutor(max_workers=self.workers)
+        return ThreadPoolExecutor(max_workers=self.workers)
+
+    def _feed(self, files, inbox, recorder):
+        """Pulls photos from the scanner into inbox; None marks the end."""
+        count = 0
+        files = iter(files)
+        try:
+            while True:
+                start = time.perf_counter()
+                item = next(files, None)
+                if item is None or self.cancel_event.is_set():
+                    break
+                if recorder and recorder.sample(item.rel_path):
+                    recorder.add("scan", item.rel_path, time.time(), time.perf_counter() - start)
+                if not self._put(inbox, item):
+                    break
+                count += 1
+                if count % self.DISCOVERED_EVENT_EVERY == 0:
+                    self.events.put(("discovered", count, False))
+        finally:
+            self.events.put(("discovered", count, True))
+            self._put(inbox, None)
+
+    def _put(self, inbox, item):
+        """Puts item on a (possibly bounded) inbox; gives up if the run is cancelled meanwhile."""
+        while True:
+            try:
+                inbox.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                if self.cancel_event.is_set():
+                    return False
+
+    def _open_duplicate_index(self):
+        if self.duplicate_index is not None:
+            return self.duplicate_index
+        try:
+            import duplicates
+        except ImportError as e:
+            log.warning("Duplicate check disabled (%s).", e)
+            return None
+        return duplicates.DuplicateIndex.for_root(self.duplicate_root)
+
+    def _run(self, source_dir, dest_dir, files, exif_date, exif_gps_dict, move_enabled, move_dest):
+        in_place = is_retag(source_dir, dest_dir)
+        sidecar = self.output_mode == OUTPUT_SIDECAR
+        album_journal = journal.ImportJournal.for_album(dest_dir) if self.resume and not in_place else None
+        dup_index = (self._open_duplicate_index() if (self.duplicate_root or self.duplicate_index is not None)
+                     and not in_place else None)
+        tag_key = journal.make_tag_key(exif_date, exif_gps_dict)
+        io_stage = WriteArchiveStage(self.events, album_journal, tag_key, move_enabled, move_dest, dup_index,
+                                     max_queued=self.max_queued or 0)
+        recorder = instrumentation.current()
+        if recorder:
+            recorder.start_run()
+        inbox = queue.Queue(maxsize=self.max_queued or 0)
+        threading.Thread(target=self._feed, args=(files, inbox, recorder), daemon=True).start()
+        prepared_dirs = set()
+        claimed_dests = set()
+        # future -> (stage, item, temp_file, output_file, indexed dest_file, result of the tag task)
+        pending = {}
+        # Sidecar mode: sidecar temp file -> (temp file of the original, its final path)
+        linked_temps = {}
+
+        def submit_tag(executor, item, dest_file, indexed=False):
+            output_file = xmp_sidecar.sidecar_path(dest_file) if sidecar else dest_file
+            dest_subdir = os.path.dirname(dest_file)
+            if dest_subdir not in prepared_dirs:
+                os.makedirs(dest_subdir, exist_ok=True)
+                file_ops.remove_stale_temps(dest_subdir)
+                prepared_dirs.add(dest_subdir)
+            temp_file = file_ops.temp_path_for(output_file)
+            trace_name = item.rel_path if recorder and recorder.wants(item.rel_path) else None
+            if sidecar:
+                # Already hard linked into the album by an earlier run: only the sidecar is written.
+                linked = file_ops.is_linked(item.path, dest_file)
+                image_temp = dest_file if linked else file_ops.temp_path_for(dest_file)
+                linked_temps[temp_file] = (image_temp, dest_file)
+                future = executor.submit(run_sidecar_task, item.path, dest_file, image_temp, temp_file,
+                                         exif_date, exif_gps_dict, self.link_mode,
+                                         album_journal is not None, trace_name)
+            else:
+                future = executor.submit(run_tag_task, item.path, temp_file, exif_date, exif_gps_dict,
+                                         album_journal is not None, trace_name, in_place)
+            pending[future] = ("tag", item, temp_file, output_file, dest_file if indexed else None, None)
+
+        def submit_verify(executor, item, temp_file, output_file, dest_file, tagged):
+            """Reads the output back; it is only committed (and the source archived) once it passes."""
+            written = tagged[1]
+            trace_name = item.rel_path if recorder and recorder.wants(item.rel_path) else None
+            image_file = linked_temps[temp_file][0] if written == verify.SIDECAR else output_file
+            future = executor.submit(run_verify_task, item.path, image_file,
+                                     output_file if written == verify.PATCHED else temp_file,
+                                     exif_date, exif_gps_dict, written, trace_name)
+            pending[future] = ("verify", item, temp_file, output_file, dest_file, tagged)
+
+        def check_duplicate(executor, item, dest_file, phash):
+            """Tags the photo unless it is a duplicate; picks a free name on a collision."""
+            if phash is None:
+                submit_tag(executor, item, dest_file)
+                return
+            # The album photo at dest_file itself is this photo's earlier import (a retag).
+            match = dup_index.find(phash, ignore=(dest_file,))
+            if match:
+                self.events.put(("duplicate", item.rel_path, match[0]))
+                io_stage.archive_only(item)
+                return
+            distance = dup_index.distance(dest_file, phash) if os.path.exists(dest_file) else 0
+            if distance is None or distance > dup_index.max_distance:
+                dest_file = unique_path(dest_file, claimed_dests)
+                claimed_dests.add(dest_file)
+            dup_index.add(dest_file, phash)
+            submit_tag(executor, item, dest_file, indexed=True)
+
+        try:
+            with (contextlib.nullcontext(self.executor) if self.executor else self._make_executor()) as executor:
+                if dup_index is not None and dup_index is not self.duplicate_index:
+                    # Photos put into any album by other means since the last run (a shared
+                    # index is refreshed by its owner).
+                    dup_index.refresh(map_func=executor.map)
+                # Keep a bounded number of files in flight so cancel is quick.
+                max_in_flight = self.workers * 2
+                exhausted = False
+                while pending or not exhausted:
+                    while not exhausted and len(pending) < max_in_flight and not self.cancel_event.is_set():
+                        try:
+                            # Only block for the scanner when there is nothing else to wait for.
+                            item = inbox.get(block=not pending)
+                        except queue.Empty:
+                            break
+                        if item is None:
+                            exhausted = True
+                            break
+                        dest_file = os.path.join(dest_dir, item.rel_path)
+                        output_file = xmp_sidecar.sidecar_path(dest_file) if sidecar else dest_file
+                        if album_journal and album_journal.is_done(item.path, output_file, tag_key,
+                                                                   source_stat=(item.size, item.mtime_ns)):
+                            self.events.put(("skipped", item.rel_path))
+                            io_stage.archive_only(item)
+                            continue
+
+                        if dup_index is not None:
+                            future = executor.submit(hash_task, item.path)
+                            pending[future] = ("hash", item, None, None, dest_file, None)
+                        else:
+                            submit_tag(executor, item, dest_file)
+                    if self.cancel_event.is_set():
+                        exhausted = True
+                    if exhausted and len(pending) < self.workers:
+                        self.draining.set()
+                    if not pending:
+                        continue
+
+                    # Time out now and then to pick up newly scanned photos.
+                    done, _ = wait(pending, timeout=0.05, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        stage, item, temp_file, output_file, dest_file, tagged = pending.pop(future)
+                        error = future.exception()
+                        if stage == "hash":
+                            check_duplicate(executor, item, dest_file, None if error else future.result())
+                        elif error is None:
+                            if stage == "tag":
+                                tagged = future.result()
+                            if recorder:
+                                recorder.add_spans(tagged[2] if stage == "tag" else future.result())
+                            if stage == "tag" and self.verify:
+                                submit_verify(executor, item, temp_file, output_file, dest_file, tagged)
+                                continue
+                            source_fingerprint, written, _ = tagged
+                            linked = linked_temps.pop(temp_file, None)
+                            io_stage.commit(item, output_file if written == verify.PATCHED else temp_file,
+                                            output_file, source_fingerprint, dest_file,
+                                            linked if linked and linked[0] != linked[1] else None)
+                        else:
+                            # A photo patched in place is the album's own file: it is kept.
+                            if not (tagged and tagged[1] == verify.PATCHED):
+                                file_ops.discard(temp_file)
+                            image_temp, image_file = linked_temps.pop(temp_file, (None, None))
+                            if image_temp != image_file:
+                                file_ops.discard(image_temp)
+                            if dest_file:
+                                dup_index.remove(dest_file)
+                            log.error("Error while processing %s: %s", item.rel_path, error)
+                            self.events.put(("tagged", item.rel_path, error))
+        finally:
+            # Everything already tagged is committed and archived, even after a cancel.
+            io_stage.close()
+            if album_journal:
+                album_journal.close()
+            if dup_index is not None and dup_index is not self.duplicate_index:
+                dup_index.close()
+            self.draining.set()
+            if recorder:
+                self.events.put(("stats", recorder.finish_run()))
+            self.events.put(("finished", self.cancel_event.is_set()))
+
+
+def run_batch(source_dir, dest_dir, exif_date, gps_data, move_enabled=False, move_dest="",
+              workers=None, pool_kind=POOL_THREADS, resume=True, recursive=True, on_event=None,
+              output_mode=OUTPUT_REWRITE, link_mode=file_ops.LINK_AUTO, duplicate_root=None, verify=True):
+    """
+    Runs a whole import synchronously (for the CLI and other headless callers).
+    on_event, if given, is called with every pipeline event.
+    Returns a summary dict with discovered/processed/patched/skipped/errors/moved counts,
+    the photos skipped as duplicates (rel_path, existing path) under "duplicates",
+    and the per-stage timings under "stats" when instrumentation is on.
+    """
+    exif_gps_dict = convert_gps_to_exif(gps_data[0], gps_data[1]) if gps_data else {}
+    files = scan_source(source_dir, recursive=recursive,
+                        exclude_dirs=(dest_dir, move_dest if move_enabled else None))
+
+    summary = {"discovered": 0, "processed": 0, "patched": 0, "skipped": 0, "errors": [], "moved": 0,
+               "duplicates": [], "cancelled": False, "stats": None}
+
+    pipeline = TaggingPipeline(workers=workers, pool_kind=pool_kind, resume=resume,
+                               output_mode=output_mode, link_mode=link_mode, duplicate_root=duplicate_root,
+                               verify=verify)
+    pipeline.start(source_dir, dest_dir, files, exif_date, exif_gps_dict, move_enabled, move_dest)
+    while True:
+        try:
+            event = pipeline.events.get()
+        except KeyboardInterrupt:
+            pipeline.cancel()
+            continue
+        kind = event[0]
+        if kind == "discovered":
+            summary["discovered"] = event[1]
+        elif kind == "tagged":
+            if event[2] is None:
+                summary["processed"] += 1
+            else:
+                summary["errors"].append(event[1])
+        elif kind == "patched":
+            summary["patched"] += 1
+        elif kind == "skipped":
+            summary["skipped"] += 1
+        elif kind == "duplicate":
+            summary["duplicates"].append((event[1], event[2]))
+        elif kind == "moved" and event[2] is None:
+            summary["moved"] += 1
+        elif kind == "stats":
+            summary["stats"] = event[1]
+        if on_event:
+            on_event(event)
+        if kind == "finished":
+            summary["cancelled"] = event[1]
+            return summary
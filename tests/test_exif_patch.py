@@ -0,0 +1,88 @@
+import os
+
+import piexif
+import pytest
+from PIL import Image
+
+import exif_patch
+import jpeg_splice
+import tagging
+
+OLD_DATE = b"2001:01:01 12:00:00"
+NEW_DATE = b"1985:07:14 00:00:00"
+
+
+def write_photo(path, gps=None, date=OLD_DATE):
+    exif = piexif.dump({"0th": {}, "Exif": {piexif.ExifIFD.DateTimeOriginal: date,
+                                            piexif.ExifIFD.DateTimeDigitized: date},
+                        "GPS": gps or {}, "1st": {}})
+    Image.new("RGB", (64, 48), (40, 120, 200)).save(path, "JPEG", exif=exif)
+    return path
+
+
+def tags(path):
+    exif_dict = piexif.load(str(path))
+    return exif_dict["Exif"][piexif.ExifIFD.DateTimeOriginal], exif_dict["GPS"]
+
+
+def scan_data(path):
+    with open(path, "rb") as f:
+        _, _, end = jpeg_splice.scan_header(f)[-1]
+        f.seek(end)
+        return f.read()
+
+
+def test_patch_date_without_gps_ifd(tmp_path):
+    path = write_photo(tmp_path / "photo.jpg")
+    size, scan = os.path.getsize(path), scan_data(path)
+
+    assert exif_patch.patch_file(str(path), NEW_DATE) == 2 * 20
+    assert tags(path)[0] == NEW_DATE
+    assert os.path.getsize(path) == size
+    assert scan_data(path) == scan
+    # Patching again writes nothing.
+    assert exif_patch.patch_file(str(path), NEW_DATE) == 0
+
+
+def test_patch_date_and_gps(tmp_path):
+    path = write_photo(tmp_path / "photo.jpg", gps=tagging.convert_gps_to_exif(-33.8688, 151.2093))
+    gps = tagging.convert_gps_to_exif(48.8566, 2.3522)
+
+    assert exif_patch.patch_file(str(path), NEW_DATE, gps) > 0
+    date, stored_gps = tags(path)
+    assert date == NEW_DATE
+    assert stored_gps[piexif.GPSIFD.GPSLatitudeRef] == b"N"
+    assert stored_gps[piexif.GPSIFD.GPSLatitude] == tuple(tuple(v) for v in gps[piexif.GPSIFD.GPSLatitude])
+    assert exif_patch.holds_tags(jpeg_splice.read_exif(str(path)), NEW_DATE, gps)
+
+
+def test_patch_refuses_gps_without_gps_ifd(tmp_path):
+    path = write_photo(tmp_path / "photo.jpg")
+    before = path.read_bytes()
+    with pytest.raises(exif_patch.PatchError):
+        exif_patch.patch_file(str(path), NEW_DATE, tagging.convert_gps_to_exif(48.8566, 2.3522))
+    assert path.read_bytes() == before
+
+
+def test_patch_refuses_different_gps_tags(tmp_path):
+    gps = tagging.convert_gps_to_exif(48.8566, 2.3522)
+    path = write_photo(tmp_path / "photo.jpg", gps={**gps, piexif.GPSIFD.GPSAltitude: (35, 1)})
+    before = path.read_bytes()
+    with pytest.raises(exif_patch.PatchError):
+        exif_patch.patch_file(str(path), NEW_DATE, gps)
+    assert path.read_bytes() == before
+
+
+def test_patch_refuses_hard_linked_file(tmp_path):
+    path = write_photo(tmp_path / "photo.jpg")
+    os.link(path, tmp_path / "original.jpg")
+    before = path.read_bytes()
+    with pytest.raises(exif_patch.PatchError):
+        exif_patch.patch_file(str(path), NEW_DATE)
+    assert path.read_bytes() == before
+
+
+def test_patch_refuses_other_date_sizes(tmp_path):
+    path = write_photo(tmp_path / "photo.jpg", date=b"2001:01:01")
+    with pytest.raises(exif_patch.PatchError):
+        exif_patch.patch_file(str(path), NEW_DATE)
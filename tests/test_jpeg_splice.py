@@ -0,0 +1,99 @@
+import io
+
+import piexif
+import pytest
+from PIL import Image
+
+import jpeg_splice
+import tagging
+import verify
+
+DATE = b"1985:07:14 00:00:00"
+
+
+def make_exif(date=DATE, gps=None):
+    return piexif.dump({"0th": {}, "Exif": {piexif.ExifIFD.DateTimeOriginal: date,
+                                            piexif.ExifIFD.DateTimeDigitized: date},
+                        "GPS": gps or {}, "1st": {}})
+
+
+def jpeg_bytes(**save_args):
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 48), (200, 120, 40)).save(buffer, "JPEG", quality=90, **save_args)
+    return buffer.getvalue()
+
+
+def app1_after_icc():
+    """A JPEG whose header is SOI, APP0, APP2 (ICC), then APP1 (EXIF)."""
+    data = jpeg_bytes(icc_profile=b"\x00" * 128)
+    with io.BytesIO(data) as f:
+        segments = jpeg_splice.scan_header(f)
+    icc_end = next(end for marker, _, end in segments if marker == 0xE2)
+    exif = make_exif(b"2001:01:01 00:00:00")
+    segment = b"\xff\xe1" + (len(exif) + 2).to_bytes(2, "big") + exif
+    return data[:icc_end] + segment + data[icc_end:]
+
+
+@pytest.fixture(params=["no_app1", "app1", "app1_after_icc"])
+def source(request, tmp_path):
+    data = {
+        "no_app1": lambda: jpeg_bytes(),
+        "app1": lambda: jpeg_bytes(exif=make_exif(b"2001:01:01 00:00:00")),
+        "app1_after_icc": app1_after_icc,
+    }[request.param]()
+    path = tmp_path / "source.jpg"
+    path.write_bytes(data)
+    return path
+
+
+def markers(path):
+    with open(path, "rb") as f:
+        return [marker for marker, _, _ in jpeg_splice.scan_header(f)]
+
+
+def test_splice_replaces_only_the_exif_segment(source, tmp_path):
+    exif = make_exif(gps=tagging.convert_gps_to_exif(48.8566, 2.3522))
+    dest = tmp_path / "dest.jpg"
+    jpeg_splice.splice_exif(str(source), str(dest), exif)
+
+    assert jpeg_splice.read_exif(str(dest)) == exif
+    assert jpeg_splice.same_payload(str(source), str(dest))
+    # The other segments keep their order; exactly one APP1 is added or replaced.
+    source_markers = [m for m in markers(source) if m != 0xE1]
+    assert [m for m in markers(dest) if m != 0xE1] == source_markers
+    assert markers(dest).count(0xE1) == 1
+    with Image.open(dest) as img:
+        img.load()
+
+
+def test_splice_inserts_exif_after_jfif(tmp_path):
+    source = tmp_path / "source.jpg"
+    source.write_bytes(jpeg_bytes())
+    dest = tmp_path / "dest.jpg"
+    jpeg_splice.splice_exif(str(source), str(dest), make_exif())
+    assert markers(dest)[:2] == [0xE0, 0xE1]
+
+
+def test_same_payload_notices_changed_scan_data(source, tmp_path):
+    dest = tmp_path / "dest.jpg"
+    jpeg_splice.splice_exif(str(source), str(dest), make_exif())
+    data = bytearray(dest.read_bytes())
+    data[-10] ^= 0xFF
+    dest.write_bytes(bytes(data))
+    assert not jpeg_splice.same_payload(str(source), str(dest))
+
+
+def test_splice_rejects_same_file(source):
+    with pytest.raises(jpeg_splice.SpliceError):
+        jpeg_splice.splice_exif(str(source), str(source), make_exif())
+
+
+def test_verify_output_rejects_truncated_output(source, tmp_path):
+    gps = tagging.convert_gps_to_exif(48.8566, 2.3522)
+    dest = tmp_path / "dest.jpg"
+    jpeg_splice.splice_exif(str(source), str(dest), make_exif(gps=gps))
+    verify.verify_output(str(source), str(dest), DATE, gps, verify.SPLICED)
+
+    dest.write_bytes(dest.read_bytes()[:-100])
+    with pytest.raises(verify.VerifyError):
+        verify.verify_output(str(source), str(dest), DATE, gps, verify.SPLICED)
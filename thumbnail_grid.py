@@ -0,0 +1,306 @@
+"""
+Scrollable thumbnail grid of the photos in a source folder, with
+per-photo selection.
+
+The grid is virtualized: canvas items only exist for the tiles in view, and
+only those thumbnails are requested from the thumbnails.ThumbnailLoader,
+so folders with thousands of scans scroll as smoothly as small ones. The
+folder is scanned in the background and tiles appear as photos are found.
+"""
+import os
+import queue
+import threading
+
+import customtkinter as ctk
+import tkinter as tk
+from PIL import ImageTk
+
+import scanner
+import thumbnails
+
+# How often finished thumbnails and scan results are picked up (ms)
+POLL_MS = 50
+TILE_PAD = 8
+LABEL_HEIGHT = 18
+SCAN_BATCH = 200
+EMPTY_TEXT = "Select a source directory to see its photos."
+
+
+def _normalize(path):
+    return os.path.normcase(os.path.abspath(path))
+
+
+class ThumbnailGrid(ctk.CTkFrame):
+    """
+    Shows the photos of a folder (see load()). Clicking a tile deselects or
+    reselects it, shift-click applies the same to a range; excluded_paths()
+    returns the photos left out (normalized with os.path.normcase/abspath).
+    """
+
+    def __init__(self, master, loader, **kwargs):
+        super().__init__(master, **kwargs)
+        self.loader = loader
+        self.size = loader.size
+        self.cell_w = self.size + 2 * TILE_PAD
+        self.cell_h = self.size + LABEL_HEIGHT + 2 * TILE_PAD
+
+        self.source = None  # (source_dir, recursive) of the loaded folder
+        self.items = []
+        self.index_of = {}
+        self.deselected = set()
+        self.failed = set()
+        self.scanning = False
+        self._generation = 0
+        self._scan_results = queue.Queue()
+        self._anchor = None
+        self._columns = 1
+        self._tiles = {}   # index -> canvas item ids (frame, image, overlay, label)
+        self._photos = {}  # key -> ImageTk.PhotoImage, for the tiles in view
+        self._redraw_pending = False
+
+        self.grid_columnconfigure(0, weight=1)
+        self.grid_rowconfigure(1, weight=1)
+
+        header = ctk.CTkFrame(self, fg_color="transparent")
+        header.grid(row=0, column=0, columnspan=2, sticky="ew", padx=10, pady=(10, 5))
+        self.status_label = ctk.CTkLabel(header, text=EMPTY_TEXT)
+        self.status_label.pack(side="left")
+        ctk.CTkButton(header, text="Select None", width=100, command=self.select_none).pack(side="right")
+        ctk.CTkButton(header, text="Select All", width=100, command=self.select_all).pack(side="right", padx=5)
+
+        background = self._apply_appearance_mode(ctk.ThemeManager.theme["CTkFrame"]["fg_color"])
+        self.canvas = tk.Canvas(self, highlightthickness=0, background=background,
+                                yscrollincrement=max(1, self.cell_h // 4))
+        self.canvas.grid(row=1, column=0, sticky="nsew", padx=(10, 0), pady=(0, 10))
+        self.scrollbar = ctk.CTkScrollbar(self, command=self.canvas.yview)
+        self.scrollbar.grid(row=1, column=1, sticky="ns", padx=(0, 5), pady=(0, 10))
+        self.canvas.configure(yscrollcommand=self._on_yview)
+
+        self.canvas.bind("<Configure>", lambda event: self._relayout())
+        self.canvas.bind("<Map>", lambda event: self._schedule_redraw())
+        self.canvas.bind("<Button-1>", self._on_click)
+        self.canvas.bind("<Shift-Button-1>", lambda event: self._on_click(event, extend=True))
+        self.canvas.bind("<MouseWheel>", self._on_wheel)
+        self.canvas.bind("<Button-4>", lambda event: self.canvas.yview_scroll(-1, "units"))
+        self.canvas.bind("<Button-5>", lambda event: self.canvas.yview_scroll(1, "units"))
+
+        self.after(POLL_MS, self._poll)
+
+    ## Loading
+    def load(self, source_dir, recursive=True, exclude_dirs=()):
+        """Shows the photos of source_dir (scanned in the background). Keeps the selection if it is already shown."""
+        if self.source == (source_dir, recursive):
+            return
+        self._generation += 1
+        self.source = (source_dir, recursive)
+        self.items = []
+        self.index_of = {}
+        self.deselected = set()
+        self.failed = set()
+        self._anchor = None
+        self._clear_tiles()
+        self.canvas.yview_moveto(0)
+        self.scanning = True
+        generation = self._generation
+
+        def scan():
+            batch = []
+            try:
+                for item in scanner.scan_images(source_dir, recursive=recursive, exclude_dirs=exclude_dirs):
+                    batch.append(item)
+                    if len(batch) >= SCAN_BATCH:
+                        self._scan_results.put((generation, batch))
+                        batch = []
+            finally:
+                self._scan_results.put((generation, batch))
+                self._scan_results.put((generation, None))
+
+        threading.Thread(target=scan, daemon=True).start()
+        self._update_status()
+
+    def clear(self):
+        self._generation += 1
+        self.source = None
+        self.items = []
+        self.index_of = {}
+        self.deselected = set()
+        self.scanning = False
+        self._clear_tiles()
+        self._update_extent()
+        self._update_status()
+
+    def excluded_paths(self, source_dir, recursive=True):
+        """The photos deselected in the grid, if it shows source_dir (otherwise none)."""
+        if (self.source is None or self.source[1] != recursive or not source_dir
+                or _normalize(self.source[0]) != _normalize(source_dir)):
+            return set()
+        return {_normalize(path) for path in self.deselected}
+
+    ## Selection
+    def select_all(self):
+        self.deselected.clear()
+        self._restyle_visible()
+
+    def select_none(self):
+        self.deselected = {item.path for item in self.items}
+        self._restyle_visible()
+
+    def _on_click(self, event, extend=False):
+        index = self._index_at(self.canvas.canvasx(event.x), self.canvas.canvasy(event.y))
+        if index is None:
+            return
+        select = self.items[index].path in self.deselected
+        if extend and self._anchor is not None:
+            indices = range(min(self._anchor, index), max(self._anchor, index) + 1)
+        else:
+            indices = (index,)
+        for i in indices:
+            if select:
+                self.deselected.discard(self.items[i].path)
+            else:
+                self.deselected.add(self.items[i].path)
+        self._anchor = index
+        self._restyle_visible()
+
+    def _restyle_visible(self):
+        for index in self._tiles:
+            self._style_tile(index)
+        self._update_status()
+
+    def _update_status(self):
+        if self.source is None:
+            text = EMPTY_TEXT
+        else:
+            text = f"{len(self.items)} photos"
+            if self.deselected:
+                text += f", {len(self.items) - len(self.deselected)} selected"
+            if self.scanning:
+                text += " (scanning...)"
+        if text != self.status_label.cget("text"):
+            self.status_label.configure(text=text)
+
+    ## Layout and drawing
+    def _index_at(self, x, y):
+        column, row = int(x // self.cell_w), int(y // self.cell_h)
+        if column >= self._columns or x < 0 or y < 0:
+            return None
+        index = row * self._columns + column
+        return index if index < len(self.items) else None
+
+    def _on_yview(self, first, last):
+        self.scrollbar.set(first, last)
+        self._schedule_redraw()
+
+    def _on_wheel(self, event):
+        step = -1 if event.delta > 0 else 1
+        self.canvas.yview_scroll(step * max(1, abs(event.delta) // 120), "units")
+
+    def _relayout(self):
+        columns = max(1, self.canvas.winfo_width() // self.cell_w)
+        if columns != self._columns:
+            self._columns = columns
+            self._clear_tiles()
+        self._update_extent()
+        self._schedule_redraw()
+
+    def _update_extent(self):
+        rows = -(-len(self.items) // self._columns)
+        self.canvas.configure(scrollregion=(0, 0, self._columns * self.cell_w, rows * self.cell_h))
+
+    def _schedule_redraw(self):
+        if not self._redraw_pending:
+            self._redraw_pending = True
+            self.after_idle(self._redraw)
+
+    def _clear_tiles(self):
+        self.canvas.delete("all")
+        self._tiles.clear()
+        self._photos.clear()
+
+    def _visible_range(self):
+        top = self.canvas.canvasy(0)
+        first_row = max(0, int(top // self.cell_h))
+        last_row = int((top + self.canvas.winfo_height()) // self.cell_h)
+        return range(first_row * self._columns, min(len(self.items), (last_row + 1) * self._columns))
+
+    def _redraw(self):
+        """Creates the tiles that came into view, drops the others, and asks for their thumbnails."""
+        self._redraw_pending = False
+        # e.g. on a hidden tab: nothing to decode until it is shown
+        visible = self._visible_range() if self.canvas.winfo_ismapped() else range(0)
+        for index in [i for i in self._tiles if i not in visible]:
+            for item_id in self._tiles.pop(index):
+                self.canvas.delete(item_id)
+            self._photos.pop(thumbnails.thumbnail_key(self.items[index]), None)
+
+        keys = [thumbnails.thumbnail_key(self.items[i]) for i in visible]
+        self.loader.set_wanted(k for k in keys if k not in self.failed)
+        for index, key in zip(visible, keys):
+            if index not in self._tiles:
+                self._draw_tile(index)
+            if key not in self._photos and key not in self.failed:
+                image = self.loader.request(key)
+                if image is not None:
+                    self._show_thumbnail(key, image)
+
+    def _draw_tile(self, index):
+        item = self.items[index]
+        row, column = divmod(index, self._columns)
+        x0, y0 = column * self.cell_w + TILE_PAD, row * self.cell_h + TILE_PAD
+        center = (x0 + self.size // 2, y0 + self.size // 2)
+        name = os.path.basename(item.rel_path)
+        if len(name) > 22:
+            name = name[:10] + "..." + name[-9:]
+        self._tiles[index] = (
+            self.canvas.create_rectangle(x0 - 3, y0 - 3, x0 + self.size + 3, y0 + self.size + 3, width=2),
+            self.canvas.create_image(*center, anchor="center"),
+            self.canvas.create_rectangle(x0, y0, x0 + self.size, y0 + self.size, fill="black",
+                                         stipple="gray50", width=0, state="hidden"),
+            self.canvas.create_text(center[0], y0 + self.size + LABEL_HEIGHT // 2 + 2, text=name,
+                                    font=("Arial", 9)),
+        )
+        self._style_tile(index)
+
+    def _style_tile(self, index):
+        frame, _, overlay, label = self._tiles[index]
+        selected = self.items[index].path not in self.deselected
+        self.canvas.itemconfigure(frame, outline="#1f6aa5" if selected else "#555555")
+        self.canvas.itemconfigure(overlay, state="hidden" if selected else "normal")
+        self.canvas.itemconfigure(label, fill="#dce4ee" if selected else "#777777")
+
+    def _show_thumbnail(self, key, image):
+        index = self.index_of.get(key)
+        if index not in self._tiles:
+            return
+        photo = ImageTk.PhotoImage(image)
+        self._photos[key] = photo
+        self.canvas.itemconfigure(self._tiles[index][1], image=photo)
+
+    ## Background results
+    def _poll(self):
+        try:
+            while True:
+                generation, batch = self._scan_results.get_nowait()
+                if generation != self._generation:
+                    continue
+                if batch is None:
+                    self.scanning = False
+                    continue
+                for item in batch:
+                    self.index_of[thumbnails.thumbnail_key(item)] = len(self.items)
+                    self.items.append(item)
+                self._update_extent()
+                self._schedule_redraw()
+        except queue.Empty:
+            pass
+        try:
+            while True:
+                key, image = self.loader.results.get_nowait()
+                if image is None:
+                    self.failed.add(key)
+                elif key not in self._photos:
+                    self._show_thumbnail(key, image)
+        except queue.Empty:
+            pass
+        self._update_status()
+        self.after(POLL_MS, self._poll)
@@ -0,0 +1,185 @@
+"""
+Thumbnails of source photos for the preview grid.
+
+A thumbnail comes from, in order:
+  1. a size-bounded LRU of decoded images in memory,
+  2. a size-bounded LRU disk cache (SQLite), keyed by path, mtime and size so
+     an edited photo is never shown with its old thumbnail,
+  3. the photo itself: the thumbnail embedded in its EXIF if there is one
+     (read from the header only), otherwise a reduced-size decode (JPEG
+     draft mode decodes at 1/2 to 1/8 scale).
+
+Thumbnails are made on a background pool, and only for the photos the grid
+still wants when a worker gets to them, so scrolling quickly through a large
+folder doesn't queue up thousands of decodes. No GUI dependencies.
+"""
+import io
+import logging
+import os
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import sqlite_lru
+
+log = logging.getLogger(__name__)
+
+THUMBNAIL_SIZE = 160
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".photo-tagger", "thumbnails.sqlite")
+DEFAULT_CACHE_BYTES = 200 * 1024 * 1024
+DEFAULT_MEMORY_BYTES = 64 * 1024 * 1024
+JPEG_QUALITY = 80
+
+
+def thumbnail_key(item):
+    """Cache key of a scanner.ScannedFile."""
+    return item.path, item.mtime_ns, item.size
+
+
+def _embedded_thumbnail(path, size):
+    """The EXIF thumbnail of a photo as an image, or None. Only reads the header."""
+    import piexif
+    from PIL import Image
+    import preflight
+    with open(path, "rb") as f:
+        raw = preflight.read_raw_exif(f)
+        if not len(raw):
+            return None
+        data = piexif.load(raw).get("thumbnail")
+    if not data:
+        return None
+    image = Image.open(io.BytesIO(data))
+    # Much smaller than asked for: a full decode looks better.
+    if max(image.size) < size // 2:
+        return None
+    return image
+
+
+def make_thumbnail(path, size=THUMBNAIL_SIZE):
+    """A JPEG thumbnail (bytes) of an image file, at most size x size pixels."""
+    from PIL import Image
+    image = None
+    try:
+        image = _embedded_thumbnail(path, size)
+    except Exception as e:
+        log.debug("No usable EXIF thumbnail in %s (%s).", path, e)
+    if image is None:
+        image = Image.open(path)
+        image.draft("RGB", (size, size))
+    with image:
+        image.thumbnail((size, size), Image.BILINEAR)
+        out = io.BytesIO()
+        image.convert("RGB").save(out, "JPEG", quality=JPEG_QUALITY)
+    return out.getvalue()
+
+
+class MemoryCache:
+    """LRU of decoded thumbnails, bounded by their size in bytes. Thread-safe."""
+
+    def __init__(self, max_bytes=DEFAULT_MEMORY_BYTES):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, image):
+        nbytes = image.width * image.height * len(image.getbands())
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old:
+                self.total_bytes -= old[1]
+            self.entries[key] = (image, nbytes)
+            self.total_bytes += nbytes
+            while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.total_bytes -= evicted
+
+
+class ThumbnailDiskCache(sqlite_lru.SQLiteLRUCache):
+    """Size-bounded LRU thumbnail cache in a single SQLite file. Thread-safe."""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_CACHE_BYTES):
+        super().__init__(path, "thumbnails", (("path", "TEXT"), ("mtime_ns", "INTEGER"),
+                                              ("file_size", "INTEGER")), max_bytes)
+
+    def _delete_replaced(self, key):
+        # Older versions of the photo too: their keys can't be hit again.
+        freed = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM thumbnails WHERE path=?",
+                                  (key[0],)).fetchone()[0]
+        self.conn.execute("DELETE FROM thumbnails WHERE path=?", (key[0],))
+        return freed
+
+
+class ThumbnailLoader:
+    """
+    Makes thumbnails on a thread pool. request() returns a cached image
+    right away or queues the photo; finished thumbnails are put on `results`
+    as (key, image or None) for the GUI thread to pick up. Photos that are
+    no longer wanted (see set_wanted) when a worker gets to them are dropped.
+    """
+
+    def __init__(self, disk_cache=None, memory_cache=None, workers=None, size=THUMBNAIL_SIZE):
+        self.disk_cache = disk_cache
+        self.memory_cache = memory_cache or MemoryCache()
+        self.size = size
+        self.results = queue.Queue()
+        self.lock = threading.Lock()
+        self.wanted = set()
+        self.pending = set()
+        self.executor = ThreadPoolExecutor(max_workers=workers or min(4, os.cpu_count() or 1),
+                                           thread_name_prefix="thumbnail")
+
+    def set_wanted(self, keys):
+        with self.lock:
+            self.wanted = set(keys)
+
+    def request(self, key):
+        """Returns the cached thumbnail of key (an image), or None after queueing it."""
+        image = self.memory_cache.get(key)
+        if image is not None:
+            return image
+        with self.lock:
+            self.wanted.add(key)
+            if key in self.pending:
+                return None
+            self.pending.add(key)
+        self.executor.submit(self._load, key)
+        return None
+
+    def _load(self, key):
+        from PIL import Image
+        with self.lock:
+            if key not in self.wanted:
+                self.pending.discard(key)
+                return
+        image = None
+        try:
+            data = self.disk_cache.get(key) if self.disk_cache else None
+            if data is None:
+                data = make_thumbnail(key[0], self.size)
+                if self.disk_cache:
+                    self.disk_cache.put(key, data)
+            image = Image.open(io.BytesIO(data))
+            image.load()
+            self.memory_cache.put(key, image)
+        except Exception as e:
+            log.debug("Could not make a thumbnail of %s: %s", key[0], e)
+        with self.lock:
+            self.pending.discard(key)
+        self.results.put((key, image))
+
+    def close(self):
+        with self.lock:
+            self.wanted.clear()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        if self.disk_cache:
+            self.disk_cache.close()
@@ -0,0 +1,256 @@
+"""
+Map tile provider with a persistent cache and offline MBTiles support.
+
+Tiles are looked up in this order:
+  1. any loaded MBTiles archives (pre-seeded, read-only),
+  2. a size-bounded LRU disk cache (SQLite),
+  3. the tile server, if online - fetched tiles are added to the cache.
+
+This module has no GUI dependencies, so the prefetch command also works
+headless:
+
+    python tile_cache.py prefetch --bbox 48.70 2.10 49.00 2.60 --zoom 5 14
+    python tile_cache.py prefetch --bbox 48.70 2.10 49.00 2.60 --zoom 5 14 --mbtiles paris.mbtiles
+
+Please respect the tile server's usage policy when prefetching (the OSM
+servers forbid bulk downloads of large areas).
+"""
+import argparse
+import glob
+import logging
+import math
+import os
+import sqlite3
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import sqlite_lru
+
+log = logging.getLogger(__name__)
+
+DEFAULT_TILE_SERVER = "https://a.tile.openstreetmap.org/{z}/{x}/{y}.png"
+DATA_DIR = os.path.join(os.path.expanduser("~"), ".photo-tagger")
+DEFAULT_CACHE_PATH = os.path.join(DATA_DIR, "tile_cache.sqlite")
+DEFAULT_CACHE_BYTES = 500 * 1024 * 1024
+USER_AGENT = "PhotoImporterApp/1.0"
+REQUEST_TIMEOUT = 10
+# After a network failure, don't try the server again for this many seconds.
+OFFLINE_BACKOFF = 30
+
+
+def tile_url(tile_server, zoom, x, y):
+    return tile_server.replace("{x}", str(x)).replace("{y}", str(y)).replace("{z}", str(zoom))
+
+
+def deg_to_tile(latitude, longitude, zoom):
+    """Converts a coordinate to (x, y) tile numbers (slippy map / XYZ scheme)."""
+    lat_rad = math.radians(max(min(latitude, 85.0511), -85.0511))
+    n = 2 ** zoom
+    x = int((longitude + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tiles_in_bbox(south, west, north, east, zoom_min, zoom_max):
+    """Yields (zoom, x, y) for every tile covering the bounding box."""
+    for zoom in range(zoom_min, zoom_max + 1):
+        x_min, y_min = deg_to_tile(north, west, zoom)
+        x_max, y_max = deg_to_tile(south, east, zoom)
+        for x in range(x_min, x_max + 1):
+            for y in range(y_min, y_max + 1):
+                yield zoom, x, y
+
+
+class TileDiskCache(sqlite_lru.SQLiteLRUCache):
+    """Size-bounded LRU tile cache in a single SQLite file. Thread-safe."""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_CACHE_BYTES):
+        super().__init__(path, "tiles", (("server", "TEXT"), ("zoom", "INTEGER"),
+                                         ("x", "INTEGER"), ("y", "INTEGER")), max_bytes)
+
+    def get(self, server, zoom, x, y):
+        return super().get((server, zoom, x, y))
+
+    def put(self, server, zoom, x, y, data):
+        super().put((server, zoom, x, y), data)
+
+
+class MBTilesArchive:
+    """Read/write access to an MBTiles file (tiles are stored with TMS row numbering)."""
+
+    def __init__(self, path, create=False):
+        if not create and not os.path.isfile(path):
+            raise FileNotFoundError(path)
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        if create:
+            self.conn.execute("CREATE TABLE IF NOT EXISTS metadata (name TEXT, value TEXT)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS tiles (zoom_level INTEGER, tile_column INTEGER, "
+                              "tile_row INTEGER, tile_data BLOB)")
+            self.conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS tile_index ON tiles "
+                              "(zoom_level, tile_column, tile_row)")
+            self.conn.commit()
+
+    @staticmethod
+    def _tms_row(zoom, y):
+        return (2 ** zoom) - 1 - y
+
+    def get(self, zoom, x, y):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT tile_data FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?",
+                (zoom, x, self._tms_row(zoom, y))).fetchone()
+        return row[0] if row else None
+
+    def put(self, zoom, x, y, data):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?)",
+                              (zoom, x, self._tms_row(zoom, y), sqlite3.Binary(data)))
+
+    def set_metadata(self, **values):
+        with self.lock:
+            for name, value in values.items():
+                self.conn.execute("DELETE FROM metadata WHERE name=?", (name,))
+                self.conn.execute("INSERT INTO metadata VALUES (?, ?)", (name, str(value)))
+
+    def commit(self):
+        with self.lock:
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.commit()
+            self.conn.close()
+
+
+class TileProvider:
+    """Serves tiles from MBTiles archives, the disk cache and (optionally) the network."""
+
+    def __init__(self, cache=None, offline=False):
+        self.cache = cache
+        self.offline = offline
+        self.archives = []
+        self._offline_until = 0
+
+    def add_archive(self, path):
+        archive = MBTilesArchive(path)
+        self.archives.append(archive)
+        return archive
+
+    def load_default_archives(self, directory=DATA_DIR):
+        """Loads every *.mbtiles file found in the data directory."""
+        for path in sorted(glob.glob(os.path.join(directory, "*.mbtiles"))):
+            try:
+                self.add_archive(path)
+                log.info("Loaded offline map archive: %s", path)
+            except Exception as e:
+                log.error("Could not open map archive %s: %s", path, e)
+
+    def get_tile(self, tile_server, zoom, x, y):
+        """Returns the encoded tile image, or None if it is not available."""
+        for archive in self.archives:
+            data = archive.get(zoom, x, y)
+            if data is not None:
+                return data
+
+        if self.cache:
+            data = self.cache.get(tile_server, zoom, x, y)
+            if data is not None:
+                return data
+
+        if self.offline or time.time() < self._offline_until:
+            return None
+        data = self.fetch(tile_server, zoom, x, y)
+        if data is not None and self.cache:
+            self.cache.put(tile_server, zoom, x, y, data)
+        return data
+
+    def fetch(self, tile_server, zoom, x, y):
+        request = urllib.request.Request(tile_url(tile_server, zoom, x, y), headers={"User-Agent": USER_AGENT})
+        try:
+            with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT) as response:
+                return response.read()
+        except urllib.error.HTTPError:
+            # Tile does not exist (or is refused); the server itself is reachable.
+            return None
+        except (urllib.error.URLError, OSError):
+            self._offline_until = time.time() + OFFLINE_BACKOFF
+            return None
+
+
+def prefetch(provider, tile_server, bbox, zoom_min, zoom_max, archive=None, workers=4, on_progress=None):
+    """
+    Downloads every tile of a bounding box (south, west, north, east) over a
+    zoom range into the provider's cache, or into `archive` (an MBTilesArchive)
+    if given. Returns (fetched, missing).
+    """
+    tiles = list(tiles_in_bbox(*bbox, zoom_min, zoom_max))
+    counts = {"done": 0, "missing": 0}
+    lock = threading.Lock()
+
+    def load(tile):
+        zoom, x, y = tile
+        data = provider.get_tile(tile_server, zoom, x, y)
+        if data is not None and archive is not None:
+            archive.put(zoom, x, y, data)
+        with lock:
+            counts["done"] += 1
+            if data is None:
+                counts["missing"] += 1
+            if on_progress:
+                on_progress(counts["done"], len(tiles))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(load, tiles))
+
+    if archive is not None:
+        south, west, north, east = bbox
+        archive.set_metadata(name=os.path.basename(archive.path), format="png",
+                             bounds=f"{west},{south},{east},{north}",
+                             minzoom=zoom_min, maxzoom=zoom_max)
+        archive.commit()
+    return counts["done"] - counts["missing"], counts["missing"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Map tile cache tools.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    pre = sub.add_parser("prefetch", help="Download the tiles of an area for offline use")
+    pre.add_argument("--bbox", nargs=4, type=float, required=True, metavar=("SOUTH", "WEST", "NORTH", "EAST"))
+    pre.add_argument("--zoom", nargs=2, type=int, required=True, metavar=("MIN", "MAX"))
+    pre.add_argument("--server", default=DEFAULT_TILE_SERVER, help="Tile server URL template")
+    pre.add_argument("--mbtiles", help="Write the tiles to this MBTiles file instead of the cache")
+    pre.add_argument("--cache", default=DEFAULT_CACHE_PATH, help="Tile cache file")
+    pre.add_argument("--cache-mb", type=int, default=DEFAULT_CACHE_BYTES // (1024 * 1024),
+                     help="Maximum cache size in MB")
+    pre.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args(argv)
+
+    south, west, north, east = args.bbox
+    total = sum(1 for _ in tiles_in_bbox(south, west, north, east, args.zoom[0], args.zoom[1]))
+    print(f"Prefetching {total} tiles...")
+
+    cache = TileDiskCache(args.cache, args.cache_mb * 1024 * 1024)
+    provider = TileProvider(cache)
+    archive = MBTilesArchive(args.mbtiles, create=True) if args.mbtiles else None
+
+    def on_progress(done, count):
+        if done % 100 == 0 or done == count:
+            print(f"  {done} / {count}")
+
+    fetched, missing = prefetch(provider, args.server, (south, west, north, east), args.zoom[0], args.zoom[1],
+                                archive=archive, workers=args.workers, on_progress=on_progress)
+    if archive:
+        archive.close()
+    cache.close()
+    print(f"Done: {fetched} tiles available, {missing} missing.")
+    return 0 if not missing else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+"""
+Post-write verification of tagged outputs.
+
+Every output is read back before it is committed to the album, and so
+before its source can be archived: its EXIF must carry the requested
+DateTimeOriginal and GPS position, and its image data must be intact. For
+a lossless splice, every byte outside the EXIF segment (the other headers
+and the whole scan data) is streamed and compared with the source, see
+jpeg_splice.same_payload; a re-encoded output is decoded instead, at 1/8
+scale for JPEG (an uncompressed TIFF's strips are only checked to be in the
+file). XMP sidecars are re-parsed and the original linked next to
+them is checked against the source's size.
+
+Runs as a pipeline worker task (see tagging.run_verify_task), so checking
+one photo overlaps with tagging the next. Pillow is only imported for
+outputs that were not spliced.
+"""
+import fractions
+import os
+import xml.etree.ElementTree as ET
+
+import piexif
+
+import exif_patch
+import jpeg_splice
+import scanner
+import xmp_sidecar
+
+# How an output was written (returned by the tagging worker tasks)
+SPLICED = "spliced"
+ENCODED = "encoded"
+PATCHED = "patched"
+SIDECAR = "sidecar"
+
+
+class VerifyError(ValueError):
+    """Raised when a written output does not match what was requested."""
+
+
+def _normalize(value):
+    """Rationals as Fractions and lists as tuples, so (30, 1) equals (300000, 10000)."""
+    if isinstance(value, (tuple, list)):
+        if len(value) == 2 and all(isinstance(v, int) for v in value) and value[1]:
+            return fractions.Fraction(*value)
+        return tuple(_normalize(v) for v in value)
+    return value
+
+
+def check_tags(raw_exif, exif_date, exif_gps_dict=None):
+    """Checks that raw EXIF (as piexif.load takes it) holds the date and GPS tags."""
+    if not raw_exif:
+        raise VerifyError("Output has no EXIF data.")
+    try:
+        exif_dict = piexif.load(raw_exif)
+    except Exception as e:
+        raise VerifyError(f"Output EXIF cannot be read: {e}")
+
+    date = exif_dict.get("Exif", {}).get(piexif.ExifIFD.DateTimeOriginal)
+    if date != exif_date:
+        raise VerifyError(f"DateTimeOriginal is {date!r}, expected {exif_date!r}.")
+    gps = exif_dict.get("GPS", {})
+    for tag, value in (exif_gps_dict or {}).items():
+        if _normalize(gps.get(tag)) != _normalize(value):
+            name = piexif.TAGS["GPS"][tag]["name"]
+            raise VerifyError(f"{name} is {gps.get(tag)!r}, expected {value!r}.")
+
+
+def check_spliced_tags(raw_exif, exif_date, exif_gps_dict=None):
+    """
+    check_tags for EXIF dumped by piexif (the splice path): the date and GPS
+    values are compared byte for byte where they are stored, without
+    parsing the rest of the block (e.g. large maker notes).
+    """
+    try:
+        if exif_patch.holds_tags(raw_exif, exif_date, exif_gps_dict):
+            return
+    except exif_patch.PatchError:
+        pass
+    # Missing or different: let check_tags say what is wrong.
+    check_tags(raw_exif, exif_date, exif_gps_dict)
+    raise VerifyError("Output EXIF does not hold the requested date/GPS bytes.")
+
+
+def _read_exif(path):
+    """The raw EXIF of a JPEG (header segments only) or of any format Pillow reads."""
+    if path.lower().endswith(scanner.JPEG_EXTENSIONS):
+        try:
+            return jpeg_splice.read_exif(path)
+        except jpeg_splice.SpliceError:
+            pass
+    from PIL import Image
+    with Image.open(path) as img:
+        return img.getexif().tobytes()
+
+
+def _check_raw_tiff(img, path):
+    """Raw strips can't fail to decode: a short write shows as strips past the end of the file."""
+    from PIL import TiffImagePlugin
+    tags = img.tag_v2
+    offsets = tags.get(TiffImagePlugin.STRIPOFFSETS) or tags.get(TiffImagePlugin.TILEOFFSETS)
+    counts = tags.get(TiffImagePlugin.STRIPBYTECOUNTS) or tags.get(TiffImagePlugin.TILEBYTECOUNTS)
+    if offsets is None or counts is None:
+        raise VerifyError("Output TIFF has no strip offsets.")
+    if isinstance(offsets, int):
+        offsets, counts = (offsets,), (counts,)
+    if max(offset + count for offset, count in zip(offsets, counts)) > os.path.getsize(path):
+        raise VerifyError("Output TIFF image data is truncated.")
+
+
+def _check_decodes(source_file, output_file, exif_date, exif_gps_dict):
+    """Tags of a re-encoded output, plus a cheap decode against the source's dimensions."""
+    from PIL import Image
+    with Image.open(source_file) as src:
+        expected_size = src.size
+    try:
+        with Image.open(output_file) as img:
+            raw_exif = img.getexif().tobytes()
+            if img.size != expected_size:
+                raise VerifyError(f"Output is {img.size[0]}x{img.size[1]}, "
+                                  f"expected {expected_size[0]}x{expected_size[1]}.")
+            if img.format == "TIFF" and img.info.get("compression") == "raw":
+                _check_raw_tiff(img, output_file)
+            else:
+                # JPEG only: the DCT is scaled down, so the whole scan is read but little is decoded.
+                img.draft(img.mode, (max(1, img.width // 8), max(1, img.height // 8)))
+                img.load()
+    except (OSError, SyntaxError) as e:
+        raise VerifyError(f"Output image data cannot be decoded: {e}")
+    check_tags(raw_exif, exif_date, exif_gps_dict)
+
+
+def verify_output(source_file, output_file, exif_date, exif_gps_dict, written):
+    """
+    Verifies a tagged output (usually still a temp file) written as `written`
+    (SPLICED, ENCODED or PATCHED). Raises VerifyError if it doesn't pass.
+    A patched file is its own source, so only its tags are checked.
+    """
+    if written == SPLICED:
+        try:
+            check_spliced_tags(jpeg_splice.read_exif(output_file), exif_date, exif_gps_dict)
+            same = jpeg_splice.same_payload(source_file, output_file)
+        except jpeg_splice.SpliceError as e:
+            raise VerifyError(f"Output is not a valid JPEG: {e}")
+        if not same:
+            raise VerifyError("Output image data differs from the source.")
+    elif written == PATCHED:
+        check_tags(_read_exif(output_file), exif_date, exif_gps_dict)
+    else:
+        _check_decodes(source_file, output_file, exif_date, exif_gps_dict)
+
+
+def verify_sidecar(source_file, image_file, sidecar_file, exif_date, exif_gps_dict):
+    """Verifies an XMP sidecar output and the original placed at image_file."""
+    if os.stat(image_file).st_size != os.stat(source_file).st_size:
+        raise VerifyError("Original in the album differs in size from the source.")
+    try:
+        root = ET.parse(sidecar_file).getroot()
+    except ET.ParseError as e:
+        raise VerifyError(f"Sidecar cannot be read: {e}")
+    found = {}
+    for description in root.iter(f"{{{xmp_sidecar.NS_RDF}}}Description"):
+        found.update(description.attrib)
+    for name, value in xmp_sidecar.xmp_properties(exif_date, exif_gps_dict).items():
+        if found.get(name) != value:
+            raise VerifyError(f"Sidecar {name.rpartition('}')[2]} is {found.get(name)!r}, expected {value!r}.")
@@ -0,0 +1,458 @@
+"""
+Watch-folder ingest: tags photos as they arrive in a drop folder.
+
+A scanning station writes into the drop folder; every photo is tagged with
+the album, date and GPS position of a profile and archived within seconds
+of being written, until the daemon is stopped (Ctrl+C or SIGTERM):
+
+    python watch.py /scans/drop --profile station.json --status-file /tmp/ingest.json
+
+The profile is a JSON object with the columns of a job manifest (see
+jobs.py) except the source:
+
+    {"albums_dir": "/photos/Albums", "album": "1985 - Family Vacation",
+     "date": "1985-07-14", "lat": 48.8566, "lon": 2.3522, "move_to": "/scans/done"}
+
+New files are noticed with inotify on Linux, otherwise (and with --poll) by
+listing the folder every few seconds; a full listing is also done now and
+then with inotify, which doesn't see files written by other machines to a
+network share. A photo is only taken once its size and mtime have stopped
+changing for --settle seconds, so half-written scans are never read.
+
+Memory stays bounded: settled photos wait in a short queue, and the
+pipeline is run with bounded queues between its stages, so when the album
+drive is slow the intake slows down and the backlog stays on disk.
+"""
+import argparse
+import ctypes
+import ctypes.util
+import json
+import logging
+import os
+import queue
+import select
+import signal
+import struct
+import sys
+import threading
+import time
+
+import file_ops
+import jobs
+import scanner
+import tagging
+
+log = logging.getLogger(__name__)
+
+# A photo must be unchanged for this long before it is tagged (s).
+DEFAULT_SETTLE = 2.0
+# How often the folder is listed: when polling, and as a safety net with inotify (s).
+DEFAULT_POLL_INTERVAL = 2.0
+DEFAULT_RESCAN_INTERVAL = 60.0
+# How often pending photos are re-checked and the watcher wakes up (s).
+TICK = 0.5
+DEFAULT_STATUS_EVERY = 5.0
+# Photos waiting between the stages: settled photos for the pipeline, and
+# within the pipeline (per worker).
+QUEUED_PER_WORKER = 4
+
+MODE_INOTIFY = "inotify"
+MODE_POLLING = "polling"
+
+
+class Inotify:
+    """Minimal inotify binding (Linux, via ctypes). Raises OSError where it isn't available."""
+
+    IN_MODIFY = 0x2
+    IN_ATTRIB = 0x4
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_DELETE_SELF = 0x400
+    IN_Q_OVERFLOW = 0x4000
+    IN_IGNORED = 0x8000
+    IN_ISDIR = 0x40000000
+    WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+                  | IN_CREATE | IN_DELETE | IN_DELETE_SELF)
+    _IN_NONBLOCK = 0o4000
+    _IN_CLOEXEC = 0o2000000
+    _EVENT = struct.Struct("iIII")
+
+    def __init__(self):
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is only available on Linux")
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self._libc.inotify_init1(self._IN_NONBLOCK | self._IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.directories = {}  # watch descriptor -> directory
+
+    def add_watch(self, directory):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), self.WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"Could not watch {directory}: {os.strerror(errno)}")
+        self.directories[wd] = directory
+
+    def read(self, timeout):
+        """Waits up to timeout seconds; returns [(directory, name, mask)] (directory None on overflow)."""
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset + self._EVENT.size <= len(data):
+            wd, mask, _, length = self._EVENT.unpack_from(data, offset)
+            offset += self._EVENT.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            if mask & self.IN_Q_OVERFLOW:
+                events.append((None, "", mask))
+            elif mask & self.IN_IGNORED:
+                self.directories.pop(wd, None)
+            elif wd in self.directories:
+                events.append((self.directories[wd], name, mask))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FolderWatcher:
+    """
+    Finds the photos arriving under root and puts them (as
+    scanner.ScannedFile) on `ready` once they have stopped changing. Photos
+    already handed out are remembered by path, size and mtime, only as long
+    as they are still in the folder, so a photo is tagged again if it is
+    replaced but not just because it is still there.
+    """
+
+    def __init__(self, root, ready, recursive=True, exclude_dirs=(), settle=DEFAULT_SETTLE,
+                 use_inotify=True, poll_interval=DEFAULT_POLL_INTERVAL, rescan_interval=DEFAULT_RESCAN_INTERVAL):
+        self.root = os.path.abspath(root)
+        self.ready = ready
+        self.recursive = recursive
+        self.exclude_dirs = tuple(d for d in exclude_dirs if d)
+        self._excluded = {os.path.normcase(os.path.abspath(d)) for d in self.exclude_dirs}
+        self.settle = settle
+        self.poll_interval = poll_interval
+        self.rescan_interval = rescan_interval
+        self.pending = {}  # path -> [rel_path, size, mtime_ns, unchanged since (monotonic)]
+        self.handed_out = {}  # path -> (size, mtime_ns)
+        self.inotify = None
+        if use_inotify:
+            try:
+                self.inotify = Inotify()
+                self._watch_tree(self.root)
+            except OSError as e:
+                log.warning("Watching %s by polling (%s).", self.root, e)
+                if self.inotify:
+                    self.inotify.close()
+                self.inotify = None
+
+    @property
+    def mode(self):
+        return MODE_INOTIFY if self.inotify else MODE_POLLING
+
+    def _watch_tree(self, directory):
+        self.inotify.add_watch(directory)
+        if not self.recursive:
+            return
+        for dirpath, dirnames, _ in os.walk(directory):
+            dirnames[:] = [d for d in dirnames if not d.startswith(".")
+                           and os.path.normcase(os.path.abspath(os.path.join(dirpath, d))) not in self._excluded]
+            for name in dirnames:
+                self.inotify.add_watch(os.path.join(dirpath, name))
+
+    def run(self, stop_event):
+        """Watches until stop_event is set."""
+        next_rescan = 0.0
+        interval = self.rescan_interval if self.inotify else self.poll_interval
+        try:
+            while not stop_event.is_set():
+                if time.monotonic() >= next_rescan:
+                    self._rescan(self.root, prune=True)
+                    next_rescan = time.monotonic() + interval
+                if self.inotify:
+                    for directory, name, mask in self.inotify.read(TICK):
+                        if directory is None:
+                            log.warning("Missed file events (inotify queue overflow), listing the folder again.")
+                            next_rescan = 0.0
+                        else:
+                            self._on_event(os.path.join(directory, name), mask)
+                else:
+                    stop_event.wait(TICK)
+                self._check_pending()
+        finally:
+            if self.inotify:
+                self.inotify.close()
+
+    def _on_event(self, path, mask):
+        if mask & (Inotify.IN_DELETE | Inotify.IN_MOVED_FROM | Inotify.IN_DELETE_SELF):
+            self.pending.pop(path, None)
+            self.handed_out.pop(path, None)
+        elif mask & Inotify.IN_ISDIR:
+            if (self.recursive and mask & (Inotify.IN_CREATE | Inotify.IN_MOVED_TO)
+                    and not os.path.basename(path).startswith(".")
+                    and os.path.normcase(os.path.abspath(path)) not in self._excluded):
+                # Files may have landed in it before the watch was added.
+                try:
+                    self._watch_tree(path)
+                except OSError as e:
+                    log.error("%s", e)
+                self._rescan(path)
+        elif path.lower().endswith(scanner.SCAN_EXTENSIONS):
+            try:
+                st = os.stat(path)
+            except OSError:
+                return
+            self._track(os.path.relpath(path, self.root), path, st.st_size, st.st_mtime_ns)
+
+    def _rescan(self, directory, prune=False):
+        rel_dir = os.path.relpath(directory, self.root)
+        seen = set()
+        for item in scanner.scan_images(directory, recursive=self.recursive, exclude_dirs=self.exclude_dirs):
+            rel_path = item.rel_path if rel_dir == "." else os.path.join(rel_dir, item.rel_path)
+            seen.add(item.path)
+            self._track(rel_path, item.path, item.size, item.mtime_ns)
+        if prune:
+            # Photos that left the folder (archived or deleted): no need to remember them.
+            for path in [p for p in self.handed_out if p not in seen]:
+                del self.handed_out[path]
+            for path in [p for p in self.pending if p not in seen]:
+                del self.pending[path]
+
+    def _track(self, rel_path, path, size, mtime_ns):
+        if self.handed_out.get(path) == (size, mtime_ns):
+            return
+        entry = self.pending.get(path)
+        if entry is None:
+            self.pending[path] = [rel_path, size, mtime_ns, time.monotonic()]
+        elif (entry[1], entry[2]) != (size, mtime_ns):
+            entry[1:] = [size, mtime_ns, time.monotonic()]
+
+    def _check_pending(self):
+        now = time.monotonic()
+        for path, entry in list(self.pending.items()):
+            rel_path, size, mtime_ns, since = entry
+            try:
+                st = os.stat(path)
+            except OSError:
+                del self.pending[path]
+                continue
+            if (st.st_size, st.st_mtime_ns) != (size, mtime_ns):
+                entry[1:] = [st.st_size, st.st_mtime_ns, now]
+                continue
+            # Seen unchanged for settle seconds. Not judged by the mtime: a copy
+            # that keeps it (cp -p, rsync) can still be being written.
+            if now - since < self.settle:
+                continue
+            try:
+                self.ready.put_nowait(scanner.ScannedFile(rel_path, path, size, mtime_ns))
+            except queue.Full:
+                # The pipeline is behind: leave the rest on disk for now.
+                return
+            del self.pending[path]
+            self.handed_out[path] = (size, mtime_ns)
+
+
+class WatchService:
+    """
+    Runs one TaggingPipeline for as long as the folder is watched, fed with
+    the photos the FolderWatcher hands out. status() reports the queue
+    depths and throughput; it is written to status_path as JSON every
+    status_every seconds.
+    """
+
+    def __init__(self, job, workers=None, pool_kind=tagging.POOL_THREADS, resume=True, recursive=True,
+                 output_mode=tagging.OUTPUT_REWRITE, link_mode=file_ops.LINK_AUTO, duplicate_root=None,
+                 settle=DEFAULT_SETTLE, use_inotify=True, poll_interval=DEFAULT_POLL_INTERVAL,
+                 status_path=None, status_every=DEFAULT_STATUS_EVERY):
+        self.job = job
+        self.workers = max(1, workers or tagging.default_worker_count())
+        self.status_path = status_path
+        self.status_every = status_every
+        self.stop_event = threading.Event()
+        self.ready = queue.Queue(maxsize=self.workers * QUEUED_PER_WORKER)
+        self.watcher = FolderWatcher(job.source, self.ready, recursive=recursive,
+                                     exclude_dirs=(job.dest_dir, job.move_dest if job.move_enabled else None),
+                                     settle=settle, use_inotify=use_inotify, poll_interval=poll_interval)
+        self.pipeline = tagging.TaggingPipeline(workers=self.workers, pool_kind=pool_kind, resume=resume,
+                                                output_mode=output_mode, link_mode=link_mode,
+                                                duplicate_root=duplicate_root,
+                                                max_queued=self.workers * QUEUED_PER_WORKER)
+        self.progress = jobs.JobProgress(job)
+        self.accepted = 0
+        self.last_file = None
+        self.last_error = None
+        self.started = None
+
+    def stop(self):
+        """Stops watching; photos already taken in are finished first."""
+        self.stop_event.set()
+
+    def _incoming(self):
+        while not self.stop_event.is_set():
+            try:
+                item = self.ready.get(timeout=TICK)
+            except queue.Empty:
+                continue
+            self.accepted += 1
+            yield item
+
+    def status(self):
+        progress = self.progress
+        rate = progress.meter.rate()
+        return {
+            "state": "stopping" if self.stop_event.is_set() else "watching",
+            "watch_dir": self.job.source,
+            "album": self.job.dest_dir,
+            "mode": self.watcher.mode,
+            "settling": len(self.watcher.pending),
+            "queued": self.ready.qsize(),
+            "in_pipeline": self.accepted - progress.done,
+            "processed": progress.processed,
+            "skipped": progress.skipped,
+            "duplicates": progress.duplicates,
+            "errors": len(progress.errors),
+            "moved": progress.moved,
+            "photos_per_minute": round(rate * 60, 1) if rate else 0.0,
+            "uptime_seconds": round(time.monotonic() - self.started, 1) if self.started else 0.0,
+            "last_file": self.last_file,
+            "last_error": self.last_error,
+            "updated": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        }
+
+    def write_status(self, state=None):
+        if not self.status_path:
+            return
+        status = self.status()
+        if state:
+            status["state"] = state
+        temp_path = f"{self.status_path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(status, f, indent=2)
+            os.replace(temp_path, self.status_path)
+        except OSError as e:
+            log.warning("Could not write status file %s: %s", self.status_path, e)
+
+    def run(self):
+        """Watches and tags until stop() is called. Returns the final status."""
+        job = self.job
+        self.started = time.monotonic()
+        exif_gps_dict = tagging.convert_gps_to_exif(*job.gps_data) if job.gps_data else {}
+        watcher_thread = threading.Thread(target=self.watcher.run, args=(self.stop_event,), daemon=True)
+        watcher_thread.start()
+        self.pipeline.start(job.source, job.dest_dir, self._incoming(), job.exif_date, exif_gps_dict,
+                            job.move_enabled, job.move_dest)
+        log.info("Watching %s (%s) -> %s", job.source, self.watcher.mode, job.dest_dir)
+        self.write_status()
+        next_status = time.monotonic() + self.status_every
+        while True:
+            try:
+                event = self.pipeline.events.get(timeout=TICK)
+            except queue.Empty:
+                # Idle: the rate drops over the rate window
+                self.progress.meter.update(self.progress.done)
+                event = None
+            if time.monotonic() >= next_status:
+                self.write_status()
+                next_status = time.monotonic() + self.status_every
+            if event is None:
+                continue
+            self.progress.apply(event)
+            kind = event[0]
+            if kind == "tagged":
+                self.last_file = event[1]
+                if event[2] is None:
+                    log.info("Tagged %s", event[1])
+                else:
+                    self.last_error = f"{event[1]}: {event[2]}"
+            elif kind == "skipped":
+                log.info("Already tagged: %s", event[1])
+            elif kind == "duplicate":
+                log.info("Duplicate of %s: %s", event[2], event[1])
+            elif kind == "moved" and event[2] is not None:
+                self.last_error = f"{event[1]}: {event[2]}"
+            elif kind == "finished":
+                break
+        watcher_thread.join()
+        self.write_status(state="stopped")
+        return self.status()
+
+
+def load_profile(path, source):
+    """
+    The ImportJob of a profile (a JSON object with the manifest columns)
+    for the watched folder, and the profile's albums_dir.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            profile = json.load(f)
+    except (OSError, ValueError) as e:
+        raise tagging.ValidationError("Invalid Profile", f"Could not read {path}: {e}")
+    if not isinstance(profile, dict):
+        raise tagging.ValidationError("Invalid Profile", f"{path}: expected a JSON object.")
+    if not str(profile.get("albums_dir") or "").strip():
+        raise tagging.ValidationError("Invalid Profile", f"{path}: albums_dir is missing.")
+    base = os.path.dirname(os.path.abspath(path))
+    job = jobs.job_from_row(dict(profile, source=os.path.abspath(source)), base)
+    return job, os.path.join(base, os.path.expanduser(str(profile["albums_dir"]).strip()))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tag photos as they arrive in a drop folder.")
+    parser.add_argument("watch_dir", help="Drop folder the scanner writes into")
+    parser.add_argument("--profile", required=True, metavar="FILE",
+                        help="JSON object with albums_dir, album, date and optionally lat, lon, move_to")
+    parser.add_argument("--status-file", metavar="FILE",
+                        help="Keep this JSON file up to date with queue depths and throughput")
+    parser.add_argument("--status-every", type=float, default=DEFAULT_STATUS_EVERY, metavar="SECONDS")
+    parser.add_argument("--settle", type=float, default=DEFAULT_SETTLE, metavar="SECONDS",
+                        help="Only take photos unchanged for this long (default: %(default)s)")
+    parser.add_argument("--poll", action="store_true", help="List the folder regularly instead of using inotify")
+    parser.add_argument("--poll-interval", type=float, default=DEFAULT_POLL_INTERVAL, metavar="SECONDS")
+    parser.add_argument("--workers", type=int, default=tagging.default_worker_count(),
+                        help="Photos tagged in parallel (default: number of CPUs)")
+    parser.add_argument("--processes", action="store_true", help="Use a process pool instead of a thread pool")
+    parser.add_argument("--no-recursive", action="store_true", help="Ignore photos in sub-folders")
+    parser.add_argument("--no-resume", action="store_true", help="Retag photos already in the album journal")
+    parser.add_argument("--sidecar", action="store_true", help="Write .xmp sidecars instead of rewriting photos")
+    parser.add_argument("--link", choices=file_ops.LINK_MODES, default=file_ops.LINK_AUTO,
+                        help="With --sidecar, how originals are put into the album")
+    parser.add_argument("--skip-duplicates", action="store_true",
+                        help="Don't import photos already in one of the albums")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Don't log every photo")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING if args.quiet else logging.INFO,
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    if not os.path.isdir(args.watch_dir):
+        parser.error(f"{args.watch_dir} is not a directory")
+    try:
+        job, albums_dir = load_profile(args.profile, args.watch_dir)
+    except tagging.ValidationError as e:
+        parser.error(str(e))
+    service = WatchService(job, workers=args.workers,
+                           pool_kind=tagging.POOL_PROCESSES if args.processes else tagging.POOL_THREADS,
+                           resume=not args.no_resume, recursive=not args.no_recursive,
+                           output_mode=tagging.OUTPUT_SIDECAR if args.sidecar else tagging.OUTPUT_REWRITE,
+                           link_mode=args.link, duplicate_root=albums_dir if args.skip_duplicates else None,
+                           settle=args.settle, use_inotify=not args.poll, poll_interval=args.poll_interval,
+                           status_path=args.status_file, status_every=args.status_every)
+    signal.signal(signal.SIGINT, lambda *_: service.stop())
+    signal.signal(signal.SIGTERM, lambda *_: service.stop())
+    status = service.run()
+    print(f"Stopped: {status['processed']} tagged, {status['skipped']} skipped, "
+          f"{status['duplicates']} duplicates, {status['errors']} errors, {status['moved']} moved")
+    return 1 if status["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+"""
+XMP sidecars for tagging without rewriting the photo.
+
+Writes the date and GPS position as XMP into `<photo>.xmp` next to the photo
+(the naming digiKam uses by default), so the image itself is never
+re-encoded or copied byte by byte. An existing sidecar (e.g. with digiKam
+tags or ratings) is kept: only the date and GPS properties are replaced.
+"""
+import io
+import xml.etree.ElementTree as ET
+
+import piexif
+
+SIDECAR_SUFFIX = ".xmp"
+
+NS_X = "adobe:ns:meta/"
+NS_RDF = "http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+NS_EXIF = "http://ns.adobe.com/exif/1.0/"
+NS_XMP = "http://ns.adobe.com/xap/1.0/"
+NS_PHOTOSHOP = "http://ns.adobe.com/photoshop/1.0/"
+_PREFIXES = {"x": NS_X, "rdf": NS_RDF, "exif": NS_EXIF, "xmp": NS_XMP, "photoshop": NS_PHOTOSHOP}
+
+# Properties this tool owns: replaced on every write, everything else is kept.
+DATE_PROPERTIES = (f"{{{NS_EXIF}}}DateTimeOriginal", f"{{{NS_XMP}}}CreateDate", f"{{{NS_PHOTOSHOP}}}DateCreated")
+GPS_PROPERTIES = (f"{{{NS_EXIF}}}GPSVersionID", f"{{{NS_EXIF}}}GPSLatitude", f"{{{NS_EXIF}}}GPSLongitude")
+
+_XPACKET_BEGIN = '<?xpacket begin="\ufeff" id="W5M0MpCehiHzreSzNTczkc9d"?>\n'
+_XPACKET_END = '\n<?xpacket end="w"?>\n'
+
+
+class SidecarError(ValueError):
+    """Raised when an existing sidecar cannot be read."""
+
+
+def sidecar_path(image_path):
+    """The sidecar of an image: 'photo.jpg' -> 'photo.jpg.xmp'."""
+    return image_path + SIDECAR_SUFFIX
+
+
+def image_path(sidecar_file):
+    """The image of a sidecar: 'photo.jpg.xmp' -> 'photo.jpg'. Other paths are returned as they are."""
+    return sidecar_file[:-len(SIDECAR_SUFFIX)] if sidecar_file.endswith(SIDECAR_SUFFIX) else sidecar_file
+
+
+def _xmp_date(exif_date):
+    """b'1985:07:14 00:00:00' -> '1985-07-14T00:00:00'"""
+    text = exif_date.decode("ascii") if isinstance(exif_date, bytes) else exif_date
+    date, _, time = text.partition(" ")
+    return f"{date.replace(':', '-')}T{time or '00:00:00'}"
+
+
+def _xmp_coordinate(rationals, ref):
+    """EXIF degrees/minutes/seconds rationals + ref -> XMP 'DDD,MM.mmmmmmK'."""
+    (deg_num, deg_den), (min_num, min_den), (sec_num, sec_den) = rationals
+    minutes = min_num / min_den + sec_num / sec_den / 60
+    ref = ref.decode("ascii") if isinstance(ref, bytes) else ref
+    return f"{deg_num // deg_den},{minutes:.6f}{ref}"
+
+
+def xmp_properties(exif_date, exif_gps_dict=None):
+    """
+    The XMP properties for a date (EXIF bytes) and a GPS dict as built by
+    tagging.convert_gps_to_exif, keyed by '{namespace}name'.
+    """
+    date = _xmp_date(exif_date)
+    properties = {name: date for name in DATE_PROPERTIES}
+    if exif_gps_dict:
+        gps = piexif.GPSIFD
+        version = exif_gps_dict.get(gps.GPSVersionID, (2, 0, 0, 0))
+        properties.update({
+            GPS_PROPERTIES[0]: ".".join(str(v) for v in version),
+            GPS_PROPERTIES[1]: _xmp_coordinate(exif_gps_dict[gps.GPSLatitude], exif_gps_dict[gps.GPSLatitudeRef]),
+            GPS_PROPERTIES[2]: _xmp_coordinate(exif_gps_dict[gps.GPSLongitude], exif_gps_dict[gps.GPSLongitudeRef]),
+        })
+    return properties
+
+
+def _register_prefixes(existing=None):
+    """Registers our prefixes, and those of an existing sidecar so they are kept when it is written back."""
+    prefixes = dict(_PREFIXES)
+    if existing:
+        try:
+            for _, (prefix, uri) in ET.iterparse(io.BytesIO(existing), events=("start-ns",)):
+                if prefix and prefix not in prefixes:
+                    prefixes[prefix] = uri
+        except ET.ParseError as e:
+            raise SidecarError(f"Invalid XMP sidecar: {e}")
+    for prefix, uri in prefixes.items():
+        try:
+            ET.register_namespace(prefix, uri)
+        except ValueError:
+            pass
+
+
+def render(properties, existing=None):
+    """
+    Returns the sidecar bytes. With `existing` (the bytes of the current
+    sidecar), its content is kept and only our properties are replaced.
+    Like the EXIF path, a GPS position already in the sidecar is only
+    replaced when properties has one.
+    """
+    replaced = set(DATE_PROPERTIES)
+    if GPS_PROPERTIES[1] in properties:
+        replaced.update(GPS_PROPERTIES)
+    _register_prefixes(existing)
+    if existing:
+        try:
+            root = ET.fromstring(existing)
+        except ET.ParseError as e:
+            raise SidecarError(f"Invalid XMP sidecar: {e}")
+    else:
+        root = ET.Element(f"{{{NS_X}}}xmpmeta")
+
+    rdf = root if root.tag == f"{{{NS_RDF}}}RDF" else root.find(f"{{{NS_RDF}}}RDF")
+    if rdf is None:
+        rdf = ET.SubElement(root, f"{{{NS_RDF}}}RDF")
+    descriptions = rdf.findall(f"{{{NS_RDF}}}Description")
+    for description in descriptions:
+        for name in replaced:
+            description.attrib.pop(name, None)
+        for child in list(description):
+            if child.tag in replaced:
+                description.remove(child)
+    if descriptions:
+        description = descriptions[0]
+    else:
+        description = ET.SubElement(rdf, f"{{{NS_RDF}}}Description", {f"{{{NS_RDF}}}about": ""})
+    description.attrib.update(properties)
+
+    return (_XPACKET_BEGIN + ET.tostring(root, encoding="unicode") + _XPACKET_END).encode("utf-8")
+
+
+def write_sidecar(path, exif_date, exif_gps_dict=None, existing_path=None):
+    """
+    Writes the sidecar for the date/GPS to path, merging in the sidecar at
+    existing_path if there is one (path may be a temp file for existing_path).
+    """
+    existing = None
+    if existing_path:
+        try:
+            with open(existing_path, "rb") as f:
+                existing = f.read()
+        except FileNotFoundError:
+            pass
+    data = render(xmp_properties(exif_date, exif_gps_dict), existing)
+    with open(path, "wb") as f:
+        f.write(data)